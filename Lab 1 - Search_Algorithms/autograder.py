@@ -28,10 +28,16 @@ def raise_exception_in_thread(thread: threading.Thread, exception: Exception):
     tid = thread.ident
     ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(tid), ctypes.py_object(exception))
 
-def run_test(fn: Callable, input_args: Arguments, cmp: Callable, cmp_args: Arguments, timeout: 10) -> Union[Result, None]:
+def run_test(fn: Callable, input_args: Arguments, cmp: Callable, cmp_args: Arguments, timeout: 10, stats: Any = None) -> Union[Result, None]:
     def _call(queue: Queue):
         try:
-            output = fn(*input_args.args, **input_args.kwargs)
+            if stats is None:
+                output = fn(*input_args.args, **input_args.kwargs)
+            else:
+                # Collect the search statistics (see search_stats.py) inside the test thread
+                from search_stats import collect_stats
+                with collect_stats(stats):
+                    output = fn(*input_args.args, **input_args.kwargs)
             result = cmp(output, *cmp_args.args, **cmp_args.kwargs)
         except NotImplementedError as err:
             result = None
@@ -90,7 +96,8 @@ class Problem:
         self.grade = 0
         self.maximum_grade = 0
     
-    def run(self, is_debug: bool = False, pattern: str = "*", time_scale: float = 1):
+    # If stats_records is a list, the search statistics of every test case are printed and appended to it
+    def run(self, is_debug: bool = False, pattern: str = "*", time_scale: float = 1, stats_records: Union[List[Dict[str, Any]], None] = None):
         print(f"Problem: {self.name}")
         test_cases = get_test_cases(os.path.join(root, self.testcases_path), pattern)
         self.grade = 0
@@ -116,10 +123,17 @@ class Problem:
             weight = test_case.get("weight", 1)
             maximum_grade = self.weight * weight * test_case.get("maximum_grade", 1)
             self.maximum_grade += maximum_grade
-            result = run_test(fn, fn_args, cmp, cmp_args, (None if is_debug else timeout * time_scale))
+            stats = None
+            if stats_records is not None:
+                from search_stats import SearchStats
+                stats = SearchStats()
+            result = run_test(fn, fn_args, cmp, cmp_args, (None if is_debug else timeout * time_scale), stats)
             if result is None:
                 print("Function is not implemented yet")
                 continue
+            if stats is not None:
+                print(stats)
+                stats_records.append({"problem": self.name, "test": description, "success": result.success, **stats.to_dict()})
             grade = self.weight * weight * result.grade
             if result.success:
                 print(f"Result: PASS {grade}/{maximum_grade}", end="")
@@ -173,12 +187,16 @@ def main(args: argparse.Namespace):
             pass
     else:
         problems = [(problem, "*") for index, problem in enumerate(problems)]
+    stats_records = [] if args.stats or args.stats_json else None
     for problem, pattern in problems:
-        problem.run(args.debug, pattern, time_scale)
+        problem.run(args.debug, pattern, time_scale, stats_records)
         print()
         total_grade += problem.grade
         maximum_grade += problem.maximum_grade
     print(f"Problem Set Total {total_grade}/{maximum_grade}\n")
+    if args.stats_json:
+        with open(args.stats_json, "w") as f:
+            json.dump(stats_records, f, indent=2)
     exit(total_grade)
 
 if __name__ == "__main__":
@@ -187,5 +205,7 @@ if __name__ == "__main__":
     parser.add_argument("--debug", "-d", action="store_true", help="Disables timeout to enable debugging via the autograder")
     parser.add_argument("--timescale", "-t", type=str, default="default", help="A scaling factor for the timeout")
     parser.add_argument("--solution", "-s", default="")
+    parser.add_argument("--stats", action="store_true", help="Print the search statistics of every test case")
+    parser.add_argument("--stats-json", default=None, help="Write the search statistics of every test case to this JSON file")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
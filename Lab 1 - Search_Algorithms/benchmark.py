@@ -0,0 +1,415 @@
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import argparse, datetime, glob, json, math, multiprocessing, os, platform, random, subprocess, traceback
+
+from helpers.utils import load_function
+from portfolio import SearchConfiguration, run_configuration
+from search_stats import collect_stats
+
+# This file contains the benchmark suite of the search functions
+# Every search configuration (a search function and its heuristic, see portfolio.py) runs on every instance of its suite:
+#   levels: the sokoban levels in levels/
+#   parks: the parking problems in parks/
+#   graphs: the routing problems in graphs/
+#   generated: larger instances generated from a fixed seed (written to benchmarks/generated/ the first time)
+# Each run records the wall time, the expansions, the nodes per second and the peak resident memory.
+# The results are appended to a JSON history file and compared against a stored baseline to flag the regressions:
+#
+#   python benchmark.py --save-baseline         (on the reference version)
+#   python benchmark.py                         (after a change; exits with 1 if a case regressed)
+
+# The default locations of the benchmark files (relative to the current directory)
+BenchmarkDirectory = "benchmarks"
+GeneratedDirectory = os.path.join(BenchmarkDirectory, "generated")
+DefaultHistory = os.path.join(BenchmarkDirectory, "history.json")
+DefaultBaseline = os.path.join(BenchmarkDirectory, "baseline.json")
+
+# A slowdown (or a memory increase) is only flagged if it is above the tolerance and above these absolute amounts,
+# since the runs that take a few milliseconds (or a few megabytes) are dominated by noise
+MinimumSlowdown = 0.05
+MinimumMemoryIncrease = 8 * 2**20
+
+SokobanSearches = [
+    SearchConfiguration("bfs", "search.BreadthFirstSearch"),
+    SearchConfiguration("ucs", "search.UniformCostSearch"),
+    SearchConfiguration("astar-weak", "search.AStarSearch", "sokoban_heuristic.weak_heuristic"),
+    SearchConfiguration("astar-strong", "search.AStarSearch", "sokoban_heuristic.strong_heuristic"),
+    SearchConfiguration("astar-pdb", "search.AStarSearch", "sokoban_heuristic.pattern_database_heuristic"),
+    SearchConfiguration("gbfs-strong", "search.BestFirstSearch", "sokoban_heuristic.strong_heuristic"),
+    SearchConfiguration("wastar-strong", "search.WeightedAStarSearch", "sokoban_heuristic.strong_heuristic", {"weight": 2.0}),
+    SearchConfiguration("idastar-strong", "search.IterativeDeepeningAStar", "sokoban_heuristic.strong_heuristic"),
+]
+
+ParkingSearches = [
+    SearchConfiguration("bfs", "search.BreadthFirstSearch"),
+    SearchConfiguration("ucs", "search.UniformCostSearch"),
+    SearchConfiguration("astar-cars", "search.AStarSearch", "parking_heuristic.parking_heuristic"),
+    SearchConfiguration("independence", "parking_search.IndependenceDetectionSearch"),
+]
+
+GraphSearches = [
+    SearchConfiguration("bfs", "search.BreadthFirstSearch"),
+    SearchConfiguration("dfs", "search.DepthFirstSearch"),
+    SearchConfiguration("ucs", "search.UniformCostSearch"),
+    SearchConfiguration("astar-euclidean", "search.AStarSearch", "graph.graphrouting_heuristic"),
+    SearchConfiguration("gbfs-euclidean", "search.BestFirstSearch", "graph.graphrouting_heuristic"),
+    SearchConfiguration("bibfs", "search.BidirectionalBreadthFirstSearch"),
+    SearchConfiguration("biucs", "search.BidirectionalUniformCostSearch"),
+    SearchConfiguration("biastar-euclidean", "search.BidirectionalAStarSearch", "graph.graphrouting_heuristic"),
+]
+
+CompiledGraphSearches = [
+    SearchConfiguration("compiled-astar-euclidean", "search.AStarSearch", "graph.compiled_graphrouting_heuristic"),
+    SearchConfiguration("compiled-astar-landmarks", "search.AStarSearch", "graph_landmarks.landmark_heuristic"),
+]
+
+# A group of benchmark instances: the files that match the pattern are loaded with the "from_file" method of the problem
+# class (given by its name, e.g. "sokoban.SokobanProblem") and solved by each search configuration
+@dataclass
+class BenchmarkGroup:
+    pattern: str
+    problem: str
+    searches: List[SearchConfiguration]
+
+Suites: Dict[str, List[BenchmarkGroup]] = {
+    "levels": [BenchmarkGroup("levels/*.txt", "sokoban.SokobanProblem", SokobanSearches)],
+    "parks": [BenchmarkGroup("parks/*.txt", "parking.ParkingProblem", ParkingSearches)],
+    "graphs": [
+        BenchmarkGroup("graphs/*.json", "graph.GraphRoutingProblem", GraphSearches),
+        BenchmarkGroup("graphs/*.json", "graph.CompiledGraphRoutingProblem", CompiledGraphSearches),
+    ],
+    # The uninformed searches are left out of the generated instances since they cannot solve them in a reasonable time.
+    # The crowded parks are only solved by independence detection (the joint search of 8 cars does not finish).
+    "generated": [
+        BenchmarkGroup(os.path.join(GeneratedDirectory, "level*.txt"), "sokoban.SokobanProblem",
+                       [search for search in SokobanSearches if search.heuristic is not None]),
+        BenchmarkGroup(os.path.join(GeneratedDirectory, "park*.txt"), "parking.ParkingProblem", ParkingSearches[2:]),
+        BenchmarkGroup(os.path.join(GeneratedDirectory, "crowded*.txt"), "parking.ParkingProblem", ParkingSearches[3:]),
+        BenchmarkGroup(os.path.join(GeneratedDirectory, "graph*.json"), "graph.GraphRoutingProblem",
+                       [search for search in GraphSearches if search.name != "dfs"]),
+        BenchmarkGroup(os.path.join(GeneratedDirectory, "graph*.json"), "graph.CompiledGraphRoutingProblem", CompiledGraphSearches),
+    ],
+}
+
+# A single benchmark case: one search configuration on one instance
+@dataclass
+class BenchmarkCase:
+    suite: str
+    path: str
+    problem: str
+    search: SearchConfiguration
+
+    # The name identifies the case in the history and the baseline (e.g. "levels/level1/astar-strong")
+    @property
+    def name(self) -> str:
+        instance = os.path.splitext(os.path.basename(self.path))[0]
+        return f"{self.suite}/{instance}/{self.search.name}"
+
+
+## Generated instances ##
+
+# Generates a grid graph: the nodes are the cells of a size x size grid (slightly shifted at random),
+# every cell is linked to its right and bottom neighbors in both directions, and some links are removed at random
+def generate_graph(size: int, seed: int, keep: float = 0.8) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    name = lambda x, y: f"n{y}_{x}"
+    graph = {
+        name(x, y): {"position": [x + rng.uniform(-0.3, 0.3), y + rng.uniform(-0.3, 0.3)], "adjacent": []}
+        for y in range(size) for x in range(size)
+    }
+    for y in range(size):
+        for x in range(size):
+            for nx, ny in ((x + 1, y), (x, y + 1)):
+                if nx < size and ny < size and rng.random() < keep:
+                    graph[name(x, y)]["adjacent"].append(name(nx, ny))
+                    graph[name(nx, ny)]["adjacent"].append(name(x, y))
+    return {"graph": graph, "start": name(0, 0), "goal": name(size - 1, size - 1)}
+
+# Generates a parking problem: a width x height lot with a few pillars, the cars on random cells of the left half
+# and their slots on random cells of the right half. A solution is not guaranteed (the pillars may wall in a car).
+def generate_park(width: int, height: int, cars: int, seed: int, pillars: float = 0.1) -> str:
+    rng = random.Random(seed)
+    grid = [["." for _ in range(width)] for _ in range(height)]
+    cells = [(x, y) for y in range(height) for x in range(width)]
+    rng.shuffle(cells)
+    left = [cell for cell in cells if cell[0] < width // 2]
+    right = [cell for cell in cells if cell[0] >= width // 2]
+    for car_index in range(cars):
+        x, y = left.pop()
+        grid[y][x] = chr(ord('A') + car_index)
+        x, y = right.pop()
+        grid[y][x] = str(car_index)
+    for x, y in left + right:
+        # Keep the middle column free so that the two halves stay connected
+        if x != width // 2 and rng.random() < pillars:
+            grid[y][x] = "#"
+    lines = ["#" * (width + 2)] + ["#" + "".join(row) + "#" for row in grid] + ["#" * (width + 2)]
+    return "\n".join(lines)
+
+# Generates a sokoban level that is solvable by construction: the crates start on the goals,
+# then the player walks backwards (pulling the crate behind it if there is one) for the given number of steps.
+# Reversing these steps pushes every crate back on its goal.
+def generate_level(width: int, height: int, crates: int, steps: int, seed: int, walls: float = 0.1) -> str:
+    rng = random.Random(seed)
+    floor = {(x, y) for y in range(1, height - 1) for x in range(1, width - 1)}
+    for cell in sorted(floor):
+        if rng.random() < walls:
+            floor.discard(cell)
+    cells = sorted(floor)
+    rng.shuffle(cells)
+    goals = set(cells[:crates])
+    boxes = set(goals)
+    player = cells[crates]
+    directions = ((1, 0), (0, -1), (-1, 0), (0, 1))
+    for _ in range(steps):
+        dx, dy = rng.choice(directions)
+        target = (player[0] + dx, player[1] + dy)
+        if target not in floor or target in boxes: continue
+        behind = (player[0] - dx, player[1] - dy)
+        if behind in boxes:
+            boxes.remove(behind)
+            boxes.add(player)
+        player = target
+    def tile(cell: Tuple[int, int]) -> str:
+        if cell not in floor: return "#"
+        if cell == player: return "+" if cell in goals else "@"
+        if cell in boxes: return "*" if cell in goals else "$"
+        return "." if cell in goals else " "
+    return "\n".join("".join(tile((x, y)) for x in range(width)) for y in range(height))
+
+# Writes the generated instances that do not exist yet (the generators are seeded, so the instances never change)
+def ensure_generated(directory: str = GeneratedDirectory) -> None:
+    os.makedirs(directory, exist_ok=True)
+    instances = {
+        "graph1.json": lambda: json.dumps(generate_graph(40, seed=1)),
+        "graph2.json": lambda: json.dumps(generate_graph(80, seed=2)),
+        "park1.txt": lambda: generate_park(10, 6, 3, seed=1),
+        "crowded1.txt": lambda: generate_park(14, 8, 8, seed=2),
+        "level1.txt": lambda: generate_level(9, 8, 3, 1000, seed=3),
+        "level2.txt": lambda: generate_level(12, 10, 4, 3000, seed=1),
+    }
+    for file_name, generate in instances.items():
+        path = os.path.join(directory, file_name)
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(generate())
+
+# Lists the cases of the given suites (the cases whose name contains one of the filters, if any are given)
+def benchmark_cases(suites: List[str], filters: Optional[List[str]] = None) -> List[BenchmarkCase]:
+    if "generated" in suites:
+        ensure_generated()
+    cases = []
+    for suite in suites:
+        for group in Suites[suite]:
+            for path in sorted(glob.glob(group.pattern)):
+                for search in group.searches:
+                    case = BenchmarkCase(suite, path, group.problem, search)
+                    if not filters or any(text in case.name for text in filters):
+                        cases.append(case)
+    return cases
+
+
+# Builds the missing pattern databases of the levels of the cases that use them
+# The heuristic only loads the databases, so they are built here where the build time is not measured
+def ensure_pattern_databases(cases: List[BenchmarkCase]) -> None:
+    from sokoban import SokobanProblem
+    from sokoban_heuristic import PatternDatabaseSize
+    from sokoban_pdb import load_pattern_database
+    for path in dict.fromkeys(case.path for case in cases if case.search.heuristic == "sokoban_heuristic.pattern_database_heuristic"):
+        load_pattern_database(SokobanProblem.from_file(path).layout, PatternDatabaseSize, build=True)
+
+
+## Running ##
+
+# Runs a case in the current process and returns its measurements:
+#   status: "solved", "no solution" or "error" (the parent process adds "timeout")
+#   time: the wall time of the search in seconds (loading the instance is not included)
+#   expansions, generated: the counters of the search statistics (see search_stats.py)
+#   nodes_per_second: the expansions per second of wall time
+#   peak_rss: the peak resident memory of the process in bytes
+#   cost: the cost of the solution (None if there is no solution)
+def run_case(case: BenchmarkCase) -> Dict[str, Any]:
+    problem = load_function(case.problem, use_local=True).from_file(case.path)
+    initial_state = problem.get_initial_state()
+    # Import the modules of the search function and the heuristic first, so that the import time is not measured
+    for name in (case.search.search, case.search.heuristic):
+        if name is not None:
+            load_function(name, use_local=True)
+    with collect_stats() as stats:
+        solution = run_configuration(case.search, problem, initial_state)
+    elapsed = stats.phases["total"]
+    cost = None
+    if solution is not None:
+        state, cost = initial_state, 0
+        for action in solution:
+            cost += problem.get_cost(state, action)
+            state = problem.get_successor(state, action)
+    return {
+        "status": "no solution" if solution is None else "solved",
+        "time": elapsed,
+        "expansions": stats.expansions,
+        "generated": stats.generated,
+        "nodes_per_second": stats.expansions / elapsed if elapsed > 0 else 0.0,
+        "peak_rss": stats.peak_memory,
+        "cost": cost,
+    }
+
+# The entry point of the process of a case: it sends the measurements (or the error) to the pipe
+def benchmark_worker(case: BenchmarkCase, connection) -> None:
+    try:
+        connection.send(run_case(case))
+    except Exception:
+        connection.send({"status": "error", "error": traceback.format_exc()})
+    finally:
+        connection.close()
+
+# Runs a case in a new process, so that the peak memory is measured for this case only and a case that takes too long
+# can be stopped. If repeat > 1, the case runs several times and the fastest run is kept.
+def benchmark(case: BenchmarkCase, timeout: Optional[float] = None, repeat: int = 1) -> Dict[str, Any]:
+    best = None
+    for _ in range(repeat):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        worker = multiprocessing.Process(target=benchmark_worker, args=(case, sender), daemon=True)
+        worker.start()
+        sender.close()
+        try:
+            if receiver.poll(timeout):
+                result = receiver.recv()
+            else:
+                result = {"status": "timeout", "time": timeout}
+        except EOFError:
+            # The worker died without reporting back (e.g. it ran out of memory)
+            result = {"status": "error", "error": f"the process exited with code {worker.exitcode}"}
+        finally:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+            receiver.close()
+        if result["status"] in ("timeout", "error"):
+            return result
+        if best is None or result["time"] < best["time"]:
+            best = result
+    return best
+
+
+## History and baseline ##
+
+# Returns the current git commit (None if it is not available)
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def write_json(path: str, data: Any) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+# Compares the results to the baseline and returns the regressions of each case (only the cases in both are compared):
+#   a case that was solved is not solved anymore (timeout, error or no solution)
+#   the cost of the solution changed (the searches are deterministic, so this is a change of behavior)
+#   the expansions increased
+#   the time or the peak memory increased by more than the tolerance (a fraction, e.g. 0.25 for 25%)
+def find_regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> Dict[str, List[str]]:
+    regressions = {}
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or reference["status"] != "solved":
+            continue
+        problems = []
+        if result["status"] != "solved":
+            problems.append(f"was solved, now {result['status']}")
+        else:
+            if not math.isclose(result["cost"], reference["cost"], rel_tol=1e-9):
+                problems.append(f"cost changed from {reference['cost']} to {result['cost']}")
+            if result["expansions"] > reference["expansions"]:
+                problems.append(f"expansions increased from {reference['expansions']} to {result['expansions']}")
+            if result["time"] > reference["time"] * (1 + tolerance) and result["time"] - reference["time"] > MinimumSlowdown:
+                problems.append(f"time increased from {reference['time']:.3f}s to {result['time']:.3f}s")
+            if result["peak_rss"] > reference["peak_rss"] * (1 + tolerance) and result["peak_rss"] - reference["peak_rss"] > MinimumMemoryIncrease:
+                problems.append(f"peak memory increased from {reference['peak_rss'] / 2**20:.1f} MiB to {result['peak_rss'] / 2**20:.1f} MiB")
+        if problems:
+            regressions[name] = problems
+    return regressions
+
+def format_result(name: str, result: Dict[str, Any]) -> str:
+    if result["status"] in ("timeout", "error"):
+        return f"{name:<48} {result['status']}"
+    return (f"{name:<48} {result['status']:<12} {result['time']:>9.3f}s {result['expansions']:>10} exp "
+            f"{result['nodes_per_second']:>11.0f} nodes/s {result['peak_rss'] / 2**20:>8.1f} MiB")
+
+
+def main(args: argparse.Namespace):
+    suites = args.suite.split(",")
+    for suite in suites:
+        if suite not in Suites:
+            raise ValueError(f"Unknown suite '{suite}' (expected one of: {', '.join(Suites)})")
+    cases = benchmark_cases(suites, args.filter)
+    ensure_pattern_databases(cases)
+    results = {}
+    for case in cases:
+        result = results[case.name] = benchmark(case, args.timeout, args.repeat)
+        print(format_result(case.name, result))
+        if result["status"] == "error" and args.verbose:
+            print(result["error"])
+
+    if not args.no_history:
+        history = read_json(args.history, [])
+        history.append({
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timeout": args.timeout,
+            "repeat": args.repeat,
+            "results": results,
+        })
+        write_json(args.history, history)
+
+    if args.save_baseline:
+        # Only the given cases are replaced, so a baseline can be updated one suite at a time
+        baseline = read_json(args.baseline, {})
+        baseline.update(results)
+        write_json(args.baseline, baseline)
+        print(f"Saved the baseline of {len(results)} cases to {args.baseline}")
+        return 0
+
+    baseline = read_json(args.baseline, None)
+    if baseline is None:
+        print(f"No baseline found at {args.baseline} (create it with --save-baseline)")
+        return 0
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if not regressions:
+        print(f"No regressions against the baseline ({sum(name in baseline for name in results)} cases compared)")
+        return 0
+    print(f"{len(regressions)} regressions against the baseline:")
+    for name, problems in regressions.items():
+        for problem in problems:
+            print(f"  {name}: {problem}")
+    return 1
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Benchmark the search functions and check for regressions")
+    parser.add_argument("--suite", "-s", default=",".join(Suites), help=f"comma separated suites to run (default: {','.join(Suites)})")
+    parser.add_argument("--filter", "-f", action="append", default=None, help="only run the cases whose name contains this text (can be repeated)")
+    parser.add_argument("--timeout", "-t", type=float, default=30.0, help="stop a case after this many seconds")
+    parser.add_argument("--repeat", "-r", type=int, default=1, help="run each case this many times and keep the fastest run")
+    parser.add_argument("--history", default=DefaultHistory, help="the JSON file to which the results are appended")
+    parser.add_argument("--no-history", action="store_true", help="do not append the results to the history")
+    parser.add_argument("--baseline", default=DefaultBaseline, help="the JSON file of the baseline results")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline instead of comparing them")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="the allowed slowdown (and memory increase) as a fraction")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print the traceback of the failed cases")
+
+    args = parser.parse_args()
+    exit(main(args))
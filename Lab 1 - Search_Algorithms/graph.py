@@ -1,10 +1,12 @@
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
-import json
+from array import array
+from bisect import bisect_left
+import argparse, json, math, mmap, struct, sys
 
 from problem import Problem
-from mathutils import Point, euclidean_distance
-from helpers.utils import record_calls
+from mathutils import Point, VectorizeThreshold, euclidean_distance, euclidean_distances, np
+from helpers.utils import record_calls, track_call_count
 
 # In the graph routing problem, the state is a graph node
 # We use dataclass with frozen=True to automatically implement:
@@ -22,11 +24,20 @@ class GraphNode:
 
 # This is the implementation of the graph routing problem
 class GraphRoutingProblem(Problem[GraphNode, GraphNode]):
-    def __init__(self, start: GraphNode, goal: GraphNode, adjacency: Dict[GraphNode, List[GraphNode]]) -> None:
+    def __init__(self, start: GraphNode, goal: GraphNode, adjacency: Dict[GraphNode, List[GraphNode]],
+                 reverse_adjacency: Optional[Dict[GraphNode, List[GraphNode]]] = None) -> None:
         super().__init__()
         self.start = start
         self.goal = goal
         self.adjacency = adjacency
+        # The reverse adjacency maps every node to the nodes that have an edge into it
+        # It is derived once here so that backward (and bidirectional) search can walk the edges in reverse
+        if reverse_adjacency is None:
+            reverse_adjacency = {node: [] for node in adjacency}
+            for node, adjacent in adjacency.items():
+                for neighbor in adjacent:
+                    reverse_adjacency.setdefault(neighbor, []).append(node)
+        self.reverse_adjacency = reverse_adjacency
     
     def get_initial_state(self) -> GraphNode:
         return self.start
@@ -47,11 +58,18 @@ class GraphRoutingProblem(Problem[GraphNode, GraphNode]):
     # The cost of an action is the distance between the current node and the next node 
     def get_cost(self, state: GraphNode, action: GraphNode) -> float:
         return euclidean_distance(state.position, action.position)
+
+    # Returns the backward problem which starts at the goal and follows the edges in reverse till it reaches the start
+    # (or the given node instead of the start). The adjacency lists are shared, not copied.
+    # Since the cost is the euclidean distance, an edge has the same cost in both directions
+    def reverse(self, start: Optional[GraphNode] = None) -> 'GraphRoutingProblem':
+        return GraphRoutingProblem(self.goal, start or self.start, self.reverse_adjacency, self.adjacency)
     
     # Read a graph routing problem from file
     @staticmethod
     def from_file(path: str) -> 'GraphRoutingProblem':
-        problem_def: Dict[str, Dict] = json.load(open(path, 'r'))
+        with open(path, 'r') as f:
+            problem_def: Dict[str, Dict] = json.load(f)
         graph_def: Dict[str, Dict] = problem_def.get("graph", {})
         node_dict = {name: GraphNode(name, Point(*item.get("position", [0,0]))) for name, item in graph_def.items()}
         adjacency: Dict[GraphNode, List[GraphNode]] = {}
@@ -64,4 +82,302 @@ class GraphRoutingProblem(Problem[GraphNode, GraphNode]):
         return GraphRoutingProblem(start, goal, adjacency)
 
 def graphrouting_heuristic(problem: GraphRoutingProblem, state: GraphNode) -> float:
-    return euclidean_distance(state.position, problem.goal.position)
\ No newline at end of file
+    return euclidean_distance(state.position, problem.goal.position)
+
+# The batch version of graphrouting_heuristic (see evaluate_heuristic in problem.py)
+def graphrouting_heuristic_batch(problem: GraphRoutingProblem, states: Sequence[GraphNode]) -> List[float]:
+    return euclidean_distances([state.position for state in states], problem.goal.position)
+
+graphrouting_heuristic.batch = graphrouting_heuristic_batch
+
+
+# The names of the nodes of a graph loaded from a binary file
+# The names are stored as one UTF-8 blob with the offset of each name, and they are only decoded when accessed
+# so that opening a graph does not create millions of strings.
+class NameTable(Sequence[str]):
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self.offsets, self.blob = offsets, blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0: index += len(self)
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+# A compiled graph in the compressed sparse row (CSR) format
+# Every node gets an integer id (its index in the sorted list of names) and the edges are stored in flat arrays:
+#   names[i]: the name of node i (the names are sorted, so index(name) finds the id of a name with a binary search)
+#   xs[i], ys[i]: the coordinates of node i
+#   offsets[i] to offsets[i+1]: the range of the edges leaving node i in the edge arrays (offsets has N+1 entries)
+#   targets[e]: the node that edge e leads to (within each node, the edges are sorted by target id)
+#   weights[e]: the cost of edge e (precomputed euclidean distance)
+# The arrays use the "array" module so they store raw numbers (4 or 8 bytes each) instead of python objects,
+# which lets graphs with millions of edges fit in memory.
+# A graph loaded from a binary file (see CompiledGraph.load) uses memoryviews of the mapped file instead of arrays.
+class CompiledGraph:
+    __slots__ = ("names", "xs", "ys", "offsets", "targets", "weights")
+
+    def __init__(self, names: Sequence[str], xs: array, ys: array, offsets: array, targets: array, weights: array) -> None:
+        self.names = names
+        self.xs, self.ys = xs, ys
+        self.offsets, self.targets, self.weights = offsets, targets, weights
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    # Returns the id of the node with the given name
+    def index(self, name: str) -> int:
+        index = bisect_left(self.names, name)
+        if index == len(self.names) or self.names[index] != name:
+            raise KeyError(f"There is no node named {name}")
+        return index
+
+    # Returns the ids of the nodes that the given node has an edge into
+    def neighbors(self, node: int) -> array:
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    # Returns the index of the edge between the given nodes (binary search within the edges of the source)
+    def edge(self, source: int, target: int) -> int:
+        start, end = self.offsets[source], self.offsets[source + 1]
+        edge = bisect_left(self.targets, target, start, end)
+        if edge == end or self.targets[edge] != target:
+            raise KeyError(f"There is no edge from {self.names[source]} to {self.names[target]}")
+        return edge
+
+    # Returns the cost of the edge between the given nodes
+    def weight(self, source: int, target: int) -> float:
+        return self.weights[self.edge(source, target)]
+
+    # Converts an id back to a graph node (only needed at the API boundary)
+    def node(self, index: int) -> GraphNode:
+        x, y = self.xs[index], self.ys[index]
+        return GraphNode(self.names[index], Point(int(x) if x.is_integer() else x, int(y) if y.is_integer() else y))
+
+    # Builds the graph with every edge reversed (used by backward and bidirectional search)
+    def reverse(self) -> 'CompiledGraph':
+        count = len(self.names)
+        # Count the incoming edges of each node, then place each edge in the row of its target
+        offsets = array('q', [0]) * (count + 1)
+        for target in self.targets:
+            offsets[target + 1] += 1
+        for index in range(count):
+            offsets[index + 1] += offsets[index]
+        cursor = array('q', offsets[:-1])
+        targets = array('i', [0]) * len(self.targets)
+        weights = array('d', [0.0]) * len(self.weights)
+        # The sources are visited in increasing order so each reversed row ends up sorted
+        for source in range(count):
+            for edge in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.targets[edge]
+                position = cursor[target]
+                targets[position], weights[position] = source, self.weights[edge]
+                cursor[target] = position + 1
+        return CompiledGraph(self.names, self.xs, self.ys, offsets, targets, weights)
+
+    # Compiles an adjacency dictionary (the node ids follow the order of the sorted names)
+    @staticmethod
+    def from_adjacency(adjacency: Dict[GraphNode, List[GraphNode]]) -> 'CompiledGraph':
+        nodes = {node.name: node for node in adjacency}
+        for adjacent in adjacency.values():
+            for node in adjacent:
+                nodes.setdefault(node.name, node)
+        names = sorted(nodes)
+        ids = {name: index for index, name in enumerate(names)}
+        xs = array('d', (nodes[name].position.x for name in names))
+        ys = array('d', (nodes[name].position.y for name in names))
+        offsets, targets, weights = array('q', [0]), array('i'), array('d')
+        for name in names:
+            node = nodes[name]
+            for neighbor in sorted(adjacency.get(node, []), key=lambda neighbor: ids[neighbor.name]):
+                targets.append(ids[neighbor.name])
+                weights.append(euclidean_distance(node.position, neighbor.position))
+            offsets.append(len(targets))
+        return CompiledGraph(names, xs, ys, offsets, targets, weights)
+
+# The binary graph format (little endian):
+#   header: magic (8 bytes), version (uint32), node count N, edge count M, start id, goal id, names size (int64 each)
+#           padded to 8 bytes. The start and goal ids are -1 if the file has no problem definition.
+#   sections: xs (N float64), ys (N float64), offsets (N+1 int64), weights (M float64),
+#             name offsets (N+1 int64), targets (M int32), names (UTF-8 blob)
+# The 8-byte sections come first so that every section is aligned when the file is mapped in memory.
+GraphFileMagic = b"GRAPHCSR"
+GraphFileVersion = 1
+GraphFileHeader = "<8sIqqqqq"
+GraphFileHeaderSize = (struct.calcsize(GraphFileHeader) + 7) // 8 * 8
+
+# Checks if the file at the given path is a binary graph file
+def is_binary_graph_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(GraphFileMagic)) == GraphFileMagic
+
+# Writes a compiled graph (and optionally the start and goal of a problem) to a binary graph file
+# The sections are written one at a time from the arrays, so the graph is never copied as a whole
+def save_compiled_graph(path: str, graph: CompiledGraph, start: int = -1, goal: int = -1) -> None:
+    encoded = [name.encode("utf-8") for name in graph.names]
+    name_offsets = array('q', [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    with open(path, "wb") as f:
+        header = struct.pack(GraphFileHeader, GraphFileMagic, GraphFileVersion, len(graph), graph.edge_count, start, goal, name_offsets[-1])
+        f.write(header + bytes(GraphFileHeaderSize - len(header)))
+        for section, code in ((graph.xs, 'd'), (graph.ys, 'd'), (graph.offsets, 'q'), (graph.weights, 'd'), (name_offsets, 'q'), (graph.targets, 'i')):
+            section = section if isinstance(section, array) and section.typecode == code else array(code, section)
+            if sys.byteorder != "little":
+                section = array(code, section)
+                section.byteswap()
+            f.write(section.tobytes())
+        for name in encoded:
+            f.write(name)
+
+# Maps a binary graph file in memory and returns the graph with the start and goal ids stored in the file
+# Nothing is read up front: every array is a memoryview over the mapped file, so opening a graph is almost instant
+# and the pages are shared between the processes that map the same file.
+def load_compiled_graph(path: str) -> Tuple[CompiledGraph, int, int]:
+    with open(path, "rb") as f:
+        # The memory map stays valid after the file is closed
+        memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, nodes, edges, start, goal, names_size = struct.unpack_from(GraphFileHeader, memory)
+    if magic != GraphFileMagic or version != GraphFileVersion:
+        raise ValueError(f"{path} is not a binary graph file (version {GraphFileVersion})")
+    if sys.byteorder != "little":
+        raise ValueError("Binary graph files can only be mapped on little endian machines")
+    view = memoryview(memory)
+    position = GraphFileHeaderSize
+    def section(code: str, count: int) -> memoryview:
+        nonlocal position
+        size = count * struct.calcsize(code)
+        result = view[position:position + size].cast(code)
+        position += size
+        return result
+    xs, ys = section('d', nodes), section('d', nodes)
+    offsets, weights = section('q', nodes + 1), section('d', edges)
+    name_offsets, targets = section('q', nodes + 1), section('i', edges)
+    names = NameTable(name_offsets, view[position:position + names_size])
+    return CompiledGraph(names, xs, ys, offsets, targets, weights), start, goal
+
+# This is the implementation of the graph routing problem over a compiled graph
+# The states and the actions are node ids (as in GraphRoutingProblem, the action is the next node)
+# so the search only hashes and compares integers. The names are translated at the API boundary:
+#   CompiledGraphRoutingProblem.from_names to create a problem, and to_names to translate a solution.
+# The actions of a node are in the order of the ids (which is the order of the names, as in GraphRoutingProblem.from_file).
+class CompiledGraphRoutingProblem(Problem[int, int]):
+    def __init__(self, graph: CompiledGraph, start: int, goal: int, reverse_graph: Optional[CompiledGraph] = None) -> None:
+        super().__init__()
+        self.graph = graph
+        self.start = start
+        self.goal = goal
+        # The reversed graph is only built when backward search needs it
+        self.reverse_graph = reverse_graph
+        # The landmark table of the graph (see graph_landmarks.py), shared by the queries on the same graph
+        self.landmarks = None
+        # The edge that get_cost expects next (see get_cost)
+        self.next_edge = 0
+
+    def get_initial_state(self) -> int:
+        return self.start
+
+    def is_goal(self, state: int) -> bool:
+        return state == self.goal
+
+    # We use @track_call_count to track the number of times this function was called to count the number of explored nodes
+    @track_call_count
+    def get_actions(self, state: int) -> Iterable[int]:
+        offsets = self.graph.offsets
+        start = offsets[state]
+        self.next_edge = start
+        return self.graph.targets[start:offsets[state + 1]]
+
+    def get_successor(self, state: int, action: int) -> int:
+        return action
+
+    # The searches ask for the costs of the actions of a state in the order get_actions returned them
+    # (possibly skipping some actions, e.g. the explored children), and the rows are sorted by target,
+    # so the edge of an action is found by moving forward from the edge of the previous action:
+    # O(degree) for all the costs of an expansion instead of a binary search per cost.
+    # If the costs are asked in another order, the edge is found with a binary search and the order resumes from there.
+    # The cursor is only trusted inside the row of the state: a cursor left in another row (e.g. by a child that
+    # IDA* expanded in between) may point at an edge into the same target but from another source.
+    def get_cost(self, state: int, action: int) -> float:
+        graph, edge = self.graph, self.next_edge
+        offsets, targets = graph.offsets, graph.targets
+        start, end = offsets[state], offsets[state + 1]
+        if start <= edge < end:
+            while edge < end and targets[edge] < action:
+                edge += 1
+            if edge == end or targets[edge] != action:
+                edge = graph.edge(state, action)
+        else:
+            edge = graph.edge(state, action)
+        self.next_edge = edge + 1
+        return graph.weights[edge]
+
+    # Returns the backward problem (see GraphRoutingProblem.reverse)
+    def reverse(self, start: Optional[int] = None) -> 'CompiledGraphRoutingProblem':
+        if self.reverse_graph is None:
+            self.reverse_graph = self.graph.reverse()
+        return CompiledGraphRoutingProblem(self.reverse_graph, self.goal, self.start if start is None else start, self.graph)
+
+    # Translates a solution (a list of node ids) to node names
+    def to_names(self, solution: Optional[List[int]]) -> Optional[List[str]]:
+        return None if solution is None else [self.graph.names[node] for node in solution]
+
+    # Creates a problem between the nodes with the given names
+    @staticmethod
+    def from_names(graph: CompiledGraph, start: str, goal: str) -> 'CompiledGraphRoutingProblem':
+        return CompiledGraphRoutingProblem(graph, graph.index(start), graph.index(goal))
+
+    # Compiles a graph routing problem
+    @staticmethod
+    def from_problem(problem: GraphRoutingProblem) -> 'CompiledGraphRoutingProblem':
+        return CompiledGraphRoutingProblem.from_names(CompiledGraph.from_adjacency(problem.adjacency), problem.start.name, problem.goal.name)
+
+    # Writes the problem to a binary graph file
+    def save(self, path: str) -> None:
+        save_compiled_graph(path, self.graph, self.start, self.goal)
+
+    # Read a graph routing problem from file: binary graph files are mapped in memory,
+    # otherwise the file is read as a JSON graph (see GraphRoutingProblem.from_file) and compiled
+    @staticmethod
+    def from_file(path: str) -> 'CompiledGraphRoutingProblem':
+        if is_binary_graph_file(path):
+            graph, start, goal = load_compiled_graph(path)
+            return CompiledGraphRoutingProblem(graph, start, goal)
+        return CompiledGraphRoutingProblem.from_problem(GraphRoutingProblem.from_file(path))
+
+# The euclidean distance to the goal computed from the coordinate arrays (the same values as graphrouting_heuristic)
+def compiled_graphrouting_heuristic(problem: CompiledGraphRoutingProblem, state: int) -> float:
+    graph, goal = problem.graph, problem.goal
+    dx, dy = graph.xs[state] - graph.xs[goal], graph.ys[state] - graph.ys[goal]
+    return math.sqrt(dx * dx + dy * dy)
+
+# The batch version of compiled_graphrouting_heuristic
+# With NumPy, the coordinate arrays are viewed as numpy arrays without copying them
+def compiled_graphrouting_heuristic_batch(problem: CompiledGraphRoutingProblem, states: Sequence[int]) -> List[float]:
+    if np is None or len(states) < VectorizeThreshold:
+        return [compiled_graphrouting_heuristic(problem, state) for state in states]
+    graph, goal, indices = problem.graph, problem.goal, np.array(states, dtype=np.int64)
+    dx = np.frombuffer(graph.xs, dtype=np.float64)[indices] - graph.xs[goal]
+    dy = np.frombuffer(graph.ys, dtype=np.float64)[indices] - graph.ys[goal]
+    return np.sqrt(dx * dx + dy * dy).tolist()
+
+compiled_graphrouting_heuristic.batch = compiled_graphrouting_heuristic_batch
+
+
+def main(args: argparse.Namespace):
+    problem = CompiledGraphRoutingProblem.from_file(args.graph)
+    problem.save(args.output)
+    print(f"{args.graph} -> {args.output} ({len(problem.graph)} nodes, {problem.graph.edge_count} edges)")
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Convert a JSON graph to the binary graph format")
+    parser.add_argument("graph", help="path to the JSON graph")
+    parser.add_argument("output", help="path of the binary graph file to write")
+
+    args = parser.parse_args()
+    main(args)
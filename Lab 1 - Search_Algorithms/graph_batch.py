@@ -0,0 +1,159 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import argparse, heapq, math, os, time
+
+from graph import CompiledGraph, CompiledGraphRoutingProblem, compiled_graphrouting_heuristic
+from search import AStarSearch
+
+# This file contains the batch routing API: answering many (start, goal) queries against the same graph
+# The graph is loaded and compiled once, then:
+#   the queries that share a start are answered together by one Dijkstra tree from that start
+#   the other queries are spread over a process pool (each worker loads the graph once and runs A* per query)
+
+# Below this number of remaining queries, they are solved in the current process since starting a pool costs more
+PoolThreshold = 16
+
+# Finds the shortest paths from the source to all the targets with a single Dijkstra search
+# The search stops as soon as every target is settled. Returns the path (list of next nodes) of every reachable target.
+def shortest_path_tree(graph: CompiledGraph, source: int, targets: Sequence[int]) -> Dict[int, List[int]]:
+    offsets, edge_targets, weights = graph.offsets, graph.targets, graph.weights
+    remaining = set(targets)
+    distances = {source: 0.0}
+    parents = {source: source}
+    settled = set()
+    frontier = [(0.0, source)]
+    while frontier and remaining:
+        distance, node = heapq.heappop(frontier)
+        if node in settled: continue
+        settled.add(node)
+        remaining.discard(node)
+        for edge in range(offsets[node], offsets[node + 1]):
+            target, new_distance = edge_targets[edge], distance + weights[edge]
+            if target not in settled and new_distance < distances.get(target, math.inf):
+                distances[target] = new_distance
+                parents[target] = node
+                heapq.heappush(frontier, (new_distance, target))
+    paths = {}
+    for target in targets:
+        if target not in settled: continue
+        path = []
+        node = target
+        while node != source:
+            path.append(node)
+            node = parents[node]
+        path.reverse()
+        paths[target] = path
+    return paths
+
+# The graph of the current pool worker (loaded once by the pool initializer)
+worker_graph: Optional[CompiledGraph] = None
+worker_hierarchy = None
+
+# Sets the graph (and the hierarchy) of the current worker
+# The graph is either given (it is pickled to the worker) or loaded from its file
+# The index of the hierarchy is built by route_many before the pool starts, so the workers only load it
+def initialize_worker(path: Optional[str], graph: Optional[CompiledGraph], use_hierarchy: bool) -> None:
+    global worker_graph, worker_hierarchy
+    worker_graph = CompiledGraphRoutingProblem.from_file(path).graph if graph is None else graph
+    worker_hierarchy = None
+    if use_hierarchy:
+        from graph_hierarchy import load_contraction_hierarchy
+        worker_hierarchy = load_contraction_hierarchy(path, worker_graph)
+
+# Solves (start id, goal id) queries with the hierarchy if there is one, otherwise with A*
+def route_queries(graph: CompiledGraph, hierarchy, queries: List[Tuple[int, int]]) -> List[Optional[List[int]]]:
+    solutions = []
+    for start, goal in queries:
+        if hierarchy is not None:
+            solutions.append(hierarchy.route(start, goal))
+        else:
+            solutions.append(AStarSearch(CompiledGraphRoutingProblem(graph, start, goal), start, compiled_graphrouting_heuristic))
+    return solutions
+
+# Solves a chunk of (start id, goal id) queries in the current worker
+def solve_queries(queries: List[Tuple[int, int]]) -> List[Optional[List[int]]]:
+    return route_queries(worker_graph, worker_hierarchy, queries)
+
+# Solves many routing queries (pairs of node names) against the same graph
+# and returns the solution of each query (the names of the next nodes, or None if the goal is unreachable) in order
+#   graph: the path of a graph file (JSON or binary), or an already compiled graph
+#   processes: the number of pool workers (os.cpu_count() by default, 1 to solve everything in this process)
+#   use_hierarchy: answer the single queries with the contraction hierarchy of the graph file (see graph_hierarchy.py)
+#                  instead of A* (the index is built and stored next to the graph file if it does not exist)
+'''
+Why group by start: a Dijkstra search from a start settles the nodes in order of distance, so the paths to all the goals
+                    of that start come out of the same search, which costs about as much as the query to its farthest goal.
+Why processes: the searches are pure python, so threads would be serialized by the GIL.
+               Binary graph files are mapped in memory, so the workers share the pages of the graph instead of copying it.
+'''
+def route_many(graph: Union[str, CompiledGraph], queries: Sequence[Tuple[str, str]],
+               processes: Optional[int] = None, use_hierarchy: bool = False) -> List[Optional[List[str]]]:
+    if use_hierarchy and not isinstance(graph, str):
+        raise ValueError("use_hierarchy needs the path of the graph file (the index is stored next to it)")
+    path = graph if isinstance(graph, str) else None
+    if path is not None:
+        graph = CompiledGraphRoutingProblem.from_file(path).graph
+    # A graph loaded from a binary file is a view of the mapped file, so the workers map the file themselves
+    # (which is almost instant) instead of receiving a copy. Other graphs are sent to the workers as pickled arrays,
+    # which is faster than parsing and compiling a JSON file again in every worker.
+    shared = None if path is not None and isinstance(graph.targets, memoryview) else graph
+    ids = [(graph.index(start), graph.index(goal)) for start, goal in queries]
+    solutions: List[Optional[List[int]]] = [None] * len(ids)
+
+    by_start: Dict[int, List[int]] = defaultdict(list)
+    for query, (start, _) in enumerate(ids):
+        by_start[start].append(query)
+    single = []
+    for start, grouped in by_start.items():
+        if len(grouped) == 1:
+            single.append(grouped[0])
+            continue
+        paths = shortest_path_tree(graph, start, [ids[query][1] for query in grouped])
+        for query in grouped:
+            solutions[query] = paths.get(ids[query][1])
+
+    if single:
+        processes = processes or os.cpu_count() or 1
+        pending = [ids[query] for query in single]
+        # Build the index here if it is missing (and save it next to the graph file), so that the pool workers
+        # load it instead of each building the same hierarchy
+        hierarchy = None
+        if use_hierarchy:
+            from graph_hierarchy import load_contraction_hierarchy
+            hierarchy = load_contraction_hierarchy(path, graph)
+        # A mapped graph without its path cannot be sent to the workers, so it is solved in this process
+        if processes == 1 or len(single) < PoolThreshold or (path is None and isinstance(graph.targets, memoryview)):
+            results = route_queries(graph, hierarchy, pending)
+        else:
+            chunk = max(1, len(pending) // (processes * 4))
+            chunks = [pending[index:index + chunk] for index in range(0, len(pending), chunk)]
+            with ProcessPoolExecutor(processes, initializer=initialize_worker, initargs=(path, shared, use_hierarchy)) as executor:
+                results = [solution for solved in executor.map(solve_queries, chunks) for solution in solved]
+        for query, solution in zip(single, results):
+            solutions[query] = solution
+
+    return [None if solution is None else [graph.names[node] for node in solution] for solution in solutions]
+
+
+def main(args: argparse.Namespace):
+    # The queries file has one query per line: the start name and the goal name separated by whitespace
+    with open(args.queries, 'r') as f:
+        queries = [tuple(line.split()) for line in f if line.strip()]
+    start = time.time()
+    solutions = route_many(args.graph, queries, args.processes, args.hierarchy)
+    elapsed = time.time() - start
+    for (source, goal), solution in zip(queries, solutions):
+        print(f"{source} -> {goal}: {'No Solution' if solution is None else ' '.join(solution)}")
+    print(f"Solved {len(queries)} queries in {elapsed} seconds")
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Solve many routing queries against the same graph")
+    parser.add_argument("graph", help="path to the graph file (JSON or binary)")
+    parser.add_argument("queries", help="path to a file with one 'start goal' query per line")
+    parser.add_argument("--processes", "-p", type=int, default=None, help="the number of worker processes")
+    parser.add_argument("--hierarchy", action="store_true", help="use the contraction hierarchy of the graph")
+
+    args = parser.parse_args()
+    main(args)
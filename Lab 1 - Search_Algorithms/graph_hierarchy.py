@@ -0,0 +1,321 @@
+from typing import Dict, List, Optional, Tuple, Union
+from array import array
+from bisect import bisect_left
+import argparse, hashlib, heapq, math, mmap, os, struct, sys, time
+
+from graph import CompiledGraph, CompiledGraphRoutingProblem, GraphNode, GraphRoutingProblem
+
+# This file contains the contraction hierarchy (CH) index for repeated graph routing queries
+# The nodes are contracted one by one in order of importance. Contracting a node removes it from the graph and adds
+# a shortcut u -> w (through the node) for every pair of neighbors u -> node -> w whose shortest path goes through it.
+# The rank of a node is its position in the contraction order. Every shortest path then has an equivalent path that
+# first goes up in rank and then down, so a query only needs two small searches that only go up:
+#   a forward search from the start over the upward edges, and a backward search from the goal over the downward edges
+# (walked in reverse). The shortest path is the best node where the two searches meet.
+# The shortcuts remember the node they skip (their middle node), so the path can be unpacked into the original edges.
+
+# The index is built once per graph file and stored next to it (in "<graph file>.ch")
+# The index file stores the sha1 digest of the graph file, so an index of an older version of the graph is rebuilt.
+IndexFileSuffix = ".ch"
+
+# The file format (little endian):
+#   header: magic (8 bytes), version (uint32), graph file sha1 (20 bytes), node count N,
+#           upward edge count U, downward edge count D (int64 each) padded to 8 bytes
+#   sections: up offsets (N+1 int64), up weights (U float64), down offsets (N+1 int64), down weights (D float64),
+#             ranks (N int32), up targets (U int32), up middles (U int32), down targets (D int32), down middles (D int32)
+# The middle of an original edge is -1.
+IndexFileMagic = b"GRAPHCH1"
+IndexFileVersion = 1
+IndexFileHeader = "<8sI20sqqq"
+IndexFileHeaderSize = (struct.calcsize(IndexFileHeader) + 7) // 8 * 8
+
+# The witness searches stop after settling this many nodes
+# A witness search that stops early may add a useless shortcut, but it never misses a needed one,
+# so this limit trades a few more edges for a faster contraction.
+WitnessSettleLimit = 64
+
+# The contraction hierarchy of a compiled graph
+#   ranks[v]: the position of node v in the contraction order
+#   up_offsets, up_targets, up_weights, up_middles: the edges v -> w with ranks[w] > ranks[v] (CSR, sorted by target)
+#   down_offsets, down_targets, down_weights, down_middles: the edges u -> v with ranks[u] > ranks[v],
+#       stored in the row of v (the lower node) with u as the target, so the backward search can walk them upward
+class ContractionHierarchy:
+    def __init__(self, graph: CompiledGraph, ranks, up: Tuple, down: Tuple) -> None:
+        self.graph = graph
+        self.ranks = ranks
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middles = up
+        self.down_offsets, self.down_targets, self.down_weights, self.down_middles = down
+
+    # Finds the shortest path from start to goal and returns it as the list of the next nodes (like the search functions)
+    # or None if the goal is unreachable
+    def route(self, start: int, goal: int) -> Optional[List[int]]:
+        if start == goal:
+            return []
+        edges = ((self.up_offsets, self.up_targets, self.up_weights), (self.down_offsets, self.down_targets, self.down_weights))
+        distances = ({start: 0.0}, {goal: 0.0})
+        # parents[side][node] = (previous node, edge index) of the best path found to the node by each search
+        parents: Tuple[Dict[int, Tuple[int, int]], Dict[int, Tuple[int, int]]] = ({}, {})
+        frontiers = ([(0.0, start)], [(0.0, goal)])
+        best, meeting = math.inf, -1
+        while frontiers[0] or frontiers[1]:
+            # Alternate between the two searches
+            for side in (0, 1):
+                frontier = frontiers[side]
+                if not frontier: continue
+                # A search can stop once it cannot find a shorter path than the best one found so far
+                if frontier[0][0] >= best:
+                    frontier.clear()
+                    continue
+                distance, node = heapq.heappop(frontier)
+                if distance > distances[side][node]: continue
+                other = distances[1 - side].get(node)
+                if other is not None and distance + other < best:
+                    best, meeting = distance + other, node
+                offsets, targets, weights = edges[side]
+                own = distances[side]
+                for edge in range(offsets[node], offsets[node + 1]):
+                    target, new_distance = targets[edge], distance + weights[edge]
+                    if new_distance < own.get(target, math.inf):
+                        own[target] = new_distance
+                        parents[side][target] = (node, edge)
+                        heapq.heappush(frontier, (new_distance, target))
+        if meeting < 0:
+            return None
+        # Collect the edges start -> meeting (upward edges) then meeting -> goal (downward edges)
+        forward = []
+        node = meeting
+        while node != start:
+            node, edge = parents[0][node]
+            forward.append((node, self.up_targets[edge], self.up_middles[edge]))
+        forward.reverse()
+        backward = []
+        node = meeting
+        while node != goal:
+            previous, edge = node, parents[1][node][1]
+            node = parents[1][node][0]
+            backward.append((previous, node, self.down_middles[edge]))
+        path = []
+        for source, target, middle in forward + backward:
+            self.unpack(source, target, middle, path)
+        return path
+
+    # Appends the original nodes of the edge source -> target (excluding the source) to the path
+    '''
+    A shortcut source -> target with the middle node m replaces the edges source -> m and m -> target.
+    The middle node was contracted before both ends, so source -> m is a downward edge stored in the row of m
+    and m -> target is an upward edge stored in the row of m.
+    '''
+    def unpack(self, source: int, target: int, middle: int, path: List[int]) -> None:
+        stack = [(source, target, middle)]
+        while stack:
+            source, target, middle = stack.pop()
+            if middle < 0:
+                path.append(target)
+                continue
+            # Push the second half first so that the first half is unpacked first
+            stack.append((middle, target, self.up_middles[self.find(self.up_offsets, self.up_targets, middle, target)]))
+            stack.append((source, middle, self.down_middles[self.find(self.down_offsets, self.down_targets, middle, source)]))
+
+    # Returns the index of the edge of the given row that leads to the target (the rows are sorted by target)
+    @staticmethod
+    def find(offsets, targets, row: int, target: int) -> int:
+        return bisect_left(targets, target, offsets[row], offsets[row + 1])
+
+    # Solves a graph routing problem (GraphRoutingProblem or CompiledGraphRoutingProblem) over the same graph
+    # and returns the solution in the actions of the problem (graph nodes or node ids)
+    def solve(self, problem: Union[GraphRoutingProblem, CompiledGraphRoutingProblem],
+              initial_state: Union[GraphNode, int, None] = None) -> Union[List[GraphNode], List[int], None]:
+        if initial_state is None:
+            initial_state = problem.get_initial_state()
+        if isinstance(problem, CompiledGraphRoutingProblem):
+            return self.route(initial_state, problem.goal)
+        path = self.route(self.graph.index(initial_state.name), self.graph.index(problem.goal.name))
+        if path is None:
+            return None
+        nodes = {node.name: node for node in problem.adjacency}
+        return [nodes[self.graph.names[node]] for node in path]
+
+    # Contracts every node of the graph and returns the hierarchy
+    '''
+    Node order: the nodes are contracted in increasing order of their edge difference (the number of shortcuts
+    the contraction adds minus the number of edges it removes) plus the number of their neighbors that were already
+    contracted (which spreads the contraction evenly over the graph). The priorities are updated lazily:
+    the node on top of the queue is re-evaluated and only contracted if it is still the smallest.
+    Shortcuts: for each pair u -> v -> w, a witness search from u (that avoids v) looks for a path to w that is
+    not longer than the path through v. The shortcut u -> w is only added if there is no such witness.
+    '''
+    @staticmethod
+    def build(graph: CompiledGraph) -> 'ContractionHierarchy':
+        count = len(graph)
+        # The remaining graph: out_edges[v][w] = in_edges[w][v] = (weight, middle) (only the cheapest parallel edge is kept)
+        out_edges: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(count)]
+        in_edges: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(count)]
+        for source in range(count):
+            for edge in range(graph.offsets[source], graph.offsets[source + 1]):
+                target, weight = graph.targets[edge], graph.weights[edge]
+                if target == source: continue
+                if weight < out_edges[source].get(target, (math.inf, -1))[0]:
+                    out_edges[source][target] = in_edges[target][source] = (weight, -1)
+
+        # Returns the shortcuts (u, w, weight) needed to contract the node
+        def shortcuts(node: int) -> List[Tuple[int, int, float]]:
+            needed = []
+            outgoing = out_edges[node]
+            if not outgoing: return needed
+            longest = max(weight for weight, _ in outgoing.values())
+            for source, (in_weight, _) in in_edges[node].items():
+                limit = in_weight + longest
+                # Witness search: a bounded Dijkstra from the source that does not go through the node
+                distances = {source: 0.0}
+                frontier = [(0.0, source)]
+                settled = 0
+                while frontier and settled < WitnessSettleLimit:
+                    distance, current = heapq.heappop(frontier)
+                    if distance > distances[current]: continue
+                    if distance > limit: break
+                    settled += 1
+                    for neighbor, (weight, _) in out_edges[current].items():
+                        if neighbor == node: continue
+                        new_distance = distance + weight
+                        if new_distance < distances.get(neighbor, math.inf):
+                            distances[neighbor] = new_distance
+                            heapq.heappush(frontier, (new_distance, neighbor))
+                for target, (out_weight, _) in outgoing.items():
+                    if target == source: continue
+                    weight = in_weight + out_weight
+                    if distances.get(target, math.inf) > weight:
+                        needed.append((source, target, weight))
+            return needed
+
+        contracted_neighbors = [0] * count
+        def priority(node: int, needed: List[Tuple[int, int, float]]) -> int:
+            return len(needed) - len(in_edges[node]) - len(out_edges[node]) + contracted_neighbors[node]
+
+        queue = [(priority(node, shortcuts(node)), node) for node in range(count)]
+        heapq.heapify(queue)
+        ranks = array('i', [0]) * count
+        # The final edges of each node (to the nodes contracted after it) as lists of (target, weight, middle)
+        up_rows: List[List[Tuple[int, float, int]]] = [[] for _ in range(count)]
+        down_rows: List[List[Tuple[int, float, int]]] = [[] for _ in range(count)]
+        rank = 0
+        while queue:
+            _, node = heapq.heappop(queue)
+            needed = shortcuts(node)
+            current = priority(node, needed)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, node))
+                continue
+            ranks[node] = rank
+            rank += 1
+            # All the remaining neighbors are contracted later, so the remaining edges are the final edges of the node
+            up_rows[node] = sorted((target, weight, middle) for target, (weight, middle) in out_edges[node].items())
+            down_rows[node] = sorted((source, weight, middle) for source, (weight, middle) in in_edges[node].items())
+            for source, target, weight in needed:
+                if weight < out_edges[source].get(target, (math.inf, -1))[0]:
+                    out_edges[source][target] = in_edges[target][source] = (weight, node)
+            for target in out_edges[node]:
+                del in_edges[target][node]
+                contracted_neighbors[target] += 1
+            for source in in_edges[node]:
+                del out_edges[source][node]
+                contracted_neighbors[source] += 1
+            out_edges[node], in_edges[node] = {}, {}
+
+        def compile_rows(rows: List[List[Tuple[int, float, int]]]) -> Tuple[array, array, array, array]:
+            offsets, targets, weights, middles = array('q', [0]), array('i'), array('d'), array('i')
+            for row in rows:
+                for target, weight, middle in row:
+                    targets.append(target)
+                    weights.append(weight)
+                    middles.append(middle)
+                offsets.append(len(targets))
+            return offsets, targets, weights, middles
+
+        return ContractionHierarchy(graph, ranks, compile_rows(up_rows), compile_rows(down_rows))
+
+    # Writes the hierarchy to an index file (the file is replaced atomically so concurrent readers never see a partial file)
+    def save(self, path: str, fingerprint: bytes) -> None:
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            header = struct.pack(IndexFileHeader, IndexFileMagic, IndexFileVersion, fingerprint,
+                                 len(self.ranks), len(self.up_targets), len(self.down_targets))
+            f.write(header + bytes(IndexFileHeaderSize - len(header)))
+            for section, code in ((self.up_offsets, 'q'), (self.up_weights, 'd'), (self.down_offsets, 'q'), (self.down_weights, 'd'),
+                                  (self.ranks, 'i'), (self.up_targets, 'i'), (self.up_middles, 'i'),
+                                  (self.down_targets, 'i'), (self.down_middles, 'i')):
+                section = array(code, section)
+                if sys.byteorder != "little":
+                    section.byteswap()
+                f.write(section.tobytes())
+        os.replace(temporary, path)
+
+    # Maps an index file in memory, returns None if the file does not exist or was built for another graph file
+    @staticmethod
+    def load(graph: CompiledGraph, path: str, fingerprint: bytes) -> Optional['ContractionHierarchy']:
+        if not os.path.exists(path) or sys.byteorder != "little":
+            return None
+        with open(path, "rb") as f:
+            # The memory map stays valid after the file is closed
+            memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(memory) < IndexFileHeaderSize:
+            return None
+        magic, version, stored_fingerprint, nodes, ups, downs = struct.unpack_from(IndexFileHeader, memory)
+        if magic != IndexFileMagic or version != IndexFileVersion or stored_fingerprint != fingerprint or nodes != len(graph):
+            return None
+        if len(memory) != IndexFileHeaderSize + 8 * (2 * (nodes + 1) + ups + downs) + 4 * (nodes + 2 * ups + 2 * downs):
+            return None
+        view = memoryview(memory)
+        position = IndexFileHeaderSize
+        def section(code: str, count: int) -> memoryview:
+            nonlocal position
+            size = count * struct.calcsize(code)
+            result = view[position:position + size].cast(code)
+            position += size
+            return result
+        up_offsets, up_weights = section('q', nodes + 1), section('d', ups)
+        down_offsets, down_weights = section('q', nodes + 1), section('d', downs)
+        ranks = section('i', nodes)
+        up_targets, up_middles = section('i', ups), section('i', ups)
+        down_targets, down_middles = section('i', downs), section('i', downs)
+        return ContractionHierarchy(graph, ranks, (up_offsets, up_targets, up_weights, up_middles),
+                                    (down_offsets, down_targets, down_weights, down_middles))
+
+
+# Computes the sha1 digest of a graph file (read in chunks so large files are never fully loaded)
+def graph_file_fingerprint(path: str) -> bytes:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+# Loads the contraction hierarchy of a graph file (JSON or binary), building and saving it first if needed
+# The compiled graph can be given if it was already loaded from the same file
+def load_contraction_hierarchy(path: str, graph: Optional[CompiledGraph] = None) -> ContractionHierarchy:
+    if graph is None:
+        graph = CompiledGraphRoutingProblem.from_file(path).graph
+    fingerprint = graph_file_fingerprint(path)
+    index_path = path + IndexFileSuffix
+    hierarchy = ContractionHierarchy.load(graph, index_path, fingerprint)
+    if hierarchy is None:
+        hierarchy = ContractionHierarchy.build(graph)
+        hierarchy.save(index_path, fingerprint)
+    return hierarchy
+
+
+def main(args: argparse.Namespace):
+    for path in args.graphs:
+        graph = CompiledGraphRoutingProblem.from_file(path).graph
+        start = time.time()
+        hierarchy = ContractionHierarchy.build(graph)
+        hierarchy.save(path + IndexFileSuffix, graph_file_fingerprint(path))
+        shortcuts = len(hierarchy.up_targets) + len(hierarchy.down_targets) - graph.edge_count
+        print(f"{path}: {path + IndexFileSuffix} ({len(graph)} nodes, {shortcuts} shortcuts) built in {time.time() - start} seconds")
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy indices of graph files")
+    parser.add_argument("graphs", nargs="+", help="paths to the graph files (JSON or binary)")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,114 @@
+from typing import List, Optional, Tuple
+from array import array
+import heapq, math
+
+from graph import CompiledGraph, CompiledGraphRoutingProblem, compiled_graphrouting_heuristic
+
+# This file contains the landmark (ALT: A*, Landmarks and Triangle inequality) heuristic for graph routing
+# A few nodes are chosen as landmarks and the exact distances from and to every landmark are precomputed.
+# For any landmark L, node v and goal g, the triangle inequality gives two lower bounds of the distance d(v, g):
+#   d(v, g) >= d(L, g) - d(L, v)   (since d(L, g) <= d(L, v) + d(v, g))
+#   d(v, g) >= d(v, L) - d(g, L)   (since d(v, L) <= d(v, g) + d(g, L))
+# Unlike the straight-line distance, these bounds follow the actual roads, so they stay tight on graphs with detours.
+
+# Computes the shortest path distance from the source to every node of the graph (math.inf if unreachable)
+def shortest_distances(graph: CompiledGraph, source: int) -> array:
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    distances = array('d', [math.inf]) * len(graph)
+    distances[source] = 0.0
+    frontier = [(0.0, source)]
+    while frontier:
+        distance, node = heapq.heappop(frontier)
+        # Skip the stale entries of nodes whose distance was lowered after they were pushed
+        if distance > distances[node]:
+            continue
+        for edge in range(offsets[node], offsets[node + 1]):
+            target, new_distance = targets[edge], distance + weights[edge]
+            if new_distance < distances[target]:
+                distances[target] = new_distance
+                heapq.heappush(frontier, (new_distance, target))
+    return distances
+
+# The precomputed distance tables of the landmarks of a graph
+#   landmarks: the ids of the landmarks
+#   from_landmarks[i][v]: the distance from landmark i to node v
+#   to_landmarks[i][v]: the distance from node v to landmark i (computed on the reversed graph)
+# The tables only depend on the graph, so one table can be shared by all the queries on the same graph.
+class LandmarkTable:
+    def __init__(self, landmarks: List[int], from_landmarks: List[array], to_landmarks: List[array]) -> None:
+        self.landmarks = landmarks
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+
+    # Picks "count" landmarks and computes their distance tables (2 runs of Dijkstra per landmark)
+    '''
+    Landmark selection (farthest point): the first landmark is the node farthest from the given start node,
+    then each new landmark is the node whose distance to the closest chosen landmark is the largest.
+    Landmarks on the outskirts of the graph give the tightest bounds since they lie "behind" many nodes.
+    Only the nodes reachable from the previous landmarks (in either direction) are considered.
+    '''
+    @staticmethod
+    def build(graph: CompiledGraph, count: int = 8, start: int = 0, reverse_graph: Optional[CompiledGraph] = None) -> 'LandmarkTable':
+        if reverse_graph is None:
+            reverse_graph = graph.reverse()
+        landmarks, from_landmarks, to_landmarks = [], [], []
+        # closest[v] is the distance between v and its closest landmark (in either direction)
+        closest = [math.inf] * len(graph)
+        candidate = start
+        seed = shortest_distances(graph, start)
+        for node in range(len(graph)):
+            if seed[node] != math.inf and seed[node] > seed[candidate]:
+                candidate = node
+        while len(landmarks) < min(count, len(graph)):
+            landmarks.append(candidate)
+            from_landmarks.append(shortest_distances(graph, candidate))
+            to_landmarks.append(shortest_distances(reverse_graph, candidate))
+            best, candidate = -1.0, None
+            for node in range(len(graph)):
+                distance = min(from_landmarks[-1][node], to_landmarks[-1][node])
+                if distance < closest[node]:
+                    closest[node] = distance
+                if closest[node] != math.inf and closest[node] > best and node not in landmarks:
+                    best, candidate = closest[node], node
+            if candidate is None or best <= 0:
+                break
+        return LandmarkTable(landmarks, from_landmarks, to_landmarks)
+
+    # Returns the distances needed for a goal: (from table, d(L, goal)) and (to table, d(goal, L)) for each landmark
+    def goal_terms(self, goal: int) -> Tuple[List[Tuple[array, float]], List[Tuple[array, float]]]:
+        return [(table, table[goal]) for table in self.from_landmarks], [(table, table[goal]) for table in self.to_landmarks]
+
+
+# The landmark heuristic: the largest triangle inequality bound over the landmarks and the straight-line distance
+# The landmark table is read from problem.landmarks if set (to share it between the queries on the same graph),
+# otherwise one is built with the default number of landmarks and stored in the problem cache.
+'''
+Why it is consistent: each bound is of the form d(L, g) - d(L, v) or d(v, L) - d(g, L), and for an edge (u, v) of cost c
+                      the triangle inequality gives d(L, v) <= d(L, u) + c and d(u, L) <= c + d(v, L), so every bound
+                      decreases by at most c along an edge. The maximum of consistent heuristics is consistent.
+Unreachable goals: if the goal is reachable from a landmark while the node is not, or the node cannot reach a landmark
+                   that the goal can reach, then the node cannot reach the goal and the heuristic is math.inf.
+'''
+def landmark_heuristic(problem: CompiledGraphRoutingProblem, state: int) -> float:
+    cache = problem.cache()
+    terms = cache.get("landmark_terms")
+    if terms is None:
+        table: Optional[LandmarkTable] = problem.landmarks
+        if table is None:
+            table = cache["landmarks"] = LandmarkTable.build(problem.graph, reverse_graph=problem.reverse_graph)
+        terms = cache["landmark_terms"] = table.goal_terms(problem.goal)
+    forward, backward = terms
+    best = compiled_graphrouting_heuristic(problem, state)
+    for table, goal_distance in forward:
+        distance = table[state]
+        if goal_distance == math.inf:
+            if distance != math.inf: return math.inf
+        elif distance != math.inf and goal_distance - distance > best:
+            best = goal_distance - distance
+    for table, goal_distance in backward:
+        distance = table[state]
+        if distance == math.inf:
+            if goal_distance != math.inf: return math.inf
+        elif goal_distance != math.inf and distance - goal_distance > best:
+            best = distance - goal_distance
+    return best
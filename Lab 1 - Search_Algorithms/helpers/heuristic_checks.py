@@ -4,12 +4,13 @@ from .utils import add_call_listener
 class InconsistentHeuristicException(Exception):
     pass
 
-def test_heuristic_consistency(heuristic):
+# The tolerance allows rounding errors when the costs and the heuristic are floats (e.g. euclidean distances)
+def test_heuristic_consistency(heuristic, tolerance: float = 0):
     def listener(next_state: S, problem: Problem[S, A], state: S, action: A):
         h = heuristic(problem, state)
         next_h = heuristic(problem, next_state)
         c = problem.get_cost(state, action)
-        if h - next_h > c:
+        if h - next_h > c + tolerance:
             message = f"State (heuristic = {h}):" + "\n" + str(state) + "\n"
             message += f"Action: {str(action)} (cost = {c})" + "\n"
             message += f"Next State (heuristic = {next_h}):" + "\n" + str(next_state) + "\n"
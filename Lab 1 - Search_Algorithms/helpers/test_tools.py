@@ -1,12 +1,11 @@
-from typing import List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from agents import HeuristicFunction
 from graph import GraphRoutingProblem, graphrouting_heuristic
 from sokoban import SokobanProblem, Direction
-from problem import A, S, Problem
+from problem import A, S, Problem, cached_heuristic
 from .utils import Result, fetch_recorded_calls, fetch_tracked_call_count, load_function
 from .heuristic_checks import InconsistentHeuristicException, test_heuristic_consistency
-from functools import lru_cache
-import time
+import math, time
 
 def run_parking_trajectory(
     problem: Problem[S, A],
@@ -119,7 +118,7 @@ def test_sokoban_heuristic(
     function_path: str, 
     problem: SokobanProblem) -> Tuple[float, int, str, float]:
     fetch_tracked_call_count(SokobanProblem.get_actions)
-    heuristic = lru_cache(2**16)(load_function("sokoban_heuristic.strong_heuristic"))
+    heuristic = cached_heuristic(load_function("sokoban_heuristic.strong_heuristic"))
     original_get_successor = SokobanProblem.get_successor
     SokobanProblem.get_successor = test_heuristic_consistency(heuristic)(SokobanProblem.get_successor)
     search_fn = load_function(function_path)
@@ -164,4 +163,463 @@ def compare_heuristic_for_sokoban(
         for i, (u, l) in enumerate(zip(thresholds[:-1], thresholds[1:])):
             message += '\n' + f'grade = {i+1} if {u} >= nodes > {l}'
         message += '\n' + f'grade = {len(thresholds)} if {thresholds[-1]} >= nodes'
-    return Result(grade != 0, grade, message)
\ No newline at end of file
+    return Result(grade != 0, grade, message)
+
+def run_anytime_search_for_sokoban(
+    function_path: str,
+    problem: SokobanProblem,
+    weight: float) -> List[Tuple[float, float, float]]:
+    search_fn = load_function(function_path)
+    heuristic = load_function("sokoban_heuristic.strong_heuristic")
+    initial_state = problem.get_initial_state()
+    return [(solution.cost, solution.bound, solution.weight) for solution in search_fn(problem, initial_state, heuristic, weight)]
+
+def check_anytime_bounds_for_sokoban(
+    output: List[Tuple[float, float, float]],
+    optimal_cost: float,
+    level_path: str) -> Result:
+    nl = '\n'
+    solutions = nl.join(f'- Cost: {cost}, Bound: {bound}, Weight: {weight}' for cost, bound, weight in output)
+    message = f"Level:{nl}{open(level_path, 'r').read()}{nl}Solutions:{nl}{solutions}{nl}"
+    if not output:
+        return Result(False, 0, message + "Expected at least one solution, got none")
+    for cost, bound, weight in output:
+        if bound > weight:
+            return Result(False, 0, message + f"The bound {bound} is looser than the weight {weight} of the pass")
+        if cost > bound * optimal_cost + 1e-9:
+            return Result(False, 0, message + f"The cost {cost} exceeds the bound {bound} times the optimal cost {optimal_cost}")
+    if output[-1][0] != optimal_cost:
+        return Result(False, 0, message + f"Expected the last solution to be optimal ({optimal_cost}), got {output[-1][0]}")
+    return Result(True, 1, "")
+
+def run_crate_assignment_repairs(
+    rows: int,
+    columns: int,
+    trials: int,
+    seed: int) -> List[str]:
+    import itertools, random
+    CrateAssignment = load_function("sokoban_heuristic.CrateAssignment")
+    rng = random.Random(seed)
+    infinity = 1000
+    random_row = lambda: tuple(rng.randint(0, 9) for _ in range(columns))
+    optimum = lambda costs: min(sum(costs[row][column] for row, column in enumerate(assigned))
+                                for assigned in itertools.permutations(range(columns), rows))
+    failures = []
+    for trial in range(trials):
+        crates = list(range(rows))
+        costs = [random_row() for _ in range(rows)]
+        assignment = CrateAssignment(crates, costs, infinity)
+        # Move a random crate a few times in a row, each repair starts from the previous one
+        for step in range(4):
+            row = rng.randrange(rows)
+            new = rows + trial * 4 + step
+            costs[row] = random_row()
+            repaired = assignment.copy()
+            repaired.move(crates[row], new, costs[row])
+            crates[row] = new
+            expected = optimum(costs)
+            fresh = CrateAssignment(crates, costs, infinity).cost()
+            if repaired.cost() != expected or fresh != expected:
+                failures.append(f"Costs: {costs}, Expected: {expected}, Repaired: {repaired.cost()}, Solved again: {fresh}")
+            assignment = repaired
+    return failures
+
+def check_crate_assignment_repairs(
+    output: List[str],
+    rows: int,
+    columns: int) -> Result:
+    if output:
+        nl = '\n'
+        return Result(False, 0, f"{len(output)} repairs of a {rows}x{columns} assignment are not optimal, for example:{nl}" + nl.join(output[:3]))
+    return Result(True, 1, "")
+
+
+def run_searches_for_cost(
+    problem: Problem[S, A],
+    searches: List[Tuple],
+    unit_cost: bool = False) -> List[Tuple[str, Optional[float], bool]]:
+    initial_state = problem.get_initial_state()
+    results = []
+    # Each search is (function path, heuristic path or None) optionally followed by a dictionary of keyword arguments
+    for function_path, heuristic_path, *options in searches:
+        search_fn = load_function(function_path)
+        kwargs = options[0] if options else {}
+        if heuristic_path is None:
+            solution = search_fn(problem, initial_state, **kwargs)
+        else:
+            solution = search_fn(problem, initial_state, load_function(heuristic_path), **kwargs)
+        if solution is None:
+            results.append((function_path, None, True))
+            continue
+        # Replay the solution to get its cost and to check that it really ends at a goal
+        state, total_cost = initial_state, 0
+        for action in solution:
+            total_cost += 1 if unit_cost else problem.get_cost(state, action)
+            state = problem.get_successor(state, action)
+        results.append((function_path, total_cost, problem.is_goal(state)))
+    return results
+
+def compare_search_costs(
+    output: List[Tuple[str, Optional[float], bool]],
+    expected_cost: Optional[float],
+    instance_path: str) -> Result:
+    nl = '\n'
+    cost_to_str = lambda cost: "No solution" if cost is None else str(cost)
+    results = nl.join(f'- {name}: {cost_to_str(cost)}' for name, cost, _ in output)
+    message = f"Instance: {instance_path}{nl}Expected: {cost_to_str(expected_cost)}{nl}Got:{nl}{results}"
+    for name, cost, reaches_goal in output:
+        if not reaches_goal:
+            return Result(False, 0, message + f"{nl}The solution of {name} does not end at a goal")
+        if (cost is None) != (expected_cost is None) or (cost is not None and not math.isclose(cost, expected_cost)):
+            return Result(False, 0, message)
+    return Result(True, 1, "")
+
+def run_compiled_graph_costs(problem: GraphRoutingProblem) -> List[str]:
+    compiled = load_function("graph.CompiledGraphRoutingProblem").from_problem(problem)
+    graph = compiled.graph
+    nodes = [graph.node(index) for index in range(len(graph))]
+    mismatches = []
+    # Ask for the cost of every edge right after expanding every node (so the edge cursor starts in another row)
+    # in both orders of the targets, and compare with the euclidean distance of the original problem
+    for expanded in range(len(graph)):
+        for source in range(len(graph)):
+            for targets in (list(graph.neighbors(source)), list(reversed(graph.neighbors(source)))):
+                compiled.get_actions(expanded)
+                for target in targets:
+                    cost = compiled.get_cost(source, target)
+                    expected = problem.get_cost(nodes[source], nodes[target])
+                    if not math.isclose(cost, expected):
+                        mismatches.append(f"Cost from {nodes[source]} to {nodes[target]} after expanding {nodes[expanded]} - Expected: {expected}, Got: {cost}")
+    return mismatches
+
+def check_no_mismatches(
+    output: List[str],
+    instance_path: str) -> Result:
+    if output:
+        nl = '\n'
+        return Result(False, 0, f"Instance: {instance_path}{nl}{len(output)} mismatches, for example:{nl}" + nl.join(output[:3]))
+    return Result(True, 1, "")
+
+def run_heuristic_on_decoded_states(
+    problem: Problem[S, A],
+    reference: SokobanProblem,
+    heuristic_path: str,
+    state_count: int) -> List[str]:
+    heuristic = load_function(heuristic_path)
+    # Visit the first states in BFS order and compare the heuristic on each state with its value on the decoded state
+    initial_state = problem.get_initial_state()
+    visited, frontier = {initial_state}, [initial_state]
+    mismatches = []
+    for state in frontier:
+        if len(frontier) >= state_count:
+            break
+        for action in problem.get_actions(state):
+            child = problem.get_successor(state, action)
+            if child not in visited:
+                visited.add(child)
+                frontier.append(child)
+    for state in frontier[:state_count]:
+        value, expected = heuristic(problem, state), heuristic(reference, state.decode())
+        if value != expected:
+            mismatches.append(f"State:\n{state}\nExpected: {expected}, Got: {value}")
+    return mismatches
+
+def with_deadlock_pruning(problem: SokobanProblem) -> SokobanProblem:
+    problem.prune_dead_squares = True
+    problem.prune_freeze_deadlocks = True
+    return problem
+
+def run_push_search_as_steps(
+    problem: Problem[S, A],
+    reference: SokobanProblem,
+    function_path: str,
+    heuristic_path: Optional[str]) -> List[Tuple[str, Optional[float], bool]]:
+    search_fn = load_function(function_path)
+    initial_state = problem.get_initial_state()
+    solution = search_fn(problem, initial_state) if heuristic_path is None else search_fn(problem, initial_state, load_function(heuristic_path))
+    if solution is None:
+        return [(function_path, None, True)]
+    # Replay the pushes on the push-level problem, then their steps on the step-level problem
+    state, push_cost = initial_state, 0
+    for action in solution:
+        push_cost += problem.get_cost(state, action)
+        state = problem.get_successor(state, action)
+    reference_state, step_cost = reference.get_initial_state(), 0
+    for step in problem.to_steps(solution):
+        if step not in reference.get_actions(reference_state):
+            return [(f"{function_path} (steps)", None, False)]
+        step_cost += reference.get_cost(reference_state, step)
+        reference_state = reference.get_successor(reference_state, step)
+    return [(f"{function_path} (pushes)", push_cost, problem.is_goal(state)),
+            (f"{function_path} (steps)", step_cost, reference.is_goal(reference_state))]
+
+def with_pattern_database(problem: SokobanProblem) -> SokobanProblem:
+    # Build the pattern database of the layout if it is missing, so pattern_database_heuristic does not fall back
+    load_pattern_database = load_function("sokoban_pdb.load_pattern_database")
+    load_pattern_database(problem.layout, load_function("sokoban_heuristic.PatternDatabaseSize"), build=True)
+    return problem
+
+def run_search_with_consistency_check(
+    problem: Problem[S, A],
+    function_path: str,
+    heuristic_path: str,
+    tolerance: float = 0) -> Tuple[Optional[float], str]:
+    heuristic = load_function(heuristic_path)
+    # Patch get_successor on the class that defines it, so subclasses of the problem are checked too
+    owner = next(cls for cls in type(problem).__mro__ if "get_successor" in vars(cls))
+    original_get_successor = owner.get_successor
+    owner.get_successor = test_heuristic_consistency(heuristic, tolerance)(original_get_successor)
+    search_fn = load_function(function_path)
+    initial_state = problem.get_initial_state()
+    try:
+        path = search_fn(problem, initial_state, heuristic)
+    except InconsistentHeuristicException as err:
+        return None, "Heuristic is inconsistent:\n" + str(err)
+    finally:
+        owner.get_successor = original_get_successor
+    if path is None:
+        return None, ""
+    path_cost, state = 0, initial_state
+    for action in path:
+        path_cost += problem.get_cost(state, action)
+        state = problem.get_successor(state, action)
+    goal_h = heuristic(problem, state)
+    if goal_h != 0:
+        return path_cost, f"Expected Heuristic at goal to be 0, got {goal_h}" + "\nGoal State:\n" + str(state)
+    return path_cost, ""
+
+def compare_consistent_search_cost(
+    output: Tuple[Optional[float], str],
+    expected_cost: Optional[float],
+    instance_path: str) -> Result:
+    path_cost, message = output
+    if message:
+        return Result(False, 0, f"Instance: {instance_path}\n{message}")
+    if (path_cost is None) != (expected_cost is None) or (path_cost is not None and not math.isclose(path_cost, expected_cost)):
+        return Result(False, 0, f"Instance: {instance_path}\nPath Cost - Expected: {expected_cost}, Got: {path_cost}")
+    return Result(True, 1, "")
+
+def with_zobrist_hashing(problem: Problem[S, A]) -> Problem[S, A]:
+    problem.zobrist_hashing = True
+    return problem
+
+def run_zobrist_hash_checks(problem: Problem[S, A], state_count: int) -> List[str]:
+    problem.zobrist_hashing = True
+    width, keys = problem.width, problem.zobrist_keys
+    # Visit the first states in BFS order, every child hash is updated incrementally from its parent
+    initial_state = problem.get_initial_state()
+    visited, frontier = {initial_state}, [initial_state]
+    for state in frontier:
+        if len(frontier) >= state_count:
+            break
+        for action in problem.get_actions(state):
+            child = problem.get_successor(state, action)
+            if child not in visited:
+                visited.add(child)
+                frontier.append(child)
+    mismatches = []
+    for state in frontier:
+        expected = 0
+        for car_index, position in enumerate(state):
+            expected ^= keys[car_index][position.y * width + position.x]
+        if state.zobrist != expected:
+            mismatches.append(f"State: {tuple(state)} - Expected hash: {expected}, Got: {state.zobrist}")
+        if state == tuple(state) or tuple(state) == state:
+            mismatches.append(f"State: {tuple(state)} - A Zobrist state must not be equal to a plain tuple")
+    # The Zobrist states must be deduplicated exactly like the plain tuples
+    distinct = len({tuple(state) for state in frontier})
+    if distinct != len(frontier):
+        mismatches.append(f"The BFS visited {len(frontier)} Zobrist states but only {distinct} distinct positions")
+    return mismatches
+
+def run_batch_heuristic_checks(
+    problem: Problem[S, A],
+    heuristic_paths: List[str],
+    state_count: int) -> List[str]:
+    heuristics = [(path, heuristic, cached_heuristic(heuristic)) for path, heuristic in ((path, load_function(path)) for path in heuristic_paths)]
+    # Evaluate the children of each state in BFS order as one batch (as the searches do), with and without the cache,
+    # and compare with the values of the heuristic on each child
+    initial_state = problem.get_initial_state()
+    visited, frontier = {initial_state}, [initial_state]
+    mismatches = []
+    for state in frontier:
+        if len(visited) >= state_count:
+            break
+        children = [problem.get_successor(state, action) for action in problem.get_actions(state)]
+        for path, heuristic, cached in heuristics:
+            expected = [heuristic(problem, child) for child in children]
+            for name, batch in (("batch", heuristic.batch), ("cached batch", cached.batch)):
+                values = list(batch(problem, children))
+                if values != expected:
+                    mismatches.append(f"State:\n{state}\n{path} of the children - Expected: {expected}, Got ({name}): {values}")
+        for child in children:
+            if child not in visited:
+                visited.add(child)
+                frontier.append(child)
+    return mismatches
+
+def run_binary_graph_round_trip(problem: GraphRoutingProblem) -> List[str]:
+    import os, tempfile
+    CompiledGraphRoutingProblem = load_function("graph.CompiledGraphRoutingProblem")
+    search_fn = load_function("search.UniformCostSearch")
+    compiled = CompiledGraphRoutingProblem.from_problem(problem)
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        path, copy_path = os.path.join(directory, "graph.bin"), os.path.join(directory, "copy.bin")
+        compiled.save(path)
+        loaded = CompiledGraphRoutingProblem.from_file(path)
+        for name in ("names", "xs", "ys", "offsets", "targets", "weights"):
+            expected, got = list(getattr(compiled.graph, name)), list(getattr(loaded.graph, name))
+            if expected != got:
+                mismatches.append(f"{name} - Expected: {expected}, Got: {got}")
+        if (loaded.start, loaded.goal) != (compiled.start, compiled.goal):
+            mismatches.append(f"Start and goal - Expected: {(compiled.start, compiled.goal)}, Got: {(loaded.start, loaded.goal)}")
+        # Saving the mapped graph again must write the same bytes
+        loaded.save(copy_path)
+        with open(path, "rb") as original, open(copy_path, "rb") as copy:
+            if original.read() != copy.read():
+                mismatches.append("Saving the loaded graph again wrote different bytes")
+        expected, got = compiled.to_names(search_fn(compiled, compiled.start)), loaded.to_names(search_fn(loaded, loaded.start))
+        if expected != got:
+            mismatches.append(f"UCS path - Expected: {expected}, Got: {got}")
+        del loaded
+    return mismatches
+
+def ucs_costs_between_all_pairs(problem: GraphRoutingProblem) -> Dict[Tuple[str, str], Optional[float]]:
+    search_fn = load_function("search.UniformCostSearch")
+    costs = {}
+    for start in problem.adjacency:
+        for goal in problem.adjacency:
+            pair_problem = GraphRoutingProblem(start, goal, problem.adjacency, problem.reverse_adjacency)
+            path = search_fn(pair_problem, start)
+            if path is None:
+                costs[(start.name, goal.name)] = None
+                continue
+            total_cost, state = 0, start
+            for action in path:
+                total_cost += pair_problem.get_cost(state, action)
+                state = action
+            costs[(start.name, goal.name)] = total_cost
+    return costs
+
+def compare_path_cost(problem: GraphRoutingProblem, start: str, goal: str, path: Optional[List[str]], expected: Optional[float]) -> Optional[str]:
+    nodes = {node.name: node for node in problem.adjacency}
+    total_cost = None
+    if path is not None:
+        total_cost, state = 0, nodes[start]
+        for name in path:
+            if nodes[name] not in problem.adjacency[state]:
+                return f"From {start} to {goal} - The path {path} uses a missing edge into {name}"
+            total_cost += problem.get_cost(state, nodes[name])
+            state = nodes[name]
+        if state.name != goal:
+            return f"From {start} to {goal} - The path {path} does not end at the goal"
+    if (total_cost is None) != (expected is None) or (total_cost is not None and not math.isclose(total_cost, expected)):
+        return f"From {start} to {goal} - Expected: {expected}, Got: {total_cost} (path: {path})"
+    return None
+
+def run_all_pairs_for_cost(
+    problem: GraphRoutingProblem,
+    searches: List[Tuple]) -> List[str]:
+    CompiledGraphRoutingProblem = load_function("graph.CompiledGraphRoutingProblem")
+    graph = CompiledGraphRoutingProblem.from_problem(problem).graph
+    mismatches = []
+    # Run the searches on the compiled problem of every (start, goal) pair and compare with UCS on the original problem
+    for (start, goal), expected in ucs_costs_between_all_pairs(problem).items():
+        pair_problem = CompiledGraphRoutingProblem.from_names(graph, start, goal)
+        for function_path, heuristic_path, *options in searches:
+            search_fn = load_function(function_path)
+            kwargs = options[0] if options else {}
+            if heuristic_path is None:
+                path = search_fn(pair_problem, pair_problem.start, **kwargs)
+            else:
+                path = search_fn(pair_problem, pair_problem.start, load_function(heuristic_path), **kwargs)
+            mismatch = compare_path_cost(problem, start, goal, pair_problem.to_names(path), expected)
+            if mismatch is not None:
+                mismatches.append(f"{function_path}: {mismatch}")
+    return mismatches
+
+def run_contraction_hierarchy_pairs(graph_path: str) -> List[str]:
+    import os, shutil, tempfile
+    load_contraction_hierarchy = load_function("graph_hierarchy.load_contraction_hierarchy")
+    CompiledGraphRoutingProblem = load_function("graph.CompiledGraphRoutingProblem")
+    problem = GraphRoutingProblem.from_file(graph_path)
+    expected_costs = ucs_costs_between_all_pairs(problem)
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        # Work on a copy of the graph file since the index is stored next to it
+        path = os.path.join(directory, os.path.basename(graph_path))
+        shutil.copyfile(graph_path, path)
+        built = load_contraction_hierarchy(path)
+        if not os.path.exists(path + load_function("graph_hierarchy.IndexFileSuffix")):
+            mismatches.append("The index file was not saved next to the graph file")
+        loaded = load_contraction_hierarchy(path)
+        # Solve every pair with both hierarchies, on the original and on the compiled problem
+        nodes = {node.name: node for node in problem.adjacency}
+        for name, hierarchy in (("built", built), ("loaded", loaded)):
+            for (start, goal), expected in expected_costs.items():
+                pair_problem = GraphRoutingProblem(nodes[start], nodes[goal], problem.adjacency, problem.reverse_adjacency)
+                path_nodes = hierarchy.solve(pair_problem)
+                compiled = CompiledGraphRoutingProblem.from_names(hierarchy.graph, start, goal)
+                for kind, names in (("GraphRoutingProblem", None if path_nodes is None else [node.name for node in path_nodes]),
+                                    ("CompiledGraphRoutingProblem", compiled.to_names(hierarchy.solve(compiled)))):
+                    mismatch = compare_path_cost(problem, start, goal, names, expected)
+                    if mismatch is not None:
+                        mismatches.append(f"{name} hierarchy on {kind}: {mismatch}")
+    return mismatches
+
+def run_route_many_pairs(
+    graph_path: str,
+    processes: int,
+    use_hierarchy: bool) -> List[str]:
+    import os, shutil, sys, tempfile
+    route_many = load_function("graph_batch.route_many")
+    module = sys.modules[route_many.__module__]
+    problem = GraphRoutingProblem.from_file(graph_path)
+    expected_costs = ucs_costs_between_all_pairs(problem)
+    names = sorted(node.name for node in problem.adjacency)
+    # All the pairs at once (grouped by start), then one query per start for each offset (solved as single queries)
+    batches = [list(expected_costs)]
+    batches += [[(start, names[(index + offset) % len(names)]) for index, start in enumerate(names)] for offset in range(len(names))]
+    mismatches = []
+    # Let the pool solve the single queries even though the shipped graphs are small
+    original_threshold = module.PoolThreshold
+    module.PoolThreshold = 0
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            # Work on a copy of the graph file since the index is stored next to it
+            path = os.path.join(directory, os.path.basename(graph_path))
+            shutil.copyfile(graph_path, path)
+            for queries in batches:
+                for (start, goal), solution in zip(queries, route_many(path, queries, processes, use_hierarchy)):
+                    mismatch = compare_path_cost(problem, start, goal, solution, expected_costs[(start, goal)])
+                    if mismatch is not None:
+                        mismatches.append(mismatch)
+            if use_hierarchy and not os.path.exists(path + load_function("graph_hierarchy.IndexFileSuffix")):
+                mismatches.append("The index file was not saved next to the graph file")
+    finally:
+        module.PoolThreshold = original_threshold
+    return mismatches
+
+def run_consistency_over_states(
+    problem: Problem[S, A],
+    heuristic_path: str,
+    state_count: int) -> List[str]:
+    heuristic = load_function(heuristic_path)
+    # Check every edge out of the first states in BFS order, and that the heuristic is 0 on the goals
+    initial_state = problem.get_initial_state()
+    visited, frontier = {initial_state}, [initial_state]
+    mismatches = []
+    for state in frontier[:state_count]:
+        h = heuristic(problem, state)
+        if problem.is_goal(state) and h != 0:
+            mismatches.append(f"State:\n{state}\nExpected Heuristic at goal to be 0, got {h}")
+        for action in problem.get_actions(state):
+            child = problem.get_successor(state, action)
+            cost, next_h = problem.get_cost(state, action), heuristic(problem, child)
+            if h - next_h > cost:
+                mismatches.append(f"State:\n{state}\nAction: {action} (cost = {cost})\nh(state) - h(next state) = {h} - {next_h} > {cost}")
+            if child not in visited:
+                visited.add(child)
+                frontier.append(child)
+    return mismatches
@@ -1,8 +1,18 @@
 from dataclasses import dataclass
 from enum import IntEnum
-from typing import Iterator
+from typing import Iterator, List, Sequence
 import math
 
+# NumPy is optional: when it is installed, the batch helpers below use it to compute many distances at once,
+# otherwise (np is None) they fall back to plain Python loops that return the same values.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Below this number of distances, converting the points to arrays costs more than what vectorizing saves
+VectorizeThreshold = 32
+
 # the class Point will hold a 2D coordinate on a discrete grid
 # We use dataclass with frozen=True to automatically implement:
 #   the constructor, the == operator, the hash function and to make the class immutable
@@ -32,6 +42,11 @@ class Point:
     def __iter__(self) -> Iterator[int]:
         return iter((self.x, self.y))
 
+    # Frozen dataclasses with __slots__ cannot be unpickled by assigning their fields,
+    # so we tell pickle to rebuild the point via the constructor (needed to send points to other processes)
+    def __reduce__(self):
+        return (Point, (self.x, self.y))
+
 # This is a helper function to compute the manhattan distance between 2 points
 def manhattan_distance(p1: Point, p2: Point) -> int:
     return abs(p1.x - p2.x) + abs(p1.y - p2.y)
@@ -41,6 +56,31 @@ def euclidean_distance(p1: Point, p2: Point) -> int:
     difference = p1 - p2
     return math.sqrt(difference.x * difference.x + difference.y * difference.y)
 
+# Computes the euclidean distance from each point to the target (the same values as euclidean_distance)
+def euclidean_distances(points: Sequence[Point], target: Point) -> List[float]:
+    if np is None or not points or len(points) < VectorizeThreshold:
+        return [euclidean_distance(point, target) for point in points]
+    dx = np.array([point.x for point in points], dtype=np.float64) - target.x
+    dy = np.array([point.y for point in points], dtype=np.float64) - target.y
+    return np.sqrt(dx * dx + dy * dy).tolist()
+
+# Computes the manhattan distance between the points with the same index in the two sequences
+def paired_manhattan_distances(first: Sequence[Point], second: Sequence[Point]) -> List[int]:
+    if np is None or not first or len(first) < VectorizeThreshold:
+        return [manhattan_distance(p1, p2) for p1, p2 in zip(first, second)]
+    dx = np.array([point.x for point in first]) - np.array([point.x for point in second])
+    dy = np.array([point.y for point in first]) - np.array([point.y for point in second])
+    return (np.abs(dx) + np.abs(dy)).tolist()
+
+# Computes the manhattan distance between every pair of points from the two sequences
+# The result is indexed by [index in the first sequence][index in the second sequence]
+def manhattan_distances(first: Sequence[Point], second: Sequence[Point]) -> List[List[int]]:
+    if np is None or not first or not second or len(first) * len(second) < VectorizeThreshold:
+        return [[manhattan_distance(p1, p2) for p2 in second] for p1 in first]
+    dx = np.array([point.x for point in first])[:, None] - np.array([point.x for point in second])[None, :]
+    dy = np.array([point.y for point in first])[:, None] - np.array([point.y for point in second])[None, :]
+    return (np.abs(dx) + np.abs(dy)).tolist()
+
 # This enum represent 4 directions (RIGHT, UP, LEFT, RIGHT)
 class Direction(IntEnum):
     RIGHT = 0
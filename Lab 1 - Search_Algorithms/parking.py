@@ -2,19 +2,51 @@ from typing import Any, Dict, Set, Tuple, List
 from problem import Problem
 from mathutils import Direction, Point
 from helpers.utils import NotImplemented
+from zobrist import make_zobrist_keys
 
 ParkingState = Any
 ParkingAction = Tuple[int, Direction]
 
+# A parking state (a tuple of car positions) that stores its Zobrist hash (see zobrist.py)
+# It is used when ParkingProblem.zobrist_hashing is enabled: get_successor updates the hash of the parent
+# with two XORs (the moved car leaves its old position and enters the new one) instead of hashing the whole tuple.
+# It is still a tuple, so it can be indexed like the regular state.
+# (tuple subclasses cannot have __slots__, so the hash is stored in the instance dictionary)
+# It is only equal to other Zobrist states: a plain tuple with the same positions hashes differently,
+# so treating them as equal would break the hash/equality contract of the dictionaries and sets that hold both.
+class ZobristParkingState(tuple):
+    zobrist: int
+
+    def __hash__(self) -> int:
+        return self.zobrist
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not ZobristParkingState:
+            return False
+        return self.zobrist == other.zobrist and tuple.__eq__(self, other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self.__eq__(other)
+
 class ParkingProblem(Problem[ParkingState, ParkingAction]):
     passages: Set[Point]
     cars: Tuple[Point]
     slots: Dict[Point, int]
     width: int
     height: int
+    # If true, the states are ZobristParkingState whose hashes are updated incrementally by get_successor
+    zobrist_hashing: bool = False
+    # The Zobrist key of each car on each position, indexed by [car index][y * width + x]
+    zobrist_keys: List[Tuple[int, ...]]
 
     def get_initial_state(self) -> ParkingState:
         # Return the initial state of the parking problem, which is the initial positions of the cars.
+        if self.zobrist_hashing:
+            state = ZobristParkingState(self.cars)
+            state.zobrist = 0
+            for car_index, car_position in enumerate(self.cars):
+                state.zobrist ^= self.zobrist_keys[car_index][car_position.y * self.width + car_position.x]
+            return state
         return self.cars
     
     def is_goal(self, state: ParkingState) -> bool:
@@ -63,6 +95,13 @@ class ParkingProblem(Problem[ParkingState, ParkingAction]):
         
         # Update the position of the car in the new state.
         new_state[car_index] = new_position
+
+        # If enabled, update the hash of the parent state: the car leaves its old position and enters the new one.
+        if self.zobrist_hashing:
+            keys, width = self.zobrist_keys[car_index], self.width
+            successor = ZobristParkingState(new_state)
+            successor.zobrist = state.zobrist ^ keys[car_position.y * width + car_position.x] ^ keys[new_position.y * width + new_position.x]
+            return successor
         
         # Return the new state as a tuple.
         return tuple(new_state)
@@ -113,10 +152,121 @@ class ParkingProblem(Problem[ParkingState, ParkingAction]):
         problem.slots = {position:index for index, position in slots.items()}
         problem.width = width
         problem.height = height
+        keys = make_zobrist_keys((car_index, y, x) for car_index in range(len(cars)) for y in range(height) for x in range(width))
+        problem.zobrist_keys = [
+            tuple(keys[(car_index, y, x)] for y in range(height) for x in range(width))
+            for car_index in range(len(cars))
+        ]
         return problem
 
     # Read a parking problem from file containing a grid of tiles
     @staticmethod
     def from_file(path: str) -> 'ParkingProblem':
         with open(path, 'r') as f:
-            return ParkingProblem.from_text(f.read())
\ No newline at end of file
+            return ParkingProblem.from_text(f.read())
+
+# The directions in the order in which get_actions tries them (same as iterating over Direction)
+AllDirections = tuple(Direction)
+
+# The compiled parking state is a tuple of ints: the cell index of each car followed by the occupancy bitmask
+#   state[car_index]: the index of the car's cell in CompiledParkingProblem.cells
+#   state[-1]: an integer where bit i is set if there is a car on the cell cells[i]
+# The occupancy is fully determined by the car cells, so it does not change which states are equal,
+# but it lets get_actions check if a cell is free with a single "and" instead of scanning the car positions.
+# Hashing and comparing a tuple of small ints is also much cheaper than a tuple of points.
+CompiledParkingState = Tuple[int, ...]
+
+# This is the parking problem on the compiled representation
+# It has the same actions (in the same order), costs and solutions as ParkingProblem, but the states are CompiledParkingState
+# The precomputed tables are:
+#   cells: the passages indexed from 0 to N-1 (in row-major order) and cell_index: the index of each passage
+#   moves[car_index][cell]: the actions of the car from the cell with the bit of the target cell,
+#                           as a tuple of (action, target bit) for the directions that do not lead to a wall
+#   targets[cell][direction]: the index of the neighboring cell (or -1 if it is a wall)
+#   slot_owners[cell]: the index of the car whose slot is on the cell (or -1 if the cell is not a slot)
+#   goal_cells: the (car index, slot cell) pairs that must all hold in a goal state
+class CompiledParkingProblem(ParkingProblem):
+    cells: Tuple[Point, ...]
+    cell_index: Dict[Point, int]
+    moves: Tuple[Tuple[Tuple[Tuple[ParkingAction, int], ...], ...], ...]
+    targets: Tuple[Tuple[int, ...], ...]
+    slot_owners: Tuple[int, ...]
+    goal_cells: Tuple[Tuple[int, int], ...]
+
+    def get_initial_state(self) -> CompiledParkingState:
+        return self.encode(self.cars)
+
+    def is_goal(self, state: CompiledParkingState) -> bool:
+        for car_index, cell in self.goal_cells:
+            if state[car_index] != cell:
+                return False
+        return True
+
+    def get_actions(self, state: CompiledParkingState) -> List[ParkingAction]:
+        occupied, moves = state[-1], self.moves
+        # Every car tries its precomputed moves and keeps the ones whose target cell is free
+        return [action for car_index in range(len(moves)) for action, bit in moves[car_index][state[car_index]] if not occupied & bit]
+
+    def get_successor(self, state: CompiledParkingState, action: ParkingAction) -> CompiledParkingState:
+        car_index, direction = action
+        cell = state[car_index]
+        target = self.targets[cell][direction]
+        if target < 0 or state[-1] >> target & 1:
+            # If we try to move a car into a wall or another car, then this action is wrong
+            raise Exception(f"Invalid action {action} in state: {self.decode(state)}")
+        new_state = list(state)
+        new_state[car_index] = target
+        new_state[-1] ^= (1 << cell) | (1 << target)
+        return tuple(new_state)
+
+    def get_cost(self, state: CompiledParkingState, action: ParkingAction) -> float:
+        car_index, direction = action
+        owner = self.slot_owners[self.targets[state[car_index]][direction]]
+        # Entering the slot of another car costs an additional 100
+        return 26 - car_index + (100 if owner >= 0 and owner != car_index else 0)
+
+    # Converts car positions (a regular parking state) to the compiled state
+    def encode(self, positions: Tuple[Point, ...]) -> CompiledParkingState:
+        cells = [self.cell_index[position] for position in positions]
+        occupied = 0
+        for cell in cells:
+            occupied |= 1 << cell
+        return tuple(cells) + (occupied,)
+
+    # Converts the compiled state back to the car positions (a regular parking state)
+    def decode(self, state: CompiledParkingState) -> Tuple[Point, ...]:
+        return tuple(self.cells[cell] for cell in state[:-1])
+
+    # Compile a regular parking problem
+    @staticmethod
+    def from_problem(problem: ParkingProblem) -> 'CompiledParkingProblem':
+        compiled = CompiledParkingProblem()
+        compiled.passages, compiled.cars, compiled.slots = problem.passages, problem.cars, problem.slots
+        compiled.width, compiled.height, compiled.zobrist_keys = problem.width, problem.height, problem.zobrist_keys
+        compiled.cells = cells = tuple(sorted(problem.passages, key=lambda point: (point.y, point.x)))
+        compiled.cell_index = cell_index = {point: index for index, point in enumerate(cells)}
+        compiled.targets = targets = tuple(
+            tuple(cell_index.get(point + direction.to_vector(), -1) for direction in AllDirections)
+            for point in cells
+        )
+        compiled.moves = tuple(
+            tuple(
+                tuple(((car_index, direction), 1 << target[direction]) for direction in AllDirections if target[direction] >= 0)
+                for target in targets
+            )
+            for car_index in range(len(problem.cars))
+        )
+        compiled.slot_owners = tuple(problem.slots.get(point, -1) for point in cells)
+        compiled.goal_cells = tuple(sorted((car_index, cell_index[point]) for point, car_index in problem.slots.items()))
+        return compiled
+
+    # Read a parking problem from text containing a grid of tiles
+    @staticmethod
+    def from_text(text: str) -> 'CompiledParkingProblem':
+        return CompiledParkingProblem.from_problem(ParkingProblem.from_text(text))
+
+    # Read a parking problem from file containing a grid of tiles
+    @staticmethod
+    def from_file(path: str) -> 'CompiledParkingProblem':
+        with open(path, 'r') as f:
+            return CompiledParkingProblem.from_text(f.read())
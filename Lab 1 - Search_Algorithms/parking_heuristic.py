@@ -0,0 +1,67 @@
+from typing import List, Tuple, Union
+import heapq, math
+
+from parking import CompiledParkingProblem, ParkingProblem, ParkingState
+
+# This file contains the heuristic for the parking problem
+# Each car is solved on its own (as if the other cars were not there): the cost of a car is the cheapest way to drive it
+# from its cell to its slot, where every step costs 26 - car_index plus 100 if the step enters the slot of another car.
+# The heuristic is the sum of these costs over the cars that have a slot.
+
+# Computes the parking cost table of a car: costs[cell] is the cheapest single-car cost from the cell to the car's slot
+# (math.inf if the slot cannot be reached). The tables are indexed by the compiled cell indices.
+'''
+How: a Dijkstra search that starts from the slot and walks the moves backwards.
+     The cost of a move only depends on the cell it enters, so moving from u into v costs step_cost(v),
+     and the cost of u is the minimum over its neighbors v of step_cost(v) + cost(v).
+     When every step costs the same (no slot of another car is in the way), this is the BFS distance times 26 - car_index.
+'''
+def parking_costs(problem: CompiledParkingProblem, car_index: int, slot: int) -> Tuple[float, ...]:
+    step, owners, targets = 26 - car_index, problem.slot_owners, problem.targets
+    def step_cost(cell: int) -> float:
+        owner = owners[cell]
+        return step + (100 if owner >= 0 and owner != car_index else 0)
+    costs = [math.inf] * len(problem.cells)
+    costs[slot] = 0
+    frontier = [(0, slot)]
+    while frontier:
+        cost, cell = heapq.heappop(frontier)
+        if cost > costs[cell]: continue
+        entered = cost + step_cost(cell)
+        for neighbor in targets[cell]:
+            if neighbor >= 0 and entered < costs[neighbor]:
+                costs[neighbor] = entered
+                heapq.heappush(frontier, (entered, neighbor))
+    return tuple(costs)
+
+# Returns the compiled version of the problem and the cost table of each car that has a slot (cached in the problem)
+def parking_tables(problem: ParkingProblem) -> Tuple[CompiledParkingProblem, List[Tuple[int, Tuple[float, ...]]]]:
+    cache = problem.cache()
+    tables = cache.get("parking_costs")
+    if tables is None:
+        compiled = problem if isinstance(problem, CompiledParkingProblem) else CompiledParkingProblem.from_problem(problem)
+        tables = cache["parking_costs"] = (compiled, [
+            (car_index, parking_costs(compiled, car_index, slot)) for car_index, slot in compiled.goal_cells
+        ])
+    return tables
+
+# The parking heuristic: the sum of the single-car parking costs (see parking_costs)
+# It works on both ParkingProblem (the states are car positions) and CompiledParkingProblem (the states are cell indices)
+'''
+Why it is admissible: every car must reach its slot, and the moves of a car cost the same whatever the other cars do,
+                      so each car pays at least its single-car cost. The moves of different cars are different actions,
+                      so the costs of the cars add up.
+Why it is consistent: an action moves a single car into a neighboring cell, so only the term of that car changes,
+                      and by the triangle inequality it decreases by at most the cost of the move.
+'''
+def parking_heuristic(problem: ParkingProblem, state: Union[ParkingState, Tuple[int, ...]]) -> float:
+    compiled, tables = parking_tables(problem)
+    total = 0
+    if problem is compiled:
+        for car_index, costs in tables:
+            total += costs[state[car_index]]
+    else:
+        cell_index = compiled.cell_index
+        for car_index, costs in tables:
+            total += costs[cell_index[state[car_index]]]
+    return total
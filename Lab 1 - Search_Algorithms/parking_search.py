@@ -0,0 +1,137 @@
+from typing import Dict, FrozenSet, List, Optional, Sequence
+
+from parking import CompiledParkingProblem, CompiledParkingState, ParkingAction, ParkingProblem, ParkingState
+from parking_heuristic import parking_heuristic
+from search import AStarSearch
+
+# This file contains a multi-agent solver for the parking problem based on independence detection
+# The parking problem is a multi-agent path finding problem: every car is an agent that must reach its slot.
+# Most cars do not get in the way of each other, so instead of searching the joint state space of all the cars,
+# the cars are split into groups that are planned separately, and two groups are only merged (and planned jointly)
+# when their plans collide.
+
+# The parking problem restricted to a group of cars: the other cars are removed from the parking, or they stand still
+# as obstacles (when "cells" is given to from_problem, every car starts on its cell and the other cars block the group).
+# The states still store a cell for every car (so the actions keep the car indices of the full problem),
+# but the cars outside the group have no moves.
+# The costs are unchanged: entering the slot of any other car (even outside the group) still costs an additional 100.
+class ParkingGroupProblem(CompiledParkingProblem):
+    group: FrozenSet[int]
+    initial_state: CompiledParkingState
+
+    def get_initial_state(self) -> CompiledParkingState:
+        return self.initial_state
+
+    # Creates the problem of the given group from a compiled parking problem
+    @staticmethod
+    def from_problem(problem: CompiledParkingProblem, group: FrozenSet[int], cells: Optional[Sequence[int]] = None) -> 'ParkingGroupProblem':
+        restricted = ParkingGroupProblem()
+        # Share the tables of the full problem (but not its cache, since the heuristic tables depend on the goals)
+        restricted.__dict__.update({key: value for key, value in problem.__dict__.items() if key != "_cache"})
+        restricted.group = group
+        no_moves = ((),) * len(problem.cells)
+        restricted.moves = tuple(moves if car_index in group else no_moves for car_index, moves in enumerate(problem.moves))
+        restricted.goal_cells = tuple((car_index, cell) for car_index, cell in problem.goal_cells if car_index in group)
+        if cells is None:
+            cells = problem.encode(problem.cars)[:-1]
+            occupied = [cells[car_index] for car_index in group]
+        else:
+            occupied = cells
+        mask = 0
+        for cell in occupied:
+            mask |= 1 << cell
+        restricted.initial_state = tuple(cells) + (mask,)
+        return restricted
+
+# Plays the plan of a group while the other cars stand on the given cells
+# Returns the index of the first car the plan runs into (None if the plan can be executed)
+def find_blocker(problem: CompiledParkingProblem, cells: List[int], plan: List[ParkingAction]) -> Optional[int]:
+    occupants = {cell: car_index for car_index, cell in enumerate(cells)}
+    for car_index, direction in plan:
+        target = problem.targets[cells[car_index]][direction]
+        if target in occupants:
+            return occupants[target]
+        del occupants[cells[car_index]]
+        occupants[target] = car_index
+        cells[car_index] = target
+    return None
+
+# Solves a parking problem with independence detection and returns an optimal solution (None if there is none)
+# It works on ParkingProblem and CompiledParkingProblem; the solution uses the same actions as the other search functions.
+'''
+How: every car starts in its own group and each group is planned optimally with A* (using parking_heuristic)
+     as if the other cars were not there. Then the group plans are played one after the other: a group whose plan
+     can be played while the other cars stand still (on their initial cells, or on their final cells if their group
+     was already played) is played next. If no group can be played, the first one is merged with the group of the car
+     that blocks it, the merged group is planned jointly, and the ordering starts again.
+     Before merging, the blocked group is planned again with the other cars standing still as obstacles.
+     If this plan is as cheap as the previous one, it replaces it and the groups stay separate.
+Why it is optimal: the cost of an action only depends on the car that moves and the cell it enters, so the cost of
+                   a solution is the sum of the costs of the moves of each group. The plan of each group is optimal
+                   for the parking without the other cars, which is a relaxation, so the sum of the group costs is a lower
+                   bound of the optimal cost. The played plans reach it, so they are optimal.
+Inside a group: every action moves a single car by one cell, so the search already expands one car's move at a time
+                (the operator decomposition of simultaneous-move formulations). There are no intermediate states to add.
+'''
+def IndependenceDetectionSearch(problem: ParkingProblem, initial_state: Optional[ParkingState] = None) -> Optional[List[ParkingAction]]:
+    compiled = CompiledParkingProblem.from_problem(problem)
+    if initial_state is not None:
+        # The initial state is given in the representation of the problem (car positions or a compiled state)
+        compiled.cars = problem.decode(initial_state) if isinstance(problem, CompiledParkingProblem) else tuple(initial_state)
+    initial = compiled.get_initial_state()
+    car_count = len(compiled.cars)
+    group_of: List[FrozenSet[int]] = [frozenset([car_index]) for car_index in range(car_count)]
+    plans: Dict[FrozenSet[int], List[ParkingAction]] = {}
+    plan_costs: Dict[FrozenSet[int], float] = {}
+
+    # The cost of a plan of a group (from the initial cells of its cars)
+    def cost(problem: ParkingGroupProblem, plan: List[ParkingAction]) -> float:
+        state, total = problem.get_initial_state(), 0
+        for action in plan:
+            total += problem.get_cost(state, action)
+            state = problem.get_successor(state, action)
+        return total
+
+    def plan(group: FrozenSet[int]) -> Optional[List[ParkingAction]]:
+        if group not in plans:
+            restricted = ParkingGroupProblem.from_problem(compiled, group)
+            solution = AStarSearch(restricted, restricted.get_initial_state(), parking_heuristic)
+            if solution is None:
+                return None
+            plans[group], plan_costs[group] = solution, cost(restricted, solution)
+        return plans[group]
+
+    while True:
+        groups = sorted(set(group_of), key=min)
+        for group in groups:
+            if plan(group) is None:
+                # The group cannot be solved even without the other cars
+                return None
+        cells = list(initial[:-1])
+        remaining = list(groups)
+        solution: List[ParkingAction] = []
+        while remaining:
+            for group in remaining:
+                played = list(cells)
+                if find_blocker(compiled, played, plans[group]) is None:
+                    cells = played
+                    solution.extend(plans[group])
+                    remaining.remove(group)
+                    break
+            else:
+                break
+        if not remaining:
+            return solution
+        group = remaining[0]
+        # Try to plan the first blocked group around the other cars for the same cost
+        avoiding = ParkingGroupProblem.from_problem(compiled, group, cells)
+        solution = AStarSearch(avoiding, avoiding.get_initial_state(), parking_heuristic)
+        if solution is not None and cost(avoiding, solution) == plan_costs[group]:
+            # The group starts from its initial cells, which are the current ones since it was not played yet
+            plans[group] = solution
+            continue
+        # Otherwise, merge it with the group of its blocker
+        blocker = find_blocker(compiled, list(cells), plans[group])
+        merged = group | group_of[blocker]
+        for car_index in merged:
+            group_of[car_index] = merged
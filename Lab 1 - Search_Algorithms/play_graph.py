@@ -2,6 +2,8 @@ import time
 from graph import GraphRoutingProblem, GraphNode, graphrouting_heuristic
 from agents import HumanAgent, UninformedSearchAgent, InformedSearchAgent
 from helpers.utils import fetch_recorded_calls
+from search_stats import SearchStats, collect_stats
+from contextlib import nullcontext
 import argparse, os, json
 
 # Create an agent based on the user selections
@@ -41,6 +43,15 @@ def create_agent(args: argparse.Namespace):
     if agent_type == "gbfs":
         from search import BestFirstSearch
         return InformedSearchAgent(BestFirstSearch, graphrouting_heuristic)
+    if agent_type == "bibfs":
+        from search import BidirectionalBreadthFirstSearch
+        return UninformedSearchAgent(BidirectionalBreadthFirstSearch)
+    if agent_type == "biucs":
+        from search import BidirectionalUniformCostSearch
+        return UninformedSearchAgent(BidirectionalUniformCostSearch)
+    if agent_type == "biastar":
+        from search import BidirectionalAStarSearch
+        return InformedSearchAgent(BidirectionalAStarSearch, graphrouting_heuristic)
     print(f"Requested Agent '{agent_type}' is invalid")
     exit(-1)
 
@@ -49,11 +60,13 @@ def main(args: argparse.Namespace):
     graph_path = args.graph
     problem = GraphRoutingProblem.from_file(graph_path) # create the problem
     # Check if there is a figure for the graph that we can display on the console
-    figure_path = json.load(open(graph_path, 'r')).get("figure")
+    with open(graph_path, 'r') as f:
+        figure_path = json.load(f).get("figure")
     figure = None
     if figure_path:
         figure_path = os.path.join(os.path.dirname(graph_path), figure_path)
-        figure = open(figure_path, 'r').read()
+        with open(figure_path, 'r') as f:
+            figure = f.read()
     # Get the initial state
     state = problem.get_initial_state()
     print("Initial State:")
@@ -61,13 +74,16 @@ def main(args: argparse.Namespace):
         print(figure)
     print("Current Node:", state)
     agent = create_agent(args)
+    # If desired by the user, collect the search statistics of the agent (see search_stats.py)
+    stats = SearchStats() if args.stats or args.stats_json else None
     step = 0 # This will store the current step
     path_cost = 0 # This will store the total path cost
     traversed_nodes = [] # This will store all the traversed nodes in order of traversal
     unsolvable = False # This will store whether the problem is unsolvable or not
     while not problem.is_goal(state):
         fetch_recorded_calls(GraphRoutingProblem.is_goal) # Clear the recorded calls
-        action = agent.act(problem, state) # Request an action from the agent
+        with (nullcontext() if stats is None else collect_stats(stats)):
+            action = agent.act(problem, state) # Request an action from the agent
         # Retrieve the traversed nodes
         traversed_nodes += [call["args"][1].name for call in list(fetch_recorded_calls(GraphRoutingProblem.is_goal))]
         # If no solution was found, break
@@ -92,6 +108,12 @@ def main(args: argparse.Namespace):
     # This was a search agent, display the traversed nodes
     if not isinstance(agent, HumanAgent):
         print(f"Traversal Order: {'->'.join(traversed_nodes)}")
+    # If desired by the user, display (or save) the search statistics
+    if stats is not None:
+        print(stats)
+        if args.stats_json:
+            with open(args.stats_json, "w") as f:
+                json.dump(stats.to_dict(), f, indent=2)
     # Finally print the elapsed time for the whole process
     print(f"Elapsed time: {time.time() - start} seconds")
 
@@ -100,8 +122,12 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Play Graph as Human or AI")
     parser.add_argument("graph", help="path to the graph to play")
     parser.add_argument("--agent", "-a", default="human",
-                        choices=['human', 'bfs', 'dfs', 'ucs', 'astar', 'gbfs'],
+                        choices=['human', 'bfs', 'dfs', 'ucs', 'astar', 'gbfs', 'bibfs', 'biucs', 'biastar'],
                         help="the agent that will play the game")
+    parser.add_argument("--stats", action="store_true", default=False,
+                        help="Print the search statistics (expansions, generated nodes, frontier size, timings...)")
+    parser.add_argument("--stats-json", default=None,
+                        help="Write the search statistics to this JSON file")
 
     args = parser.parse_args()
     try:
@@ -3,8 +3,10 @@ from sokoban import SokobanProblem, Direction, SokobanState, SokobanTile
 from agents import HumanAgent, UninformedSearchAgent, InformedSearchAgent
 from helpers.utils import fetch_tracked_call_count
 from helpers.heuristic_checks import test_heuristic_consistency
-from functools import lru_cache
-import argparse, time
+from problem import cached_heuristic
+from search_stats import SearchStats, collect_stats
+from contextlib import nullcontext
+import argparse, json, time
 
 def colored_sokoban(level: str):
     from helpers.utils import bcolors
@@ -27,6 +29,15 @@ def get_heuristic(name: str):
     if name == "strong":
         from sokoban_heuristic import strong_heuristic
         return strong_heuristic
+    if name == "pdb":
+        # The heuristic only loads the database, so it is built here the first time a level is played
+        from sokoban_heuristic import PatternDatabaseSize, pattern_database_heuristic
+        from sokoban_pdb import load_pattern_database
+        def heuristic(problem: SokobanProblem, state: SokobanState) -> float:
+            if "pattern_database" not in problem.cache():
+                load_pattern_database(problem.layout, PatternDatabaseSize, build=True)
+            return pattern_database_heuristic(problem, state)
+        return heuristic
     print(f"Requested Heuristic '{name}' is invalid")
     exit(-1)
 
@@ -62,7 +73,7 @@ def create_agent(args: argparse.Namespace):
     if agent_type == "astar":
         from search import AStarSearch
         # We cache the heuristic calls to speed up the search process if the heuristic is not fast
-        heuristic = lru_cache(2**16)(get_heuristic(args.heuristic))
+        heuristic = cached_heuristic(get_heuristic(args.heuristic))
         # If desired by the user, we track every transition and check for the heuristic consistency for each transition
         if args.checks:
             SokobanProblem.get_successor = test_heuristic_consistency(heuristic)(SokobanProblem.get_successor)
@@ -70,11 +81,30 @@ def create_agent(args: argparse.Namespace):
     if agent_type == "gbfs":
         from search import BestFirstSearch
         # We cache the heuristic calls to speed up the search process if the heuristic is not fast
-        heuristic = lru_cache(2**16)(get_heuristic(args.heuristic))
+        heuristic = cached_heuristic(get_heuristic(args.heuristic))
         # If desired by the user, we track every transition and check for the heuristic consistency for each transition
         if args.checks:
             SokobanProblem.get_successor = test_heuristic_consistency(heuristic)(SokobanProblem.get_successor)
         return InformedSearchAgent(BestFirstSearch, heuristic)
+    if agent_type == "arastar":
+        from search import AnytimeWeightedAStar
+        # We cache the heuristic calls to speed up the search process if the heuristic is not fast
+        heuristic = cached_heuristic(get_heuristic(args.heuristic))
+        # If desired by the user, we track every transition and check for the heuristic consistency for each transition
+        if args.checks:
+            SokobanProblem.get_successor = test_heuristic_consistency(heuristic)(SokobanProblem.get_successor)
+        # The anytime search returns the best solution it found within the time limit (if any)
+        return InformedSearchAgent(lambda problem, state, heuristic: AnytimeWeightedAStar(problem, state, heuristic, time_limit=args.timelimit), heuristic)
+    if agent_type in ("idastar", "rbfs"):
+        from search import IterativeDeepeningAStar, RecursiveBestFirstSearch
+        search_fn = IterativeDeepeningAStar if agent_type == "idastar" else RecursiveBestFirstSearch
+        # We cache the heuristic calls to speed up the search process if the heuristic is not fast
+        heuristic = cached_heuristic(get_heuristic(args.heuristic))
+        # If desired by the user, we track every transition and check for the heuristic consistency for each transition
+        if args.checks:
+            SokobanProblem.get_successor = test_heuristic_consistency(heuristic)(SokobanProblem.get_successor)
+        # The transposition table is bounded so that the memory stays small
+        return InformedSearchAgent(lambda problem, state, heuristic: search_fn(problem, state, heuristic, 2**16), heuristic)
     print(f"Requested Agent '{agent_type}' is invalid")
     exit(-1)
 
@@ -83,16 +113,21 @@ def main(args: argparse.Namespace):
     if args.ansicolors: state_printer = lambda state: print(colored_sokoban(str(state)))
     start = time.time() # Track run time
     problem = SokobanProblem.from_file(args.level) # create the problem
+    # If desired by the user, prune the pushes that lead to deadlocks
+    problem.prune_dead_squares = problem.prune_freeze_deadlocks = args.deadlocks
     state = problem.get_initial_state() # Get the initial state
     print("Initial State:")
     state_printer(state)
     agent = create_agent(args)
+    # If desired by the user, collect the search statistics of the agent (see search_stats.py)
+    stats = SearchStats() if args.stats or args.stats_json else None
     step = 0 # This will store the current step
     total_explored_nodes = 0 # This will store the number of traversed nodes during search
     unsolvable = False # This will store whether the problem is unsolvable or not
     while not problem.is_goal(state):
         fetch_tracked_call_count(SokobanProblem.is_goal) # Clear the call counter
-        action = agent.act(problem, state) # Request an action from the agent
+        with (nullcontext() if stats is None else collect_stats(stats)):
+            action = agent.act(problem, state) # Request an action from the agent
         # If no solution was found, break
         if action is None:
             print("Agent cannot find a solution, exiting...")
@@ -117,6 +152,12 @@ def main(args: argparse.Namespace):
     # This was a search agent, display the number of traversed nodes
     if not isinstance(agent, HumanAgent):
         print(f"Search explored {total_explored_nodes} nodes")
+    # If desired by the user, display (or save) the search statistics
+    if stats is not None:
+        print(stats)
+        if args.stats_json:
+            with open(args.stats_json, "w") as f:
+                json.dump(stats.to_dict(), f, indent=2)
     # Finally print the elapsed time for the whole process
     print(f"Elapsed time: {time.time() - start} seconds")
 
@@ -126,15 +167,23 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Play Sokoban as Human or AI")
     parser.add_argument("level", help="path to the sokoban level to play")
     parser.add_argument("--agent", "-a", default="human",
-                        choices=['human', 'bfs', 'dfs', 'ucs', 'astar', 'gbfs'],
+                        choices=['human', 'bfs', 'dfs', 'ucs', 'astar', 'gbfs', 'idastar', 'rbfs', 'arastar'],
                         help="the agent that will play the game")
     parser.add_argument("--heuristic", '-hf', default="zero",
-                        choices=["zero", "weak", "strong"],
+                        choices=["zero", "weak", "strong", "pdb"],
                         help="choose the heuristic to use with A* or Greedy Best First Search")
+    parser.add_argument("--timelimit", "-tl", type=float, default=None,
+                        help="the time limit (in seconds) for the anytime search (arastar)")
+    parser.add_argument("--deadlocks", "-dl", action='store_true', default=False,
+                        help="Prune the pushes that lead to dead squares or freeze deadlocks")
     parser.add_argument("--checks", "-c", action='store_true', default=False,
                         help="Enable consistency checks for the heuristic")
     parser.add_argument("--ansicolors", "-ac", action="store_true",
                         help="Print the level on the console with ANSI colors (only works on some terminals)")
+    parser.add_argument("--stats", action="store_true", default=False,
+                        help="Print the search statistics (expansions, generated nodes, frontier size, timings...)")
+    parser.add_argument("--stats-json", default=None,
+                        help="Write the search statistics to this JSON file")
 
     args = parser.parse_args()
     try:
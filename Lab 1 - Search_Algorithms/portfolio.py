@@ -0,0 +1,119 @@
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+import multiprocessing, queue, time, traceback
+import argparse
+
+from problem import Problem, S, A, Solution
+from helpers.utils import load_function
+
+# A portfolio runs several search configurations in parallel (one process each) and returns the first solution found
+# Since no single algorithm/heuristic pair wins on every problem, racing them cuts the wall-clock time on mixed workloads
+
+# A configuration refers to the search function and the heuristic by their names (e.g. "search.AStarSearch")
+# so that it can be sent to another process even when the processes are spawned instead of forked
+@dataclass
+class SearchConfiguration:
+    name: str
+    search: str
+    heuristic: Optional[str] = None
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+# The result of a portfolio run:
+#   configuration: the configuration that found the solution first (None if no configuration found a solution)
+#   solution: the solution found by the winner (None if no solution was found)
+#   elapsed: the wall-clock time in seconds until the winner returned (or until the portfolio gave up)
+#   failures: the error message of each configuration that raised an exception
+@dataclass
+class PortfolioResult:
+    configuration: Optional[SearchConfiguration]
+    solution: Solution
+    elapsed: float
+    failures: Dict[str, str] = field(default_factory=dict)
+
+# The default portfolio for sokoban
+SokobanPortfolio = [
+    SearchConfiguration("A* (strong)", "search.AStarSearch", "sokoban_heuristic.strong_heuristic"),
+    SearchConfiguration("Greedy Best First (strong)", "search.BestFirstSearch", "sokoban_heuristic.strong_heuristic"),
+    SearchConfiguration("Weighted A* x2 (strong)", "search.WeightedAStarSearch", "sokoban_heuristic.strong_heuristic", {"weight": 2.0}),
+    SearchConfiguration("Weighted A* x5 (strong)", "search.WeightedAStarSearch", "sokoban_heuristic.strong_heuristic", {"weight": 5.0}),
+]
+
+# Runs a single configuration and returns its solution
+def run_configuration(configuration: SearchConfiguration, problem: Problem[S, A], initial_state: S) -> Solution:
+    search_fn = load_function(configuration.search, use_local=True)
+    if configuration.heuristic is None:
+        return search_fn(problem, initial_state, **configuration.kwargs)
+    heuristic = load_function(configuration.heuristic, use_local=True)
+    return search_fn(problem, initial_state, heuristic, **configuration.kwargs)
+
+# The entry point of each worker process: it sends (configuration index, solution, error message) to the queue
+def portfolio_worker(index: int, configuration: SearchConfiguration, problem: Problem[S, A], initial_state: S, results: multiprocessing.Queue):
+    try:
+        results.put((index, run_configuration(configuration, problem, initial_state), None))
+    except Exception:
+        results.put((index, None, traceback.format_exc()))
+
+# Starts every configuration in its own process and returns as soon as one of them finds a solution
+# The remaining processes are terminated. If a timeout (in seconds) is given, the portfolio gives up after it.
+def PortfolioSearch(problem: Problem[S, A], initial_state: S, configurations: List[SearchConfiguration], timeout: Optional[float] = None) -> PortfolioResult:
+    start = time.time()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=portfolio_worker, args=(index, configuration, problem, initial_state, results), daemon=True)
+        for index, configuration in enumerate(configurations)
+    ]
+    for worker in workers:
+        worker.start()
+
+    result = PortfolioResult(None, None, 0)
+    pending = set(range(len(configurations)))
+    try:
+        while pending:
+            if timeout is not None and time.time() - start >= timeout:
+                break
+            try:
+                # Wake up regularly to check the timeout and whether some worker died without reporting back
+                index, solution, error = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers) and results.empty():
+                    break
+                continue
+            pending.discard(index)
+            if error is not None:
+                result.failures[configurations[index].name] = error
+            elif solution is not None:
+                result.configuration, result.solution = configurations[index], solution
+                break
+    finally:
+        # Cancel the configurations that are still running
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+    result.elapsed = time.time() - start
+    return result
+
+
+def main(args: argparse.Namespace):
+    from sokoban import SokobanProblem
+    problem = SokobanProblem.from_file(args.level)
+    result = PortfolioSearch(problem, problem.get_initial_state(), SokobanPortfolio, args.timeout)
+    for name, error in result.failures.items():
+        print(f"Configuration '{name}' failed:\n{error}")
+    if result.configuration is None:
+        print("No configuration found a solution")
+    else:
+        path = ''.join(str(action) for action in result.solution)
+        print(f"Winner: {result.configuration.name}")
+        print(f"Path: {path} (length={len(path)} steps)")
+    print(f"Elapsed time: {result.elapsed} seconds")
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Solve a Sokoban level with a portfolio of parallel searches")
+    parser.add_argument("level", help="path to the sokoban level to solve")
+    parser.add_argument("--timeout", "-t", type=float, default=None, help="give up after this many seconds")
+
+    args = parser.parse_args()
+    main(args)
@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Callable, Generic, Iterable, List, TypeVar, Union
+from collections import OrderedDict
+from typing import Callable, Generic, Iterable, List, Sequence, TypeVar, Union
 from helpers.utils import CacheContainer, with_cache
 
 # S and A are used for generic typing where S represents the state type and A represents the action type
@@ -38,4 +39,56 @@ class Problem(ABC, Generic[S, A], CacheContainer):
 # A solution which is a list of actions (or None if no solution is found)
 Solution = Union[List[A], None]
 # A heuristic function which estimates the path cost to the goal for a given state with a certain problem
-HeuristicFunction = Callable[[Problem[S, A], S],float]
\ No newline at end of file
+HeuristicFunction = Callable[[Problem[S, A], S],float]
+# A batch heuristic function estimates the path costs of a sequence of states at once (in the same order)
+BatchHeuristicFunction = Callable[[Problem[S, A], Sequence[S]], Sequence[float]]
+
+# A heuristic can optionally provide a batch version of itself as its "batch" attribute:
+#   heuristic.batch(problem, states) -> the heuristic values of the states
+# The searches evaluate all the new children of a node with a single batch call, so the per-call overhead is paid once
+# and the batch can be vectorized. This function falls back to calling the heuristic on each state if there is no batch.
+def evaluate_heuristic(heuristic: HeuristicFunction, problem: Problem[S, A], states: Sequence[S]) -> List[float]:
+    batch = getattr(heuristic, "batch", None)
+    if batch is None:
+        return [heuristic(problem, state) for state in states]
+    return list(batch(problem, states))
+
+# Wraps a heuristic with a bounded LRU cache of its values, stored in the cache of each problem (see CacheContainer)
+# Unlike functools.lru_cache, the cached values belong to the problem, so they are released with the problem
+# and the problem does not need to be hashed on every call.
+# When the cache holds "size" values, the least recently used value is evicted.
+def cached_heuristic(heuristic: HeuristicFunction, size: int = 2**16) -> HeuristicFunction:
+    key = ("heuristic", heuristic)
+    # The values are always looked up in the problem cache (no reference to the problem is kept by the wrapper)
+    def cached(problem: Problem[S, A], state: S) -> float:
+        cache = problem.cache()
+        values = cache.get(key)
+        if values is None:
+            values = cache[key] = OrderedDict()
+        value = values.get(state)
+        if value is not None:
+            values.move_to_end(state)
+            return value
+        value = values[state] = heuristic(problem, state)
+        if len(values) > size:
+            values.popitem(last=False)
+        return value
+    # If the heuristic has a batch version, the cached heuristic gets one too which only evaluates the missing states
+    if hasattr(heuristic, "batch"):
+        def cached_batch(problem: Problem[S, A], states: Sequence[S]) -> List[float]:
+            values = problem.cache().setdefault(key, OrderedDict())
+            missing = []
+            for state in dict.fromkeys(states):
+                if state in values:
+                    # Mark the hits as recently used, as in the scalar version
+                    values.move_to_end(state)
+                else:
+                    missing.append(state)
+            for state, value in zip(missing, heuristic.batch(problem, missing)):
+                values[state] = value
+            result = [values[state] for state in states]
+            while len(values) > size:
+                values.popitem(last=False)
+            return result
+        cached.batch = cached_batch
+    return cached
@@ -1,10 +1,171 @@
-from problem import HeuristicFunction, Problem, S, A, Solution
+from problem import HeuristicFunction, Problem, S, A, Solution, evaluate_heuristic
 from collections import deque
 from helpers.utils import NotImplemented
+from search_stats import current_stats
 
 
 #TODO: Import any modules you want to use
-import heapq
+import heapq, itertools, math, time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generic, Iterator, List, Optional, Tuple
+
+
+# A priority queue frontier built on a binary heap (heapq) with lazy deletion
+# It is shared by UniformCostSearch, AStarSearch and BestFirstSearch
+'''
+Why a heap: popping the node with the lowest priority costs O(log n) instead of
+            scanning the whole frontier with min() which costs O(n) per expansion.
+Why lazy deletion: heapq cannot decrease the key of an entry in place.
+                   Instead, we push a new entry and remember the latest one for every state in a dictionary;
+                   outdated (stale) entries are skipped when they reach the top of the heap.
+Tie-breaking: each state gets an insertion order number the first time it enters the frontier,
+              and it keeps that number when its priority is decreased.
+              So, among nodes with equal priorities, the one that entered the frontier first is popped first
+              which is exactly the order in which min() iterates over a dictionary.
+'''
+class PriorityFrontier(Generic[S]):
+    def __init__(self) -> None:
+        # The heap holds (priority, order, state) tuples
+        self.heap: List[Tuple[float, int, S]] = []
+        # The latest entry for each state in the frontier: state -> (priority, order, payload)
+        self.entries: Dict[S, Tuple[float, int, Any]] = {}
+        # A counter used to give every inserted state a unique order number
+        self.counter = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __bool__(self) -> bool:
+        return bool(self.entries)
+
+    def __contains__(self, state: S) -> bool:
+        return state in self.entries
+
+    # Iterates over the states in the frontier (in no particular order)
+    def __iter__(self) -> Iterator[S]:
+        return iter(self.entries)
+
+    # Returns the current priority of a state in the frontier
+    def priority(self, state: S) -> float:
+        return self.entries[state][0]
+
+    # Inserts a state or replaces its entry (used when a cheaper path to a state in the frontier is found)
+    def push(self, state: S, priority: float, payload: Any = None) -> None:
+        entry = self.entries.get(state)
+        if entry is None:
+            order = self.counter
+            self.counter += 1
+        else:
+            # Keep the original order number so that ties are still broken by the first insertion
+            order = entry[1]
+        self.entries[state] = (priority, order, payload)
+        heapq.heappush(self.heap, (priority, order, state))
+
+    # Removes and returns (state, priority, payload) with the lowest priority
+    def pop(self) -> Tuple[S, float, Any]:
+        while self.heap:
+            priority, order, state = heapq.heappop(self.heap)
+            entry = self.entries.get(state)
+            # Skip stale entries whose state was already popped or got a better priority later
+            if entry is None or entry[0] != priority or entry[1] != order:
+                continue
+            del self.entries[state]
+            return state, priority, entry[2]
+        raise IndexError("pop from an empty frontier")
+
+    # Returns the lowest priority in the frontier without removing its state
+    def peek(self) -> float:
+        while self.heap:
+            priority, order, state = self.heap[0]
+            entry = self.entries.get(state)
+            if entry is not None and entry[0] == priority and entry[1] == order:
+                return priority
+            # Drop the stale entry at the top of the heap
+            heapq.heappop(self.heap)
+        raise IndexError("peek from an empty frontier")
+
+
+# A FIFO queue (for BFS) or a LIFO stack (for DFS) frontier with a hash index of the queued states
+'''
+Why a hash index: checking "state in frontier" on a deque or a list is a linear scan.
+                  The dictionary maps every queued state to the node index of its live entry,
+                  so membership tests are O(1).
+Re-pushing a queued state replaces its entry: the old entry becomes stale and is skipped when it is popped.
+This lets DFS move a re-generated state to the top of the stack (so it is still expanded from its latest parent)
+without scanning the stack to remove the old entry.
+'''
+class QueueFrontier(Generic[S]):
+    def __init__(self, lifo: bool = False) -> None:
+        self.lifo = lifo
+        # The queued (state, node index) pairs in FIFO or LIFO order
+        self.queue: deque = deque()
+        # The node index of the live entry for each queued state
+        self.latest: Dict[S, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.latest)
+
+    def __bool__(self) -> bool:
+        return bool(self.latest)
+
+    def __contains__(self, state: S) -> bool:
+        return state in self.latest
+
+    # Adds a state (or replaces its queued entry) along with its node index
+    def push(self, state: S, index: int) -> None:
+        self.latest[state] = index
+        self.queue.append((state, index))
+
+    # Removes and returns the next live (state, node index) pair
+    def pop(self) -> Tuple[S, int]:
+        pop = self.queue.pop if self.lifo else self.queue.popleft
+        while self.queue:
+            state, index = pop()
+            # Skip entries that were replaced by a later push of the same state
+            if self.latest.get(state) != index:
+                continue
+            del self.latest[state]
+            return state, index
+        raise IndexError("pop from an empty frontier")
+
+
+# A compact table of search nodes where each node stores its state, the index of its parent node,
+# the action that generated it and its path cost (g)
+# The path cost is only filled by the searches that order the frontier by it (UCS and A*)
+'''
+Why a node table: building "path + [action]" for every generated child costs O(depth) time and memory per node
+                  and the frontier ends up holding many near-duplicate lists.
+                  Instead, each node only points to its parent and the solution is rebuilt once the goal is reached.
+'''
+class NodeTable(Generic[S, A]):
+    # The parent index of the root node
+    ROOT = -1
+
+    def __init__(self) -> None:
+        self.states: List[S] = []
+        self.parents: List[int] = []
+        self.actions: List[Optional[A]] = []
+        self.costs: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    # Adds a node to the table and returns its index
+    def add(self, state: S, parent: int = ROOT, action: Optional[A] = None, cost: float = 0) -> int:
+        self.states.append(state)
+        self.parents.append(parent)
+        self.actions.append(action)
+        self.costs.append(cost)
+        return len(self.states) - 1
+
+    # Follows the parent pointers from the given node back to the root and returns the actions in order
+    def solution(self, index: int) -> List[A]:
+        actions = []
+        while self.parents[index] != NodeTable.ROOT:
+            actions.append(self.actions[index])
+            index = self.parents[index]
+        actions.reverse()
+        return actions
 
 
 
@@ -38,6 +199,9 @@ def BreadthFirstSearch(problem: Problem[S, A], initial_state: S) -> Solution:
     # Check if the root is already the goal state
     if problem.is_goal(initial_state):
         return []
+
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    stats = current_stats()
     
     # Initialize the root node with the initial state
     node = initial_state
@@ -48,41 +212,46 @@ def BreadthFirstSearch(problem: Problem[S, A], initial_state: S) -> Solution:
                        BFS explores nodes in the order they were added to the frontier.
                        This means that it explores all nodes at a given depth level before moving on to nodes at the next depth level. 
     '''
-    frontier = deque()
+    frontier = QueueFrontier()
 
-    # Add the root to the frontier along with its path 
-    frontier.append((node, []))  
+    # Store the root in the node table and add it to the frontier along with its node index
+    nodes = NodeTable()
+    frontier.push(node, nodes.add(node))
 
     # Initialize a set to keep track of explored states
     explored = set()
 
     while frontier:
-        # Pop the shallowest node from the frontier along with its path
-        node, path = frontier.popleft()
-
-        # Skip nodes that have already been explored
-        if node in explored:
-            continue
+        # Pop the shallowest node from the frontier along with its node index
+        # Every state is queued at most once, so it cannot be explored already
+        node, index = frontier.pop()
 
         # Mark the node as explored
         explored.add(node)
 
+        actions = problem.get_actions(node)
+        if stats is not None:
+            stats.frontier(len(frontier) + 1)
+            actions = stats.expand(actions)
+
         # Explore possible actions from the current node
-        for action in problem.get_actions(node):
+        for action in actions:
             # Generate the child node resulting from the action
             child = problem.get_successor(node, action)
 
             # Ensure the child is not already in explored or frontier
             if child not in explored and child not in frontier:
 
-                # Extend the path with the current action
-                new_path = path + [action]
-                # If the child is the goal state, return the path
+                # Store the child in the node table with a pointer to its parent
+                child_index = nodes.add(child, index, action)
+                # If the child is the goal state, rebuild and return the path
                 if problem.is_goal(child):
-                    return new_path
+                    return nodes.solution(child_index)
 
-                 # Add the child node and its extended path to the frontier
-                frontier.append((child, new_path))
+                # Add the child node and its node index to the frontier
+                frontier.push(child, child_index)
+            elif stats is not None:
+                stats.duplicates += 1
 
     # If no solution is found, return None
     return None          
@@ -96,6 +265,9 @@ def DepthFirstSearch(problem: Problem[S, A], initial_state: S) -> Solution:
     if problem.is_goal(initial_state):
         return []
 
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    stats = current_stats()
+
     # Initialize the root node with the initial state
     node = initial_state
     
@@ -103,39 +275,46 @@ def DepthFirstSearch(problem: Problem[S, A], initial_state: S) -> Solution:
     '''
     Why using a stack: to mimic the recursive nature of DFS.
     '''
-    frontier = []
+    frontier = QueueFrontier(lifo=True)
 
-    # Add the root to the frontier along with an empty path
-    frontier.append((node, []))  # <== Last in
+    # Store the root in the node table and add it to the frontier along with its node index
+    nodes = NodeTable()
+    frontier.push(node, nodes.add(node))  # <== Last in
 
     # Initialize a set to keep track of explored states
     explored = set()
 
     while frontier:
         # Pop the deepest node from the frontier
-        node, path = frontier.pop() # ==> First out
-
-        # Skip nodes that have already been explored
-        if node in explored:
-            continue
+        # Every state has at most one live entry, so it cannot be explored already
+        node, index = frontier.pop() # ==> First out
 
         # Mark the node as explored
         explored.add(node)
 
-        # If the node is the goal state, return the path
+        # If the node is the goal state, rebuild and return the path
         if problem.is_goal(node):
-            return path
+            return nodes.solution(index)
+
+        actions = problem.get_actions(node)
+        if stats is not None:
+            stats.frontier(len(frontier) + 1)
+            actions = stats.expand(actions)
 
         # Explore possible actions from the current node
-        for action in problem.get_actions(node):
+        for action in actions:
             # Generate the child node resulting from the action
             child = problem.get_successor(node, action)
 
-            # Ensure the child is not already in explored or frontier
-            if child not in explored and child not in frontier:
+            # Ensure the child is not already explored
+            # If it is already in the frontier, pushing it again moves it to the top of the stack
+            # so that the deepest path to it is the one that gets expanded
+            if child not in explored:
 
-                # Add the child node and extend the path
-                frontier.append((child, path + [action]))
+                # Store the child in the node table and add it to the frontier
+                frontier.push(child, nodes.add(child, index, action))
+            elif stats is not None:
+                stats.duplicates += 1
 
     # If no solution is found, return None
     return None    
@@ -165,35 +344,41 @@ def UniformCostSearch(problem: Problem[S, A], initial_state: S) -> Solution:
     # Check if the root is already the goal state
     if problem.is_goal(initial_state):
         return []
+
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    stats = current_stats()
     
     # Initialize the root node with the initial state
     node = initial_state   
 
-    # Using a dictionary (hash table) for the frontier:
-    # - Key: states to be expanded
-    # - Value: tuple with (path cost, list of actions)
-    frontier ={node: (0, [])}
+    # Using a priority queue for the frontier:
+    # - Ordered by: path cost
+    # - Payload: the index of the node in the node table
+    nodes = NodeTable()
+    frontier = PriorityFrontier()
+    frontier.push(node, 0, nodes.add(node))
 
     # Initialize a set to keep track of explored states
     explored = set()
 
     while frontier:
-        # Get the node to be expanded (the one with the lowest path cost)
-        node = min(frontier, key=lambda k: frontier[k][0])
-        cost, actions = frontier[node]
-
-        # Remove the node from the frontier
-        frontier.pop(node)
+        # Pop the node to be expanded (the one with the lowest path cost) and remove it from the frontier
+        node, cost, index = frontier.pop()
 
         # Mark the node as explored
         explored.add(node)
 
-        # If the node is the goal state, return the path
+        # If the node is the goal state, rebuild and return the path
         if problem.is_goal(node):
-            return actions
+            return nodes.solution(index)
+
+        actions = problem.get_actions(node)
+        if stats is not None:
+            stats.frontier(len(frontier) + 1)
+            actions = stats.expand(actions)
 
         # Loop over all the possible actions of the current state
-        for action in problem.get_actions(node):
+        for action in actions:
             # Evaluate the action cost
             action_cost = cost + problem.get_cost(node, action)
 
@@ -204,9 +389,11 @@ def UniformCostSearch(problem: Problem[S, A], initial_state: S) -> Solution:
             # to prevent expansion of the same node more than one time
             # Or the node exists in the frontier with a larger path cost
             if (child_node not in frontier and child_node not in explored) \
-                    or (child_node in frontier and action_cost < frontier[child_node][0]):
-                # Add/update the child node in the frontier with its path cost and actions
-                frontier[child_node] = (action_cost, actions + [action])
+                    or (child_node in frontier and action_cost < frontier.priority(child_node)):
+                # Add/update the child node in the frontier with its path cost and a new node pointing to its parent
+                frontier.push(child_node, action_cost, nodes.add(child_node, index, action, action_cost))
+            elif stats is not None:
+                stats.duplicates += 1
 
     # Return None if no solution is found
     return None
@@ -219,115 +406,641 @@ def AStarSearch(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFu
     if problem.is_goal(initial_state):
         return []
 
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted
+    stats = current_stats()
+    if stats is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
+
     # Initialize the root node with the initial state
     node = initial_state
 
-    # Using a dictionary for the frontier:
-    # Key: node, Value: tuple (total_cost + heuristic, actions)
-    frontier = {node: (0 + heuristic(problem, node), [])}
+    # The heuristic value of every generated state, so that the heuristic is evaluated exactly once per state
+    # (the path cost g of each node is stored in the node table)
+    estimates: Dict[S, float] = {node: heuristic(problem, node)}
+
+    # Using a priority queue for the frontier:
+    # Ordered by: path cost + heuristic, Payload: the index of the node in the node table
+    nodes = NodeTable()
+    frontier = PriorityFrontier()
+    frontier.push(node, 0 + estimates[node], nodes.add(node))
 
     # Initialize a set to keep track of explored states
     explored = set()
 
     while frontier:
-        # Get the node with the highest priority (lowest total cost)
-        node = min(frontier, key=lambda k: frontier[k][0])
+        # Pop the node with the highest priority (lowest path cost + heuristic)
+        # and retrieve the node index for it
+        node, _, index = frontier.pop()
 
-        # Retrieve the total cost and actions for the current node from the frontier
-        total_cost, actions = frontier.pop(node)
-
-        # If the node is the goal state, return the path
+        # If the node is the goal state, rebuild and return the path
         if problem.is_goal(node):
-            return actions
+            return nodes.solution(index)
 
         # Mark the node as explored
         explored.add(node)
+        path_cost = nodes.costs[index]
+
+        actions = problem.get_actions(node)
+        if stats is not None:
+            stats.frontier(len(frontier) + 1)
+            actions = stats.expand(actions)
 
         # Loop over all the possible actions of the current state
-        for action in problem.get_actions(node):
+        children = []
+        for action in actions:
 
             # Generate the child node resulting from the action
             child_node = problem.get_successor(node, action)
 
-             # Get the cost associated with the current action
-            action_cost = problem.get_cost(node, action)
+            # Skip the child_node if it was already explored
+            if child_node in explored:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
 
-            # Check if the child_node is in the frontier
-            in_frontier = child_node in frontier
+            # Compute the path cost of the child node
+            children.append((action, child_node, path_cost + problem.get_cost(node, action)))
 
-            # If the child_node is neither in the frontier nor explored, or it's in the frontier with a higher cost
-            if child_node not in explored and not in_frontier:
+        # Evaluate the heuristic of the children that were never generated before, all at once (see evaluate_heuristic)
+        new_states = list(dict.fromkeys(child_node for _, child_node, _ in children if child_node not in estimates))
+        if new_states:
+            estimates.update(zip(new_states, evaluate_heuristic(heuristic, problem, new_states)))
 
-                # Create a new path by extending the current actions with the current action
-                new_path = actions + [action]
+        for action, child_node, child_cost in children:
+            new_total_cost = child_cost + estimates[child_node]
 
-                # Calculate the new total cost for the child node, considering the heuristic estimate
-                # Subtract the heuristic estimate for the current node (node) and add the heuristic estimate for the child node (child_node)
-                new_total_cost = total_cost - heuristic(problem, node) + action_cost + heuristic(problem, child_node)
-                # Update the frontier with the new total cost and path for the child node
-                frontier[child_node] = (new_total_cost, new_path)
-            elif in_frontier:
-                # Check if the new path is better (lower cost)
-                frontier_cost = frontier[child_node][0]
-                new_path_cost = total_cost - heuristic(problem, node) + action_cost + heuristic(problem, child_node)
-                if new_path_cost < frontier_cost:
-                    # Update the frontier with the lower cost path
-                    frontier[child_node] = (new_path_cost, actions + [action])
+            # Add the child_node if it is not in the frontier, or update it if the new path is better (lower cost)
+            if child_node not in frontier or new_total_cost < frontier.priority(child_node):
+                frontier.push(child_node, new_total_cost, nodes.add(child_node, index, action, child_cost))
+            elif stats is not None:
+                stats.duplicates += 1
 
     # Return None if no solution is found
     return None
 
+# A solution found by the anytime search along with its cost and the suboptimality bound
+# The bound guarantees that: cost <= bound * (optimal cost)
+@dataclass
+class AnytimeSolution(Generic[A]):
+    actions: List[A]
+    cost: float
+    bound: float
+    weight: float
+
+# Anytime Repairing A* (ARA*) starts as a weighted A* (f = g + weight * h) which finds a solution quickly,
+# then keeps lowering the weight and improving the solution until the budget runs out or the solution is optimal
+'''
+Reusing earlier effort: when the weight is lowered, the search does not start over.
+                        The frontier is kept (only re-ordered with the new weight) and the states whose path cost
+                        decreased after they had been expanded (the "inconsistent" states) are added back to it.
+                        Only the states whose path costs can still improve get expanded again.
+Suboptimality bound: any optimal path has a state in the frontier or the inconsistent states whose g is optimal,
+                     so min(g + h) over these states (and the best goal cost) is a lower bound of the optimal cost
+                     as long as the heuristic is admissible. The bound is the best cost divided by this lower bound,
+                     capped by the weight of the last completed pass (a pass that ends with no state in the frontier
+                     below the best goal cost guarantees that the cost is at most weight times the optimal cost).
+Budget: the search stops when the time limit (in seconds) or the expansion limit is reached.
+This function is a generator that yields an AnytimeSolution every time the weight is lowered (or the budget runs out)
+after a solution was found.
+'''
+def AnytimeAStarSearch(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction,
+                       weight: float = 3.0, weight_step: float = 0.5,
+                       time_limit: Optional[float] = None, expansion_limit: Optional[int] = None) -> Iterator[AnytimeSolution]:
+    # Check if the root is already the goal state
+    if problem.is_goal(initial_state):
+        yield AnytimeSolution([], 0, 1.0, weight)
+        return
+
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    expansions = 0
+
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted, and the time of each weight is recorded as a phase
+    stats = current_stats()
+    if stats is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
+
+    # The node table stores the best known path to each state; index_of maps a state to its latest node
+    nodes = NodeTable()
+    index_of = {initial_state: nodes.add(initial_state)}
+    # The heuristic values are stored since the frontier is re-ordered every time the weight changes
+    h = {initial_state: heuristic(problem, initial_state)}
+
+    frontier = PriorityFrontier()
+    frontier.push(initial_state, weight * h[initial_state], index_of[initial_state])
+    # Expanded states in the current iteration, and expanded states whose path cost decreased afterwards
+    # (a dictionary is used as an ordered set to keep the search deterministic)
+    explored = set()
+    inconsistent: Dict[S, None] = {}
+
+    # The index of the best goal node found so far and its cost
+    goal, goal_cost = None, math.inf
+    # The weight of the last pass that ran to completion (the suboptimality guaranteed by the passes)
+    guaranteed = math.inf
+
+    while True:
+        out_of_budget = False
+        iteration_start = time.perf_counter()
+        # Expand states until no state in the frontier can lead to a better solution with the current weight
+        while frontier and goal_cost > frontier.peek():
+            if (expansion_limit is not None and expansions >= expansion_limit) or \
+                    (deadline is not None and time.perf_counter() >= deadline):
+                out_of_budget = True
+                break
+            state, _, index = frontier.pop()
+            explored.add(state)
+            expansions += 1
+            actions = problem.get_actions(state)
+            if stats is not None:
+                stats.frontier(len(frontier) + 1)
+                actions = stats.expand(actions)
+            for action in actions:
+                child = problem.get_successor(state, action)
+                cost = nodes.costs[index] + problem.get_cost(state, action)
+                # Skip the child if it was already reached with a lower or equal cost
+                old = index_of.get(child)
+                if old is not None and nodes.costs[old] <= cost:
+                    if stats is not None:
+                        stats.duplicates += 1
+                    continue
+                child_index = index_of[child] = nodes.add(child, index, action, cost)
+                # A goal does not need to be expanded, we only keep the cheapest one
+                if problem.is_goal(child):
+                    if cost < goal_cost:
+                        goal, goal_cost = child_index, cost
+                    continue
+                if child not in h:
+                    h[child] = heuristic(problem, child)
+                if child in explored:
+                    # The child was expanded with a higher cost, it will be reconsidered with the next weight
+                    inconsistent[child] = None
+                else:
+                    frontier.push(child, cost + weight * h[child], child_index)
+
+        if stats is not None:
+            stats.add_phase(f"weight {weight}", time.perf_counter() - iteration_start)
+        if not out_of_budget:
+            guaranteed = weight
+
+        if goal is not None:
+            # The lower bound of the optimal cost is the lowest g + h among the states that can still improve
+            lower = goal_cost
+            for state in itertools.chain(frontier, inconsistent):
+                lower = min(lower, nodes.costs[index_of[state]] + h[state])
+            bound = min(guaranteed, goal_cost / lower if lower > 0 else 1.0)
+            yield AnytimeSolution(nodes.solution(goal), goal_cost, bound, weight)
+            if bound <= 1:
+                return
+
+        # Stop if the budget is exhausted, the weight cannot be lowered further or there is nothing left to search
+        if out_of_budget or weight <= 1 or not (frontier or inconsistent):
+            return
+
+        # Lower the weight, move the inconsistent states back to the frontier and re-order it with the new weight
+        weight = max(1.0, weight - weight_step)
+        states = list(itertools.chain(frontier, inconsistent))
+        frontier = PriorityFrontier()
+        for state in states:
+            frontier.push(state, nodes.costs[index_of[state]] + weight * h[state], index_of[state])
+        inconsistent.clear()
+        explored.clear()
+
+# Runs the anytime search and returns the best solution found within the budget
+def AnytimeWeightedAStar(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction,
+                         weight: float = 3.0, weight_step: float = 0.5,
+                         time_limit: Optional[float] = None, expansion_limit: Optional[int] = None) -> Solution:
+    best = None
+    for best in AnytimeAStarSearch(problem, initial_state, heuristic, weight, weight_step, time_limit, expansion_limit):
+        pass
+    return None if best is None else best.actions
+
+# Weighted A* (f = g + weight * h) returns the first solution of the anytime search
+# The solution cost is at most weight times the optimal cost
+def WeightedAStarSearch(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction, weight: float = 2.0) -> Solution:
+    first = next(AnytimeAStarSearch(problem, initial_state, heuristic, weight), None)
+    return None if first is None else first.actions
+
 def BestFirstSearch(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction) -> Solution:
     #TODO: ADD YOUR CODE HERE
      # Check if the root is already the goal state
     if problem.is_goal(initial_state):
         return []
+
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted
+    stats = current_stats()
+    if stats is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
     
     # Initialize the root node with the initial state
     node = initial_state
 
-    # Using a dictionary (hash table) for the frontier:
-    # - Key: states to be expanded
-    # - Value: tuple with (heuristic value, list of actions)
-    frontier ={node: (heuristic(problem, node), [])}
+    # Using a priority queue for the frontier:
+    # - Ordered by: heuristic value
+    # - Payload: the index of the node in the node table
+    nodes = NodeTable()
+    frontier = PriorityFrontier()
+    frontier.push(node, heuristic(problem, node), nodes.add(node))
 
     # Initialize a set to keep track of explored states
     explored = set()
 
     while frontier:
-        # Get the node with the highest priority (lowest heuristic value)
-        node = min(frontier, key=lambda k: frontier[k][0])
-        _, actions = frontier[node]
-
-        # Remove the node from the frontier
-        frontier.pop(node)
+        # Pop the node with the highest priority (lowest heuristic value) and remove it from the frontier
+        node, _, index = frontier.pop()
 
-        # If the node is the goal state, return the path
+        # If the node is the goal state, rebuild and return the path
         if problem.is_goal(node):
-            return actions
+            return nodes.solution(index)
 
         # Mark the node as explored
         explored.add(node)
 
         # Loop over all the possible actions of the current state
-        for action in problem.get_actions(node):
+        # and collect the children that are neither in the frontier nor explored (the first action reaching each of them)
+        actions = problem.get_actions(node)
+        if stats is not None:
+            stats.frontier(len(frontier) + 1)
+            actions = stats.expand(actions)
+        children: Dict[S, A] = {}
+        for action in actions:
             # Generate the child node resulting from the action
             child_node = problem.get_successor(node, action)
             
             # Check if the child_node is neither in the frontier nor explored
-            if child_node not in frontier and child_node not in explored:
-
-                # Create a new path by extending the current actions with the current action
-                new_path = actions + [action]
+            if child_node not in frontier and child_node not in explored and child_node not in children:
+                children[child_node] = action
+            elif stats is not None:
+                stats.duplicates += 1
 
-                # Add the child_node to the frontier with its heuristic value and the new path
-                frontier[child_node] = (heuristic(problem, child_node), new_path)
+        # Add the children to the frontier with their heuristic values (evaluated all at once, see evaluate_heuristic)
+        # and new nodes pointing to their parent
+        for (child_node, action), estimate in zip(children.items(), evaluate_heuristic(heuristic, problem, list(children))):
+            frontier.push(child_node, estimate, nodes.add(child_node, index, action))
 
     # Return None if no solution is found
     return None
 
 
 
+# A bounded transposition table used by the memory-bounded searches to remember values of states they already visited
+'''
+Why bounded: IDA* and RBFS only keep the current path in memory (O(depth)), which is what lets them solve problems
+             where A* runs out of memory. An unbounded table would throw this advantage away,
+             so once the table is full, the oldest entry is evicted (dictionaries keep the insertion order).
+A size of 0 disables the table.
+'''
+class TranspositionTable(Generic[S]):
+    def __init__(self, size: int = 0) -> None:
+        self.size = size
+        self.values: Dict[S, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, state: S, default: Optional[float] = None) -> Optional[float]:
+        return self.values.get(state, default)
+
+    def put(self, state: S, value: float) -> None:
+        if self.size <= 0:
+            return
+        if state not in self.values and len(self.values) >= self.size:
+            # Evict the oldest entry
+            del self.values[next(iter(self.values))]
+        self.values[state] = value
+
+    def clear(self) -> None:
+        self.values.clear()
+
+
+# Iterative Deepening A* (IDA*) runs depth first searches bounded by the f = g + h value
+# Each iteration raises the bound to the smallest f value that exceeded the previous bound
+'''
+Memory: only the current path is stored, so the memory is O(depth) (plus the transposition table if enabled).
+Transposition table: maps each state to the lowest path cost it was reached with during the current iteration.
+                     If a state is reached again with a higher or equal cost, its subtree was already searched
+                     with a larger remaining budget, so it is skipped.
+The depth first search uses an explicit stack of action iterators instead of recursion
+to avoid hitting Python's recursion limit on long solutions.
+'''
+def IterativeDeepeningAStar(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction, transposition_size: int = 0) -> Solution:
+    # Check if the root is already the goal state
+    if problem.is_goal(initial_state):
+        return []
 
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted
+    stats = current_stats()
+    if stats is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
+
+    # Returns the actions of a state on the path as an iterator (and records the expansion if the statistics are enabled)
+    def expand(state: S, depth: int) -> Iterator[A]:
+        actions = problem.get_actions(state)
+        if stats is not None:
+            stats.frontier(depth)
+            actions = stats.expand(actions)
+        return iter(actions)
+
+    table = TranspositionTable(transposition_size)
+    bound = heuristic(problem, initial_state)
+
+    while True:
+        # The smallest f value that exceeded the bound in this iteration
+        next_bound = math.inf
+        table.clear()
+
+        # The current path: its states, their path costs, the actions between them
+        # and an iterator over the remaining actions of each state on the path
+        states, costs, actions = [initial_state], [0], []
+        on_path = {initial_state}
+        iterators = [expand(initial_state, 1)]
+
+        while iterators:
+            action = next(iterators[-1], None)
+            # All the actions of the deepest state were tried, so backtrack
+            if action is None:
+                iterators.pop()
+                on_path.discard(states.pop())
+                costs.pop()
+                if actions:
+                    actions.pop()
+                continue
+
+            state = states[-1]
+            child = problem.get_successor(state, action)
+            # Skip cycles along the current path
+            if child in on_path:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            cost = costs[-1] + problem.get_cost(state, action)
+            f = cost + heuristic(problem, child)
+            # The child is beyond the bound, remember the smallest such f for the next iteration
+            if f > bound:
+                next_bound = min(next_bound, f)
+                continue
+            # Since f <= bound <= the optimal cost, the first goal found is optimal
+            if problem.is_goal(child):
+                return actions + [action]
+            # Skip the child if it was already searched in this iteration with a lower or equal path cost
+            seen_cost = table.get(child)
+            if seen_cost is not None and seen_cost <= cost:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            table.put(child, cost)
+
+            # Go one level deeper
+            states.append(child)
+            costs.append(cost)
+            actions.append(action)
+            on_path.add(child)
+            iterators.append(expand(child, len(states)))
+
+        # If nothing exceeded the bound, the whole reachable space was searched and there is no solution
+        if next_bound == math.inf:
+            return None
+        bound = next_bound
+
+
+# Recursive Best First Search (RBFS) expands the best child while keeping the f value of the best alternative
+# as a limit. When the limit is exceeded, it backs up the best f value of the abandoned subtree to its root
+# so it can return to it later without storing the subtree.
+'''
+Memory: O(branching factor * depth) for the children of the states on the current path.
+Transposition table: maps each state to the lowest path cost it was generated with so far.
+                     A child reached with a strictly higher cost is skipped since any solution through it
+                     is dominated by the same solution through the cheaper path. States on an optimal path are always
+                     reached with their optimal cost, so they are never skipped and the solution stays optimal.
+The recursion depth equals the depth of the current path.
+'''
+def RecursiveBestFirstSearch(problem: Problem[S, A], initial_state: S, heuristic: HeuristicFunction, transposition_size: int = 0) -> Solution:
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted
+    stats = current_stats()
+    if stats is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
+
+    table = TranspositionTable(transposition_size)
+    on_path = {initial_state}
+
+    # Searches below the given state and returns (solution or None, backed-up f value of the state)
+    def search(state: S, cost: float, f_state: float, f_limit: float) -> Tuple[Solution, float]:
+        if problem.is_goal(state):
+            return [], f_state
+
+        # Each successor is [f, order, cost, child, action]; the order breaks ties in the generation order
+        successors = []
+        actions = problem.get_actions(state)
+        if stats is not None:
+            stats.frontier(len(on_path))
+            actions = stats.expand(actions)
+        for order, action in enumerate(actions):
+            child = problem.get_successor(state, action)
+            # Skip cycles along the current path
+            if child in on_path:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            child_cost = cost + problem.get_cost(state, action)
+            # Skip the child if it was already generated from a cheaper path
+            seen_cost = table.get(child)
+            if seen_cost is not None and seen_cost < child_cost:
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            table.put(child, child_cost)
+            # The child inherits the backed-up value of its parent if it is larger (path-max)
+            successors.append([max(child_cost + heuristic(problem, child), f_state), order, child_cost, child, action])
+        if not successors:
+            return None, math.inf
+
+        while True:
+            successors.sort(key=lambda successor: (successor[0], successor[1]))
+            best = successors[0]
+            # Stop if the best child exceeds the limit or if every child was searched exhaustively without a solution
+            if best[0] > f_limit or best[0] == math.inf:
+                return None, best[0]
+            alternative = successors[1][0] if len(successors) > 1 else math.inf
+            on_path.add(best[3])
+            result, best[0] = search(best[3], best[2], best[0], min(f_limit, alternative))
+            on_path.discard(best[3])
+            if result is not None:
+                # The actions are collected from the goal upwards and reversed once at the end
+                result.append(best[4])
+                return result, best[0]
+
+    solution, _ = search(initial_state, 0, heuristic(problem, initial_state), math.inf)
+    if solution is not None:
+        solution.reverse()
+    return solution
+
+
+# Bidirectional search runs a forward search from the initial state and a backward search from the goal
+# and stops when the two searches meet in the middle.
+'''
+Why bidirectional: if the branching factor is b and the solution depth is d,
+                   each search only goes about d/2 deep, so about 2*b^(d/2) nodes are expanded instead of b^d.
+Requirements: the problem must have a single goal and a "reverse(start)" method returning the backward problem
+              (whose initial state is the goal, whose actions lead to the predecessors of a state and whose goal is "start").
+              The actions must be the successor states themselves (as in GraphRoutingProblem)
+              so that a backward step can be turned into a forward action.
+'''
+
+# Joins the forward path (initial state -> meeting) and the backward path (meeting -> goal) into a list of actions
+# Each parents dictionary maps a state to the state it was reached from (None for the root)
+def BidirectionalSolution(forward_parents: Dict[S, Optional[S]], backward_parents: Dict[S, Optional[S]], meeting: S) -> List[A]:
+    actions = []
+    state = meeting
+    # Walk from the meeting state back to the initial state, then reverse the forward half
+    while forward_parents[state] is not None:
+        actions.append(state)
+        state = forward_parents[state]
+    actions.reverse()
+    # Walk from the meeting state forward to the goal following the backward search parents
+    state = backward_parents[meeting]
+    while state is not None:
+        actions.append(state)
+        state = backward_parents[state]
+    return actions
+
+
+def BidirectionalBreadthFirstSearch(problem: Problem[S, A], initial_state: S) -> Solution:
+    # Check if the root is already the goal state
+    if problem.is_goal(initial_state):
+        return []
 
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    stats = current_stats()
+
+    # The backward problem starts from the goal and searches for the initial state
+    backward = problem.reverse(initial_state)
+    goal = backward.get_initial_state()
+
+    # For each direction: the problem, the current BFS layer, the parent of each visited state and its depth
+    problems = (problem, backward)
+    layers = [[initial_state], [goal]]
+    parents = ({initial_state: None}, {goal: None})
+    depths = ({initial_state: 0}, {goal: 0})
+
+    while layers[0] and layers[1]:
+        # Expand the smaller layer since it generates fewer nodes
+        side = 0 if len(layers[0]) <= len(layers[1]) else 1
+        other = 1 - side
+        next_layer = []
+        best, meeting = None, None
+        # The whole layer is expanded before stopping since the first meeting state
+        # is not necessarily the one with the shortest total path
+        if stats is not None:
+            stats.frontier(len(layers[0]) + len(layers[1]))
+        for state in layers[side]:
+            actions = problems[side].get_actions(state)
+            if stats is not None:
+                actions = stats.expand(actions)
+            for action in actions:
+                child = problems[side].get_successor(state, action)
+                # Skip states that this direction already visited
+                if child in parents[side]:
+                    if stats is not None:
+                        stats.duplicates += 1
+                    continue
+                parents[side][child] = state
+                depths[side][child] = depths[side][state] + 1
+                next_layer.append(child)
+                # The child was already reached by the other search, so we found a path
+                if child in parents[other]:
+                    length = depths[side][child] + depths[other][child]
+                    if best is None or length < best:
+                        best, meeting = length, child
+        if meeting is not None:
+            return BidirectionalSolution(parents[0], parents[1], meeting)
+        layers[side] = next_layer
+
+    # If one of the searches ran out of nodes, there is no solution
+    return None
 
+
+def BidirectionalAStarSearch(problem: Problem[S, A], initial_state: S, heuristic: Optional[HeuristicFunction] = None) -> Solution:
+    # Check if the root is already the goal state
+    if problem.is_goal(initial_state):
+        return []
+
+    # The backward problem starts from the goal and searches for the initial state
+    backward = problem.reverse(initial_state)
+    goal = backward.get_initial_state()
+
+    # The search statistics to fill (None if they are disabled, see search_stats.py)
+    # The heuristic is wrapped so that its calls are counted
+    stats = current_stats()
+    if stats is not None and heuristic is not None:
+        heuristic = stats.wrap_heuristic(heuristic)
+
+    # Each direction orders its frontier by g + potential where the forward potential is
+    #   p(state) = (h_forward(state) - h_backward(state)) / 2
+    # and the backward potential is -p(state).
+    '''
+    Why average potentials: using h_forward and h_backward directly makes the two searches disagree on the
+                            stopping condition. With opposite potentials both searches see the same reduced edge costs,
+                            which are non-negative whenever the heuristic is consistent, so the search can stop as soon as
+                            top_forward + top_backward >= cost of the best path found so far.
+    Without a heuristic the potentials are zero and this is bidirectional Dijkstra (uniform cost) search.
+    '''
+    if heuristic is None:
+        potential: Callable[[S], float] = lambda state: 0
+    else:
+        potential = lambda state: (heuristic(problem, state) - heuristic(backward, state)) / 2
+    potentials = (potential, lambda state: -potential(state))
+
+    # For each direction: the problem, the frontier, the path cost of each reached state, its parent and the explored set
+    problems = (problem, backward)
+    frontiers = (PriorityFrontier(), PriorityFrontier())
+    costs = ({initial_state: 0}, {goal: 0})
+    parents = ({initial_state: None}, {goal: None})
+    explored = (set(), set())
+    frontiers[0].push(initial_state, potentials[0](initial_state))
+    frontiers[1].push(goal, potentials[1](goal))
+
+    # The cost of the best path found so far and the state where its two halves meet
+    best, meeting = math.inf, None
+
+    while frontiers[0] and frontiers[1]:
+        # No unexplored path can be cheaper than the best one found so far
+        if frontiers[0].peek() + frontiers[1].peek() >= best:
+            break
+
+        # Expand from the smaller frontier
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        other = 1 - side
+        if stats is not None:
+            stats.frontier(len(frontiers[0]) + len(frontiers[1]))
+        state, _, _ = frontiers[side].pop()
+        explored[side].add(state)
+
+        actions = problems[side].get_actions(state)
+        if stats is not None:
+            actions = stats.expand(actions)
+        for action in actions:
+            child = problems[side].get_successor(state, action)
+            cost = costs[side][state] + problems[side].get_cost(state, action)
+            # Skip explored children and children that were already reached with a lower cost
+            if child in explored[side] or cost >= costs[side].get(child, math.inf):
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+            costs[side][child] = cost
+            parents[side][child] = state
+            frontiers[side].push(child, cost + potentials[side](child))
+            # The child was already reached by the other search, so check if the joined path is the best so far
+            if child in costs[other] and cost + costs[other][child] < best:
+                best, meeting = cost + costs[other][child], child
+
+    # Return None if the two searches never met
+    if meeting is None:
+        return None
+    return BidirectionalSolution(parents[0], parents[1], meeting)
+
+
+def BidirectionalUniformCostSearch(problem: Problem[S, A], initial_state: S) -> Solution:
+    return BidirectionalAStarSearch(problem, initial_state)
@@ -0,0 +1,134 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+import json, sys, time, tracemalloc
+
+from problem import HeuristicFunction, Problem, S
+
+try:
+    import resource
+except ImportError:
+    # The resource module only exists on Unix, the peak memory is only available with trace_memory elsewhere
+    resource = None
+
+# This file contains the statistics that the search functions (in search.py) can collect
+# The statistics are disabled by default. They are enabled for the searches that run inside a "collect_stats" block:
+#
+#   with collect_stats() as stats:
+#       solution = AStarSearch(problem, initial_state, heuristic)
+#   print(stats)
+#
+# The active statistics are stored in a context variable, so every thread (and the autograder's test threads)
+# has its own, and the search functions do not need an extra parameter.
+# Each search function reads the context variable once, so when the statistics are disabled,
+# the only cost is a "stats is not None" check per expansion.
+
+# The statistics of one or more searches (the counters add up if several searches run in the same block)
+#   expansions: the number of expanded states (states whose actions were generated)
+#   generated: the number of generated children (successors)
+#   duplicates: the generated children that were pruned since their state was already explored or reached more cheaply
+#   peak_frontier: the largest frontier size (or the deepest path for IDA* and RBFS)
+#   heuristic_calls: the number of states the heuristic was evaluated on (including the batched evaluations)
+#   peak_memory: the peak memory in bytes; the peak of the traced allocations if trace_memory is enabled
+#                (which is exact but slows the search down), otherwise the peak resident memory of the process
+#   phases: the wall time in seconds of each phase ("total", "heuristic", the iterations of the anytime search...)
+@dataclass
+class SearchStats:
+    expansions: int = 0
+    generated: int = 0
+    duplicates: int = 0
+    peak_frontier: int = 0
+    heuristic_calls: int = 0
+    peak_memory: int = 0
+    phases: Dict[str, float] = field(default_factory=dict)
+    trace_memory: bool = False
+
+    # Records an expansion and returns its actions (as a list, so that they can be counted and iterated)
+    def expand(self, actions) -> Sequence:
+        if not isinstance(actions, Sequence):
+            actions = list(actions)
+        self.expansions += 1
+        self.generated += len(actions)
+        return actions
+
+    # Records the current frontier size
+    def frontier(self, size: int) -> None:
+        if size > self.peak_frontier:
+            self.peak_frontier = size
+
+    # Adds the given time (in seconds) to a phase
+    def add_phase(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    # Wraps a heuristic so that its calls (and its batch calls, see evaluate_heuristic) are counted and timed
+    def wrap_heuristic(self, heuristic: HeuristicFunction) -> HeuristicFunction:
+        def counted(problem: Problem, state: S) -> float:
+            start = time.perf_counter()
+            value = heuristic(problem, state)
+            self.add_phase("heuristic", time.perf_counter() - start)
+            self.heuristic_calls += 1
+            return value
+        batch = getattr(heuristic, "batch", None)
+        if batch is not None:
+            def counted_batch(problem: Problem, states: Sequence[S]) -> List[float]:
+                start = time.perf_counter()
+                values = batch(problem, states)
+                self.add_phase("heuristic", time.perf_counter() - start)
+                self.heuristic_calls += len(states)
+                return values
+            counted.batch = counted_batch
+        return counted
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data["trace_memory"]
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def __str__(self) -> str:
+        lines = [
+            f"Expanded: {self.expansions}, Generated: {self.generated}, Duplicates pruned: {self.duplicates}",
+            f"Peak frontier: {self.peak_frontier}, Heuristic calls: {self.heuristic_calls}, "
+            f"Peak memory: {self.peak_memory / 2**20:.1f} MiB ({'traced' if self.trace_memory else 'process'})",
+        ]
+        if self.phases:
+            lines.append("Phases: " + ", ".join(f"{name} {seconds:.4f}s" for name, seconds in self.phases.items()))
+        return "\n".join(lines)
+
+
+# The statistics of the current context (None if disabled)
+current: ContextVar[Optional[SearchStats]] = ContextVar("search_stats", default=None)
+
+# Returns the statistics that the searches of the current context should fill (None if disabled)
+def current_stats() -> Optional[SearchStats]:
+    return current.get()
+
+# Enables the statistics for the searches that run inside the block, and measures the total time and the peak memory
+@contextmanager
+def collect_stats(stats: Optional[SearchStats] = None, trace_memory: bool = False) -> Iterator[SearchStats]:
+    if stats is None:
+        stats = SearchStats(trace_memory=trace_memory)
+    token = current.set(stats)
+    # Only stop tracing at the end if this block started it
+    started_tracing = stats.trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif stats.trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.add_phase("total", time.perf_counter() - start)
+        if stats.trace_memory:
+            stats.peak_memory = max(stats.peak_memory, tracemalloc.get_traced_memory()[1])
+            if started_tracing:
+                tracemalloc.stop()
+        elif resource is not None:
+            # ru_maxrss is in kilobytes on Linux (and in bytes on macOS)
+            scale = 1 if sys.platform == "darwin" else 1024
+            stats.peak_memory = max(stats.peak_memory, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+        current.reset(token)
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import FrozenSet, Iterable
+from typing import Callable, Dict, FrozenSet, Iterable, List, Tuple
+from collections import deque
 from enum import Enum
 
 from mathutils import Direction, Point
@@ -26,13 +27,110 @@ class SokobanTile(str, Enum):
 # we only need the default equality which compares objects by pointers.
 # The layout contains the problem details that are unchangeable across states such as:
 #   The walkable area (locations without walls) and the locations of the goals
+# It also contains precomputed tables for the compiled (bitboard) representation:
+#   cells: the walkable locations indexed from 0 to N-1 (in row-major order)
+#   cell_index: the index of each walkable location
+#   neighbors: for each cell index and each direction, the index of the neighboring cell (or -1 if it is a wall)
+#   goal_mask: a bitmask with the bits of the goal cells set
+#   dead_mask: a bitmask with the bits of the dead squares set (see find_dead_squares)
+#   dead_squares: the locations of the dead squares
+# Use SokobanLayout.build to create a layout since it computes these tables
 @dataclass(eq=False, frozen=True)
 class SokobanLayout:
-    __slots__ = ("width", "height", "walkable", "goals")
+    __slots__ = ("width", "height", "walkable", "goals", "cells", "cell_index", "neighbors", "goal_mask", "dead_mask", "dead_squares")
     width: int
     height: int
     walkable: FrozenSet[Point]
     goals: FrozenSet[Point]
+    cells: Tuple[Point, ...]
+    cell_index: Dict[Point, int]
+    neighbors: Tuple[Tuple[int, ...], ...]
+    goal_mask: int
+    dead_mask: int
+    dead_squares: FrozenSet[Point]
+
+    @staticmethod
+    def build(width: int, height: int, walkable: FrozenSet[Point], goals: FrozenSet[Point]) -> 'SokobanLayout':
+        cells = tuple(sorted(walkable, key=lambda point: (point.y, point.x)))
+        cell_index = {point: index for index, point in enumerate(cells)}
+        neighbors = tuple(
+            tuple(cell_index.get(point + direction.to_vector(), -1) for direction in Direction)
+            for point in cells
+        )
+        goal_mask = 0
+        for goal in goals:
+            goal_mask |= 1 << cell_index[goal]
+        dead = find_dead_squares(neighbors, [cell_index[goal] for goal in goals])
+        dead_mask = 0
+        for index in dead:
+            dead_mask |= 1 << index
+        return SokobanLayout(width, height, walkable, goals, cells, cell_index, neighbors, goal_mask,
+                             dead_mask, frozenset(cells[index] for index in dead))
+
+    # Checks if the crate on the given cell index is frozen (cannot be pushed anymore along both axes)
+    # while one of the crates in its frozen group is not on a goal; such a state can never be solved.
+    # "has_crate" tells whether a cell index contains a crate (the state after the push).
+    '''
+    A crate is blocked along an axis (horizontal or vertical) if:
+        - there is a wall on either side, or
+        - both sides are dead squares, or
+        - there is a crate on either side which is frozen itself (while treating this crate as a wall)
+    A crate is frozen if it is blocked along both axes.
+    '''
+    def is_freeze_deadlock(self, crate: int, has_crate: Callable[[int], bool]) -> bool:
+        neighbors, dead_mask = self.neighbors, self.dead_mask
+        # The crates found to be frozen while checking this crate
+        frozen: List[int] = []
+
+        def is_blocked(index: int, axis: int, walls: FrozenSet[int]) -> bool:
+            # axis 0 is horizontal (RIGHT and LEFT) and axis 1 is vertical (UP and DOWN)
+            first, second = neighbors[index][axis], neighbors[index][axis + 2]
+            if first < 0 or second < 0 or first in walls or second in walls:
+                return True
+            if dead_mask >> first & 1 and dead_mask >> second & 1:
+                return True
+            return any(has_crate(side) and is_frozen(side, walls) for side in (first, second))
+
+        def is_frozen(index: int, walls: FrozenSet[int]) -> bool:
+            walls = walls | {index}
+            if is_blocked(index, 0, walls) and is_blocked(index, 1, walls):
+                frozen.append(index)
+                return True
+            return False
+
+        if not is_frozen(crate, frozenset()):
+            return False
+        return any(not self.goal_mask >> index & 1 for index in frozen)
+
+    # Rebuild the layout (and its tables) when unpickling since the class is frozen and uses __slots__
+    def __reduce__(self):
+        return (SokobanLayout.build, (self.width, self.height, self.walkable, self.goals))
+
+# Finds the dead squares: the cells from which a crate can never be pushed to any goal
+# (the crate is lost as soon as it is pushed there, e.g. a corner that is not a goal)
+# The neighbors table is indexed by [cell][direction] as in SokobanLayout.
+'''
+How: we run a BFS that "pulls" a crate backwards starting from every goal.
+     A crate on cell c can come from cell p = c - d by a push in direction d
+     if p is walkable and the player could stand behind it at p - d.
+     Every cell not reached by the pulls is dead.
+'''
+def find_dead_squares(neighbors: Tuple[Tuple[int, ...], ...], goals: List[int]) -> List[int]:
+    alive = set(goals)
+    frontier = deque(goals)
+    while frontier:
+        cell = frontier.popleft()
+        for direction in Direction:
+            # The cell the crate was pushed from, and the cell the player pushed it from
+            previous = neighbors[cell][direction.rotate(2)]
+            if previous < 0 or previous in alive:
+                continue
+            player = neighbors[previous][direction.rotate(2)]
+            if player < 0:
+                continue
+            alive.add(previous)
+            frontier.append(previous)
+    return [cell for cell in range(len(neighbors)) if cell not in alive]
 
 # For the sokoban state, we use dataclass with frozen=True to automatically implement:
 #   the constructor, the == operator, the hash function and to make the class immutable
@@ -46,6 +144,10 @@ class SokobanState:
     player: Point
     crates: FrozenSet[Point]
 
+    # Rebuild the state via the constructor when unpickling since the class is frozen and uses __slots__
+    def __reduce__(self):
+        return (SokobanState, (self.layout, self.player, self.crates))
+
     # This operator will convert the state to a string containing the grid representation of the level at the current state
     def __str__(self) -> str:
         def position_to_str(position):
@@ -59,8 +161,6 @@ class SokobanState:
                 return SokobanTile.GOAL
             return SokobanTile.EMPTY
         return '\n'.join(''.join(position_to_str(Point(x, y)) for x in range(self.layout.width)) for y in range(self.layout.height))
-    
-    
 
 # This is a list of all the possible actions for the sokoban agent
 AllSokobanActions = [
@@ -75,6 +175,12 @@ class SokobanProblem(Problem[SokobanState, Direction]):
     # The problem will contain the sokoban layout and the inital state
     layout: SokobanLayout
     initial_state: SokobanState
+    # Deadlock pruning switches: when enabled, get_actions skips the pushes that lead to unsolvable states
+    #   prune_dead_squares: skip pushing a crate onto a dead square
+    #   prune_freeze_deadlocks: skip pushes after which a group of frozen crates is not on goals
+    # They are disabled by default to keep the search spaces (and expansion counts) of the original problem
+    prune_dead_squares: bool = False
+    prune_freeze_deadlocks: bool = False
 
     def get_initial_state(self) -> SokobanState:
         return self.initial_state
@@ -96,9 +202,22 @@ class SokobanProblem(Problem[SokobanState, Direction]):
                 crate_position = position + direction.to_vector()
                 if crate_position not in self.layout.walkable or crate_position in state.crates:
                     continue
+                # make sure that the push does not lead to a deadlock (if enabled)
+                if self.prune_dead_squares and crate_position in self.layout.dead_squares:
+                    continue
+                if self.prune_freeze_deadlocks and self.is_freeze_deadlock(state.crates, position, crate_position):
+                    continue
             actions.append(direction)
         return actions
 
+    # Checks if pushing the crate from "source" to "target" freezes it in a deadlock
+    def is_freeze_deadlock(self, crates: FrozenSet[Point], source: Point, target: Point) -> bool:
+        cells, target_index = self.layout.cells, self.layout.cell_index[target]
+        def has_crate(index: int) -> bool:
+            cell = cells[index]
+            return index == target_index or (cell != source and cell in crates)
+        return self.layout.is_freeze_deadlock(target_index, has_crate)
+
     def get_successor(self, state: SokobanState, action: Direction) -> SokobanState:
         player = state.player + action.to_vector()
         crates = state.crates
@@ -142,7 +261,7 @@ class SokobanProblem(Problem[SokobanState, Direction]):
                         crates.add(Point(x, y))
                         goals.add(Point(x, y))
         problem = SokobanProblem()
-        problem.layout = SokobanLayout(width, height, frozenset(walkable), frozenset(goals))
+        problem.layout = SokobanLayout.build(width, height, frozenset(walkable), frozenset(goals))
         problem.initial_state = SokobanState(problem.layout, player, frozenset(crates))
         return problem
 
@@ -150,4 +269,138 @@ class SokobanProblem(Problem[SokobanState, Direction]):
     @staticmethod
     def from_file(path: str) -> 'SokobanProblem':
         with open(path, 'r') as f:
-            return SokobanProblem.from_text(f.read())
\ No newline at end of file
+            return SokobanProblem.from_text(f.read())
+
+
+# The compiled (bitboard) sokoban state stores:
+#   player_index: the index of the player's cell in layout.cells
+#   crate_mask: an integer where bit i is set if there is a crate on the cell layout.cells[i]
+# Hashing and comparing two ints is much cheaper than hashing a frozenset of points,
+# and moving a crate is a single xor instead of allocating new points and a new frozenset.
+# The "player" and "crates" properties decode the state into points so that code written for
+# SokobanState (such as the heuristics) still works, but they are slower than using the indices directly.
+# The decoded crates are kept on the state (in a slot that is not a dataclass field, so it is ignored by
+# the equality and the hash), so a state is decoded at most once however many heuristics read it.
+@dataclass(frozen=True)
+class SokobanBitboardState:
+    __slots__ = ("layout", "player_index", "crate_mask", "decoded_crates")
+    layout: SokobanLayout
+    player_index: int
+    crate_mask: int
+
+    @property
+    def player(self) -> Point:
+        return self.layout.cells[self.player_index]
+
+    @property
+    def crates(self) -> FrozenSet[Point]:
+        try:
+            return self.decoded_crates
+        except AttributeError:
+            crates = frozenset(self.layout.cells[index] for index in self.crate_indices())
+            object.__setattr__(self, "decoded_crates", crates)
+            return crates
+
+    # Returns the cell indices of the crates in increasing order (only the set bits of the mask are visited)
+    def crate_indices(self) -> List[int]:
+        indices = []
+        mask = self.crate_mask
+        while mask:
+            lowest = mask & -mask
+            indices.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return indices
+
+    # Converts the compiled state to the regular sokoban state
+    def decode(self) -> SokobanState:
+        return SokobanState(self.layout, self.player, self.crates)
+
+    def __str__(self) -> str:
+        return str(self.decode())
+
+    # Rebuild the state via the constructor when unpickling since the class is frozen and uses __slots__
+    def __reduce__(self):
+        return (SokobanBitboardState, (self.layout, self.player_index, self.crate_mask))
+
+    # Converts a regular sokoban state to the compiled state
+    @staticmethod
+    def encode(state: SokobanState) -> 'SokobanBitboardState':
+        crate_mask = 0
+        for crate in state.crates:
+            crate_mask |= 1 << state.layout.cell_index[crate]
+        return SokobanBitboardState(state.layout, state.layout.cell_index[state.player], crate_mask)
+
+# The directions in the order in which get_actions tries them (same as iterating over Direction)
+AllDirections = tuple(Direction)
+
+# This is the sokoban problem on the compiled representation
+# It has the same actions, costs and solutions as SokobanProblem, but the states are SokobanBitboardState
+class SokobanBitboardProblem(SokobanProblem):
+    initial_state: SokobanBitboardState
+
+    def is_goal(self, state: SokobanBitboardState) -> bool:
+        return state.crate_mask == self.layout.goal_mask
+
+    # We use @track_call_count to track the number of times this function was called to count the number of explored nodes
+    @track_call_count
+    def get_actions(self, state: SokobanBitboardState) -> Iterable[Direction]:
+        actions = []
+        neighbors = self.layout.neighbors
+        crates = state.crate_mask
+        player_neighbors = neighbors[state.player_index]
+        for direction in AllDirections:
+            position = player_neighbors[direction]
+            # Disallow walking into walls
+            if position < 0: continue
+            # Check if walking into a crate
+            if crates >> position & 1:
+                # make sure that the crate is not pushed into a wall or another crate
+                crate_position = neighbors[position][direction]
+                if crate_position < 0 or crates >> crate_position & 1:
+                    continue
+                # make sure that the push does not lead to a deadlock (if enabled)
+                if self.prune_dead_squares and self.layout.dead_mask >> crate_position & 1:
+                    continue
+                if self.prune_freeze_deadlocks:
+                    pushed = crates ^ ((1 << position) | (1 << crate_position))
+                    if self.layout.is_freeze_deadlock(crate_position, lambda index: pushed >> index & 1):
+                        continue
+            actions.append(direction)
+        return actions
+
+    def get_successor(self, state: SokobanBitboardState, action: Direction) -> SokobanBitboardState:
+        neighbors = self.layout.neighbors
+        crates = state.crate_mask
+        player = neighbors[state.player_index][action]
+        if player < 0:
+            # If we try to walk into a wall, then this action is wrong
+            raise Exception(f"Invalid action {action} in state:" + "\n" + str(state))
+        if crates >> player & 1:
+            crate_position = neighbors[player][action]
+            if crate_position < 0 or crates >> crate_position & 1:
+                # If we try to push a crate into a wall or another crate, then this action is wrong
+                raise Exception(f"Invalid action {action} in state:" + "\n" + str(state))
+            # If we walk to a crate, we push it
+            crates ^= (1 << player) | (1 << crate_position)
+        return SokobanBitboardState(state.layout, player, crates)
+
+    # Compile a regular sokoban problem
+    @staticmethod
+    def from_problem(problem: SokobanProblem) -> 'SokobanBitboardProblem':
+        compiled = SokobanBitboardProblem()
+        compiled.prune_dead_squares = problem.prune_dead_squares
+        compiled.prune_freeze_deadlocks = problem.prune_freeze_deadlocks
+        compiled.layout = problem.layout
+        compiled.initial_state = SokobanBitboardState.encode(problem.initial_state)
+        return compiled
+
+    # Read a sokoban problem from text containing a grid of tiles
+    @staticmethod
+    def from_text(text: str) -> 'SokobanBitboardProblem':
+        return SokobanBitboardProblem.from_problem(SokobanProblem.from_text(text))
+
+    # Read a sokoban problem from file containing a grid of tiles
+    @staticmethod
+    def from_file(path: str) -> 'SokobanBitboardProblem':
+        with open(path, 'r') as f:
+            return SokobanBitboardProblem.from_text(f.read())
@@ -1,115 +1,42 @@
 import math
-from sokoban import AllSokobanActions, SokobanLayout, SokobanProblem, SokobanState
-from mathutils import Direction, Point, manhattan_distance
+from sokoban import AllSokobanActions, SokobanBitboardState, SokobanLayout, SokobanProblem, SokobanState
+from mathutils import Direction, Point, manhattan_distance, manhattan_distances, paired_manhattan_distances
 from helpers.utils import NotImplemented
-from typing import Tuple
-import heapq
-from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from sokoban_pdb import PatternDatabase, load_pattern_database, pattern_database_path
+import heapq, itertools, warnings
+from collections import OrderedDict, deque
 # This heuristic returns the distance between the player and the nearest crate as an estimate for the path cost
 # While it is consistent, it does a bad job at estimating the actual cost thus the search will explore a lot of nodes before finding a goal
 def weak_heuristic(problem: SokobanProblem, state: SokobanState):
     return min(manhattan_distance(state.player, crate) for crate in state.crates) - 1
 
-#TODO: Import any modules and write any functions you want to use
+# Computes the distance between the player and the nearest crate minus 1 for each state
+# The distances of all the (player, crate) pairs of the batch are computed at once (see paired_manhattan_distances)
+def walking_steps_batch(states: Sequence[SokobanState]) -> List[float]:
+    players, crates, owners = [], [], []
+    for index, state in enumerate(states):
+        for crate in state.crates:
+            players.append(state.player)
+            crates.append(crate)
+            owners.append(index)
+    nearest = [math.inf] * len(states)
+    for owner, distance in zip(owners, paired_manhattan_distances(players, crates)):
+        if distance < nearest[owner]:
+            nearest[owner] = distance
+    return [distance - 1 for distance in nearest]
 
-# def is_deadlock(state, layout):
-#     # Extract the dimensions of the grid
-#     height, width = layout.height, layout.width
-
-#     # Check if the state is empty or the walkable positions don't cover the entire grid
-#     if not state or len(state.layout.walkable) != height * width:
-#         # If the state is empty or walkable positions are incomplete, there's no deadlock
-#         return False
-
-#     def find_boxes_and_goals(state, layout):
-#         # Helper function to find positions of boxes, goals, and player
-#         boxes, goals, player = [], [], None
-
-#         # Iterate through the grid to find boxes, goals, and player
-#         for row in range(layout.height):
-#             for col in range(layout.width):
-#                 char = state.layout.get_char_at(Point(row, col))
-#                 if char == '$':
-#                     boxes.append((row, col))
-#                 elif char == '.':
-#                     goals.append((row, col))
-#                 elif char == '@':
-#                     player = (row, col)
-
-#         return boxes, goals, player
-
-#     def is_corner_deadlock(box):
-#         # Check if the box is in a corner and surrounded by walls
-#         bx, by = box
-#         box_position = bx * width + by
-#         for pos in [(bx - 1, by), (bx + 1, by), (bx, by - 1), (bx, by + 1)]:
-#             if state.layout.walkable(Point(*pos)) == '#':
-#                 # If the box is in a corner surrounded by walls, it's a deadlock
-#                 return True
-#         return False
-
-#     def is_double_box_deadlock(box):
-#         # Check for a deadlock when two boxes are close to each other
-#         bx, by = box
-#         double_box_positions = [
-#             (0, -1),
-#             (0, 1),
-#             (-1, 0),
-#             (1, 0),
-#         ]
-
-#         # Iterate over possible positions for a second box relative to the first
-#         for pos in double_box_positions:
-#             # Create a set of walkable characters at the specified positions
-#             pos_set = set(state.layout.walkable(Point(bx + dir % width, by + dir // width)) for dir in pos)
-
-#             # Check if the set matches any of the deadlock conditions
-#             if pos_set in ({'@', '+'}, {'@'}, {'@', '$'}, {'@', '$', '+'}):
-#                 # If a deadlock condition is met, return True
-#                 return True
-#         return False
-
-#     def is_too_many_boxes_deadlock(position_range):
-#         # Count the number of boxes and goals in the specified range
-#         box_count = goal_count = 0
-
-#         # Iterate over the positions in the specified range
-#         for i in position_range:
-#             # Check the walkable character at each position
-#             if state.layout.walkable(Point(i % width, i // width)) in {'@'}:
-#                 # If a box is found, increment the box count
-#                 box_count += 1
-#             elif state.layout.walkable(Point(i % width, i // width)) in {'.'}:
-#                 # If a goal is found, increment the goal count
-#                 goal_count += 1
-
-#         # Check if there are too many boxes compared to goals in the range
-#         return box_count > goal_count
-
-#     # Obtain the positions of boxes, goals, and player
-#     boxes, goals, player = find_boxes_and_goals(state, layout)
-
-#     # Check for deadlock conditions for each box
-#     for box in boxes:
-#         if is_corner_deadlock(box) or is_double_box_deadlock(box):
-#             # If a deadlock condition is met for any box, return True
-#             return True
-
-#     # Check for deadlock conditions based on the specified range
-#     for r in [range(width + 1, 2 * width - 1),
-#               range(width * (height - 2) + 1, width * (height - 2) + width - 1),
-#               range(width + 1, width * (height - 1) + 1, width),
-#               range(2 * width - 2, width * height - 2, width)]:
-#         if is_too_many_boxes_deadlock(r):
-#             # If a deadlock condition is met in the specified range, return True
-#             return True
-
-#     # If no deadlock conditions are met, return False
-#     return False
+# The batch version of weak_heuristic (see evaluate_heuristic in problem.py)
+def weak_heuristic_batch(problem: SokobanProblem, states: Sequence[SokobanState]) -> List[float]:
+    return walking_steps_batch(states)
 
+weak_heuristic.batch = weak_heuristic_batch
 
+#TODO: Import any modules and write any functions you want to use
 
-def strong_heuristic(problem: SokobanProblem, state: SokobanState) -> float:
+# This heuristic sums the manhattan distance from each crate to its nearest goal
+# It ignores the walls and lets several crates count the same goal
+def nearest_goal_heuristic(problem: SokobanProblem, state: SokobanState) -> float:
 
     # Check if the root is already the goal state
     if problem.is_goal(state):
@@ -126,11 +53,315 @@ def strong_heuristic(problem: SokobanProblem, state: SokobanState) -> float:
         # This heap will help efficiently find the nearest goal for each crate
         heapq.heappush(crate_distances, goal_distance)
 
-    # Integrate deadlock penalty into the heuristic
-    deadlock_penalty = 0
-    # if is_deadlock(state, state.layout):
-    #     deadlock_penalty = 1000  
-
     # Ensure the heuristic is consistent by taking the sum
-    return sum(crate_distances) + deadlock_penalty
- 
\ No newline at end of file
+    return sum(crate_distances)
+
+# The batch version of nearest_goal_heuristic
+# The distances between all the crates of the batch and all the goals are computed at once
+def nearest_goal_heuristic_batch(problem: SokobanProblem, states: Sequence[SokobanState]) -> List[float]:
+    crates, owners = [], []
+    for index, state in enumerate(states):
+        if problem.is_goal(state): continue
+        crates.extend(state.crates)
+        owners.extend([index] * len(state.crates))
+    values = [0] * len(states)
+    for owner, distances in zip(owners, manhattan_distances(crates, list(problem.layout.goals))):
+        values[owner] += min(distances)
+    return values
+
+nearest_goal_heuristic.batch = nearest_goal_heuristic_batch
+
+
+# Computes the push distance from every cell to every goal: the minimum number of pushes needed to move
+# a crate from the cell to the goal if there were no other crates (and the player could walk anywhere)
+# Returns a dictionary mapping each walkable cell to a tuple of its distances to each goal (math.inf if unreachable)
+'''
+How: a BFS per goal that "pulls" the crate backwards (as in sokoban.find_dead_squares).
+     A crate on cell c can come from p = c - d with one push if the player could stand at p - d.
+The distances are computed once per layout and stored in the problem cache.
+'''
+def push_distances(problem: SokobanProblem) -> Dict[Point, Tuple[float, ...]]:
+    cache = problem.cache()
+    distances = cache.get("push_distances")
+    if distances is not None:
+        return distances
+    layout: SokobanLayout = problem.layout
+    neighbors = layout.neighbors
+    goals = sorted(layout.goals, key=lambda point: (point.y, point.x))
+    per_goal = []
+    for goal in goals:
+        start = layout.cell_index[goal]
+        distance = {start: 0}
+        frontier = deque([start])
+        while frontier:
+            cell = frontier.popleft()
+            for direction in Direction:
+                # The cell the crate was pushed from, and the cell the player pushed it from
+                previous = neighbors[cell][direction.rotate(2)]
+                if previous < 0 or previous in distance:
+                    continue
+                if neighbors[previous][direction.rotate(2)] < 0:
+                    continue
+                distance[previous] = distance[cell] + 1
+                frontier.append(previous)
+        per_goal.append(distance)
+    distances = {
+        cell: tuple(distance.get(index, math.inf) for distance in per_goal)
+        for index, cell in enumerate(layout.cells)
+    }
+    cache["push_distances"] = distances
+    return distances
+
+
+# A minimum cost assignment of crates (rows, identified by their points or cell indices) to goals (columns) using the Hungarian algorithm
+# It keeps its dual potentials (u for rows, v for columns) so that when a single crate moves,
+# the assignment can be repaired in O(n^2) by re-matching that row only, instead of solving again in O(n^3).
+'''
+Invariants of the Hungarian algorithm: u[i] + v[j] <= cost[i][j] for every row i and column j (dual feasibility),
+and u[i] + v[j] == cost[i][j] for every matched pair. When the costs of row i change, we unmatch it and lower u[i]
+to keep it feasible; all other matched pairs are still tight, so a single augmentation from row i restores optimality.
+Infinite costs (unreachable goals) are replaced by a large finite cost so that the arithmetic stays valid.
+Rectangular matrices: when there are more goals than crates, the matrix is padded with dummy rows that cost 0 for
+every goal. The dual of a rectangular assignment needs v[j] == 0 for every unmatched column, which the repair
+breaks when it frees a column whose v[j] is negative (the repaired assignment can then cost more than the optimum).
+A square matrix has no unmatched columns, and the dummy rows add nothing to the cost.
+'''
+class CrateAssignment:
+    def __init__(self, crates: List[Union[Point, int]], costs: List[Tuple[float, ...]], infinity: float) -> None:
+        self.crates = list(crates)
+        self.infinity = infinity
+        self.costs = [[min(cost, infinity) for cost in row] for row in costs]
+        columns = len(self.costs[0]) if self.costs else 0
+        self.costs.extend([0] * columns for _ in range(columns - len(self.costs)))
+        rows = len(self.costs)
+        # The arrays are 1-indexed; index 0 is a dummy used by the augmentation
+        self.u = [0.0] * (rows + 1)
+        self.v = [0.0] * (columns + 1)
+        # match[j] is the row matched to column j (0 if unmatched)
+        self.match = [0] * (columns + 1)
+        for row in range(1, rows + 1):
+            self.augment(row)
+
+    def copy(self) -> 'CrateAssignment':
+        other = CrateAssignment.__new__(CrateAssignment)
+        other.crates = list(self.crates)
+        other.infinity = self.infinity
+        other.costs = list(self.costs)
+        other.u, other.v, other.match = list(self.u), list(self.v), list(self.match)
+        return other
+
+    # Finds the shortest augmenting path from an unmatched row and flips it
+    def augment(self, row: int) -> None:
+        costs, u, v, match = self.costs, self.u, self.v, self.match
+        columns = len(v) - 1
+        match[0] = row
+        column = 0
+        min_slack = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        way = [0] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = match[column]
+            delta, next_column = math.inf, 0
+            for j in range(1, columns + 1):
+                if used[j]: continue
+                slack = costs[current_row - 1][j - 1] - u[current_row] - v[j]
+                if slack < min_slack[j]:
+                    min_slack[j], way[j] = slack, column
+                if min_slack[j] < delta:
+                    delta, next_column = min_slack[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_slack[j] -= delta
+            column = next_column
+            if match[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+
+    # Replaces the crate "old" by "new" (whose row of costs is given) and repairs the assignment
+    def move(self, old: Union[Point, int], new: Union[Point, int], costs: Tuple[float, ...]) -> None:
+        row = self.crates.index(old) + 1
+        self.crates[row - 1] = new
+        self.costs[row - 1] = [min(cost, self.infinity) for cost in costs]
+        for j in range(1, len(self.match)):
+            if self.match[j] == row:
+                self.match[j] = 0
+        self.u[row] = min(cost - v for cost, v in zip(self.costs[row - 1], self.v[1:]))
+        self.augment(row)
+
+    # The total cost of the assignment (math.inf if some crate had to be assigned to an unreachable goal)
+    def cost(self) -> float:
+        total = sum(self.costs[row - 1][column - 1] for column, row in enumerate(self.match) if column and row)
+        return math.inf if total >= self.infinity else total
+
+
+# The number of crate configurations whose assignment is kept in the problem cache (least recently used first out)
+AssignmentCacheSize = 2**12
+
+# Returns the minimum total push distance over all the assignments of the crates to the goals
+# The assignments of the recently evaluated crate configurations are cached in the problem cache (a bounded LRU,
+# as in cached_heuristic). When the configuration differs from the last evaluated one by a single crate
+# (as for a child generated by a push), the assignment is repaired incrementally instead of being recomputed.
+# On bitboard states (see SokobanBitboardState), the configurations are keyed by the crate mask and the crates
+# are identified by their cell indices, so the crates are never decoded into points.
+# Other states (including the push states of sokoban_push.py, which also have a crate mask) go through their crates.
+def assignment_pushes(problem: SokobanProblem, state: SokobanState) -> float:
+    crate_mask: Optional[int] = state.crate_mask if isinstance(state, SokobanBitboardState) else None
+    crates = state.crates if crate_mask is None else crate_mask
+    cache = problem.cache()
+    assignments: Optional[OrderedDict] = cache.get("crate_assignments")
+    if assignments is None:
+        assignments = cache["crate_assignments"] = OrderedDict()
+    assignment = assignments.get(crates)
+    if assignment is not None:
+        assignments.move_to_end(crates)
+    else:
+        distances = push_distances(problem)
+        cells = state.layout.cells
+        last: Optional[Tuple[object, CrateAssignment]] = cache.get("last_crate_assignment")
+        if last is not None and crate_mask is not None and (last[0] ^ crate_mask).bit_count() == 2:
+            # A single crate moved, so repair the last assignment
+            moved = last[0] ^ crate_mask
+            old, new = (moved & last[0]).bit_length() - 1, (moved & crate_mask).bit_length() - 1
+            assignment = last[1].copy()
+            assignment.move(old, new, distances[cells[new]])
+        elif last is not None and crate_mask is None and len(crates.symmetric_difference(last[0])) == 2:
+            (old,), (new,) = last[0] - crates, crates - last[0]
+            assignment = last[1].copy()
+            assignment.move(old, new, distances[new])
+        else:
+            # The cells are sorted like the points, so both representations build the same assignment
+            ordered = sorted(crates, key=lambda point: (point.y, point.x)) if crate_mask is None else state.crate_indices()
+            if len(ordered) > len(state.layout.goals):
+                return math.inf
+            infinity = (len(cells) + 1) * (len(ordered) + 1)
+            rows = [distances[crate] for crate in ordered] if crate_mask is None else [distances[cells[crate]] for crate in ordered]
+            assignment = CrateAssignment(ordered, rows, infinity)
+        assignments[crates] = assignment
+        if len(assignments) > AssignmentCacheSize:
+            assignments.popitem(last=False)
+    cache["last_crate_assignment"] = (crates, assignment)
+    return assignment.cost()
+
+# The number of steps the player needs to walk next to a crate before it can push anything
+def walking_steps(state: SokobanState) -> int:
+    return min(manhattan_distance(state.player, crate) for crate in state.crates) - 1
+
+# This heuristic is the minimum cost assignment of the crates to the goals where the cost of assigning
+# a crate to a goal is the push distance between them (so it accounts for the walls and every goal gets one crate),
+# plus the number of steps the player needs to reach the nearest crate before the first push.
+'''
+Why it is admissible: each push moves one crate by one cell, so the pushes needed are at least the assignment cost,
+                      and the player has to walk next to a crate before pushing anything.
+Why it is consistent: a step that pushes a crate changes its push distance (and thus the assignment) by at most 1,
+                      while the player stays next to the pushed crate; a step that only walks changes the player term by
+                      at most 1. The heuristic is infinite when a crate can not reach any goal (a dead square) and it stays
+                      infinite in all the following states.
+'''
+def strong_heuristic(problem: SokobanProblem, state: SokobanState) -> float:
+
+    # Check if the root is already the goal state
+    if problem.is_goal(state):
+        return 0
+
+    pushes = assignment_pushes(problem, state)
+    if pushes == math.inf:
+        return math.inf
+    return pushes + walking_steps(state)
+
+# The batch version of strong_heuristic: the walking steps of the whole batch are computed at once
+# while the assignments are still solved (or repaired) state by state
+def strong_heuristic_batch(problem: SokobanProblem, states: Sequence[SokobanState]) -> List[float]:
+    values = []
+    for state, walking in zip(states, walking_steps_batch(states)):
+        if problem.is_goal(state):
+            values.append(0)
+            continue
+        pushes = assignment_pushes(problem, state)
+        values.append(math.inf if pushes == math.inf else pushes + walking)
+    return values
+
+strong_heuristic.batch = strong_heuristic_batch
+
+
+# The number of crates in each pattern of the pattern database heuristic
+PatternDatabaseSize = 2
+
+# Returns the largest sum of pattern database values over the partitions of the crates into patterns
+# The crates left over when their number is not a multiple of the pattern size count their push distance alone.
+'''
+Every partition gives a lower bound since the pushes of disjoint patterns never overlap, so we take the best one.
+The best partition is found with a search over the subsets of the crates that are not in a pattern yet
+(the pattern containing the lowest remaining crate is chosen first so that every partition is generated once).
+'''
+def pattern_database_pushes(problem: SokobanProblem, state: SokobanState, database: PatternDatabase) -> float:
+    layout = state.layout
+    crates = sorted(layout.cell_index[crate] for crate in state.crates)
+    player = layout.cell_index[state.player]
+    distances = push_distances(problem)
+    singles = [min(distances[layout.cells[crate]]) for crate in crates]
+    size = database.size
+    best: Dict[Tuple[int, ...], float] = {}
+
+    def search(remaining: Tuple[int, ...]) -> float:
+        if len(remaining) < size:
+            return sum(singles[index] for index in remaining)
+        value = best.get(remaining)
+        if value is not None:
+            return value
+        first, rest = remaining[0], remaining[1:]
+        value = -math.inf
+        for others in itertools.combinations(rest, size - 1):
+            pattern = database.lookup(tuple(crates[index] for index in (first,) + others), player)
+            if pattern == math.inf:
+                value = math.inf
+                break
+            left = tuple(index for index in rest if index not in others)
+            value = max(value, pattern + search(left))
+        best[remaining] = value
+        return value
+
+    return search(tuple(range(len(crates))))
+
+# This heuristic uses additive pattern databases built (once per layout, see sokoban_pdb.py) over pairs of crates:
+# the exact number of pushes needed to solve each pair alone, accounting for the walls and the player position.
+# It takes the maximum of this value and the assignment pushes of strong_heuristic, plus the walking steps.
+'''
+Why it is consistent: the value of each pattern is an exact distance in an abstraction of the problem, where walking
+                      is free and a push moves at most one crate of the pattern, so each step changes the value of each
+                      partition by at most 1 (and only the pushed pattern changes). The maximum of consistent
+                      heuristics is consistent, and the walking steps follow the same reasoning as strong_heuristic.
+Loading: the database is only loaded (mapped from its file) the first time the heuristic is called on a problem,
+         then kept in the problem cache. The heuristic never builds it: build it beforehand with
+         "python sokoban_pdb.py <levels>" (or load_pattern_database(layout, build=True)). If there is no database
+         for the layout, the heuristic warns once and falls back to strong_heuristic.
+         The values are not cached per state; wrap the heuristic with cached_heuristic (see problem.py) if needed.
+'''
+def pattern_database_heuristic(problem: SokobanProblem, state: SokobanState) -> float:
+
+    # Check if the root is already the goal state
+    if problem.is_goal(state):
+        return 0
+
+    cache = problem.cache()
+    database = cache.get("pattern_database")
+    if database is None:
+        database = load_pattern_database(problem.layout, PatternDatabaseSize)
+        if database is None:
+            warnings.warn(f"There is no pattern database for this layout at {pattern_database_path(problem.layout, PatternDatabaseSize)} "
+                          "(build it with sokoban_pdb.py), falling back to strong_heuristic")
+            # False marks the missing database so that the file is only looked up once per problem
+            database = False
+        cache["pattern_database"] = database
+    if database is False:
+        return strong_heuristic(problem, state)
+
+    pushes = max(pattern_database_pushes(problem, state, database), assignment_pushes(problem, state))
+    return math.inf if pushes == math.inf else pushes + walking_steps(state)
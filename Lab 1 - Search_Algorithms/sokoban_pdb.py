@@ -0,0 +1,180 @@
+from typing import FrozenSet, List, Optional, Tuple
+from collections import deque
+import argparse, hashlib, itertools, mmap, os, struct, time
+
+from sokoban import AllDirections, SokobanLayout, SokobanProblem
+
+# This file contains pattern databases (PDBs) for sokoban layouts
+# A pattern database stores the exact number of pushes needed to bring every subset of "size" crates to the goals
+# (from every player cell) if the other crates were removed from the level.
+# Since each push moves a single crate, the pushes counted for disjoint subsets of crates never overlap,
+# so the values of the subsets in any partition of the crates can be added and still give a lower bound (additive PDBs).
+
+# The databases are built once per layout and stored in files so that later runs only need to map them into memory.
+# The files are named after the layout fingerprint, so a level whose layout did not change reuses its database.
+PatternDatabaseDirectory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pattern_databases")
+
+# The file format (little endian):
+#   header: magic (8 bytes), pattern size (uint8), number of cells (uint32), layout fingerprint (20 bytes sha1 digest)
+#   table: one uint8 per (crate subset, player cell) in the order rank(subset) * cells + player cell
+#          where the rank of a subset is its index in the combinatorial number system
+# Unreachable entries (the crates cannot reach the goals, or the player cell is not free) store Unreachable.
+HeaderFormat = "<8sBI20s"
+HeaderMagic = b"SOKOPDB1"
+Unreachable = 255
+
+# Computes a fingerprint of the parts of the layout that define the pattern database (the walls and the goals)
+def layout_fingerprint(layout: SokobanLayout) -> bytes:
+    cells = ";".join(f"{cell.x},{cell.y}" for cell in layout.cells)
+    goals = ";".join(f"{goal.x},{goal.y}" for goal in sorted(layout.goals, key=lambda point: (point.y, point.x)))
+    return hashlib.sha1(f"{layout.width}x{layout.height}|{cells}|{goals}".encode()).digest()
+
+# A pattern database over a layout, backed by a bytes-like table (a memory map when loaded from a file)
+class PatternDatabase:
+    def __init__(self, layout: SokobanLayout, size: int, table) -> None:
+        self.layout = layout
+        self.size = size
+        self.table = table
+        self.cell_count = len(layout.cells)
+        # binomials[i][j] = C(i, j), used to rank the subsets of cells
+        self.binomials = [[0] * (size + 1) for _ in range(self.cell_count + 1)]
+        for i in range(self.cell_count + 1):
+            self.binomials[i][0] = 1
+            for j in range(1, min(i, size) + 1):
+                self.binomials[i][j] = self.binomials[i - 1][j - 1] + self.binomials[i - 1][j]
+
+    # The rank of a sorted tuple of distinct cell indices in the combinatorial number system
+    def rank(self, cells: Tuple[int, ...]) -> int:
+        return sum(self.binomials[cell][order + 1] for order, cell in enumerate(cells))
+
+    # The number of entries in the table
+    @staticmethod
+    def entry_count(cell_count: int, size: int) -> int:
+        count = 1
+        for index in range(size):
+            count = count * (cell_count - index) // (index + 1)
+        return count * cell_count
+
+    # Returns the number of pushes needed for the given crate cells (sorted indices) when the player is on the given cell
+    # or math.inf if these crates cannot be brought to the goals
+    def lookup(self, cells: Tuple[int, ...], player: int) -> float:
+        value = self.table[self.rank(cells) * self.cell_count + player]
+        return float('inf') if value == Unreachable else value
+
+    # Writes the database to a file (the file is replaced atomically so concurrent readers never see a partial file)
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(struct.pack(HeaderFormat, HeaderMagic, self.size, self.cell_count, layout_fingerprint(self.layout)))
+            f.write(bytes(self.table))
+        os.replace(temporary, path)
+
+    # Maps a database file into memory, returns None if the file does not exist or does not match the layout
+    @staticmethod
+    def load(layout: SokobanLayout, size: int, path: str) -> Optional['PatternDatabase']:
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            # The memory map stays valid after the file is closed
+            memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = struct.calcsize(HeaderFormat)
+        if len(memory) < header_size:
+            return None
+        magic, stored_size, cell_count, fingerprint = struct.unpack_from(HeaderFormat, memory)
+        if magic != HeaderMagic or stored_size != size or cell_count != len(layout.cells) \
+                or fingerprint != layout_fingerprint(layout) \
+                or len(memory) != header_size + PatternDatabase.entry_count(cell_count, size):
+            return None
+        return PatternDatabase(layout, size, memoryview(memory)[header_size:])
+
+    # Builds the database with a retrograde BFS that starts from the goal configurations and pulls the crates backwards
+    '''
+    The abstract states are (crate subset, player region) where the region is represented by its smallest cell index,
+    since the player can walk freely inside it.
+    Pull: if the player stands on cell y of the region with a crate on y + d and the cell y - d is free,
+          then the previous state had the crate on y and the player on y - d, one push away.
+    Every player cell of a region gets the distance of the region.
+    '''
+    @staticmethod
+    def build(layout: SokobanLayout, size: int) -> 'PatternDatabase':
+        neighbors = layout.neighbors
+        cell_count = len(layout.cells)
+        table = bytearray([Unreachable]) * PatternDatabase.entry_count(cell_count, size)
+        database = PatternDatabase(layout, size, table)
+
+        # Returns the cells the player can walk to from the start cell
+        def region(crates: FrozenSet[int], start: int) -> List[int]:
+            reached = {start}
+            frontier = [start]
+            while frontier:
+                cell = frontier.pop()
+                for neighbor in neighbors[cell]:
+                    if neighbor >= 0 and neighbor not in reached and neighbor not in crates:
+                        reached.add(neighbor)
+                        frontier.append(neighbor)
+            return sorted(reached)
+
+        visited = set()
+        frontier = deque()
+        goals = sorted(layout.cell_index[goal] for goal in layout.goals)
+        for crates in itertools.combinations(goals, size):
+            crates = frozenset(crates)
+            for cell in range(cell_count):
+                if cell in crates: continue
+                cells = region(crates, cell)
+                if (crates, cells[0]) in visited: continue
+                visited.add((crates, cells[0]))
+                frontier.append((crates, cells, 0))
+
+        while frontier:
+            crates, cells, distance = frontier.popleft()
+            offset = database.rank(tuple(sorted(crates))) * cell_count
+            for cell in cells:
+                table[offset + cell] = min(distance, Unreachable - 1)
+            for cell in cells:
+                for direction in AllDirections:
+                    crate = neighbors[cell][direction]
+                    if crate < 0 or crate not in crates: continue
+                    player = neighbors[cell][direction.rotate(2)]
+                    if player < 0 or player in crates: continue
+                    previous = (crates - {crate}) | {cell}
+                    previous_cells = region(previous, player)
+                    if (previous, previous_cells[0]) in visited: continue
+                    visited.add((previous, previous_cells[0]))
+                    frontier.append((previous, previous_cells, distance + 1))
+        return database
+
+
+# Returns the path of the database file of the given layout and pattern size
+def pattern_database_path(layout: SokobanLayout, size: int, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or PatternDatabaseDirectory, f"{layout_fingerprint(layout).hex()}-{size}.pdb")
+
+# Loads the database of the layout from the directory, returns None if it was not built yet
+# With build=True, a missing database is built and saved first (which can take a while, see main for the CLI)
+def load_pattern_database(layout: SokobanLayout, size: int = 2, directory: Optional[str] = None, build: bool = False) -> Optional[PatternDatabase]:
+    path = pattern_database_path(layout, size, directory)
+    database = PatternDatabase.load(layout, size, path)
+    if database is None and build:
+        PatternDatabase.build(layout, size).save(path)
+        database = PatternDatabase.load(layout, size, path)
+    return database
+
+
+def main(args: argparse.Namespace):
+    for level in args.levels:
+        layout = SokobanProblem.from_file(level).layout
+        path = pattern_database_path(layout, args.size, args.directory)
+        start = time.time()
+        PatternDatabase.build(layout, args.size).save(path)
+        print(f"{level}: {path} ({os.path.getsize(path)} bytes) built in {time.time() - start} seconds")
+
+if __name__ == "__main__":
+    # Read the arguments from the command line
+    parser = argparse.ArgumentParser(description="Build the pattern databases of Sokoban levels")
+    parser.add_argument("levels", nargs="+", help="paths to the sokoban levels")
+    parser.add_argument("--size", "-s", type=int, default=2, help="the number of crates in each pattern")
+    parser.add_argument("--directory", "-d", default=None, help="the directory where the databases are stored")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+from collections import deque
+
+from mathutils import Direction, Point
+from problem import Problem
+from sokoban import AllDirections, SokobanLayout, SokobanProblem, SokobanState
+from helpers.utils import track_call_count
+
+# This file contains a push-level (macro-move) formulation of the Sokoban problem
+# In the step-level SokobanProblem, one action is one player step, so most of the search is spent walking around.
+# Here, one action is a crate push together with the walk that brings the player behind the crate,
+# and the player location only matters up to the region of cells it can walk to (when only the pushes are counted).
+
+# The push state stores:
+#   crate_mask: the crates as a bitmask over layout.cells (as in SokobanBitboardState)
+#   region: the canonical player cell, which is the minimum cell index the player can walk to
+#           (or the actual player cell if the problem counts the walking, see SokobanPushProblem.count_walking)
+#   player_index: the actual player cell (after the last push, it is the cell the pushed crate came from)
+# Two states with the same crates and the same player region are equal since the player can walk between them,
+# so the actual player cell is not compared nor hashed; it is only used to compute the walks and their costs.
+# The decoded crates are kept on the state (as in SokobanBitboardState), so a state is decoded at most once.
+@dataclass(frozen=True)
+class SokobanPushState:
+    layout: SokobanLayout
+    crate_mask: int
+    region: int
+    player_index: int = field(compare=False)
+
+    @property
+    def player(self) -> Point:
+        return self.layout.cells[self.player_index]
+
+    @property
+    def crates(self) -> FrozenSet[Point]:
+        try:
+            return self.decoded_crates
+        except AttributeError:
+            crates = frozenset(cell for index, cell in enumerate(self.layout.cells) if self.crate_mask >> index & 1)
+            object.__setattr__(self, "decoded_crates", crates)
+            return crates
+
+    # Converts the push state to the regular sokoban state
+    def decode(self) -> SokobanState:
+        return SokobanState(self.layout, self.player, self.crates)
+
+    def __str__(self) -> str:
+        return str(self.decode())
+
+# A push action: walk from the player cell to the cell behind the crate, then push the crate one cell in the direction
+# It is printed in the usual LURD notation: lowercase letters for walking and an uppercase letter for the push
+@dataclass(frozen=True)
+class SokobanPush:
+    crate: int
+    direction: Direction
+    walk: Tuple[Direction, ...]
+
+    def __str__(self) -> str:
+        return ''.join(str(step).lower() for step in self.walk) + str(self.direction)
+
+    # The step-level actions of this push
+    def to_steps(self) -> List[Direction]:
+        return list(self.walk) + [self.direction]
+
+# This is the implementation of the push-level sokoban problem
+class SokobanPushProblem(Problem[SokobanPushState, SokobanPush]):
+    layout: SokobanLayout
+    initial_state: SokobanPushState
+    # If false (the default), every push costs 1 and the optimal solutions minimize the number of pushes.
+    # Merging the states with the same player region is exact then, since walking inside a region is free.
+    # If true, the cost of a push is the number of steps (walking + 1) so the optimal solutions minimize the total steps.
+    # The walking cost depends on where the player stands in its region, so the states are not merged by region
+    # (the region of a state is its actual player cell) and the search space is as large as the step-level one.
+    count_walking: bool = False
+    # Deadlock pruning switches (see SokobanProblem)
+    prune_dead_squares: bool = False
+    prune_freeze_deadlocks: bool = False
+
+    def get_initial_state(self) -> SokobanPushState:
+        return self.initial_state
+
+    def is_goal(self, state: SokobanPushState) -> bool:
+        return state.crate_mask == self.layout.goal_mask
+
+    # Runs a BFS over the cells the player can walk to (without pushing) from the given cell
+    # and returns the parent of each reached cell as (previous cell, direction) (None for the start cell)
+    def walk(self, crates: int, start: int) -> Dict[int, Tuple[int, Direction]]:
+        neighbors = self.layout.neighbors
+        parents = {start: None}
+        frontier = deque([start])
+        while frontier:
+            cell = frontier.popleft()
+            for direction in AllDirections:
+                neighbor = neighbors[cell][direction]
+                if neighbor < 0 or neighbor in parents or crates >> neighbor & 1:
+                    continue
+                parents[neighbor] = (cell, direction)
+                frontier.append(neighbor)
+        return parents
+
+    # We use @track_call_count to track the number of times this function was called to count the number of explored nodes
+    @track_call_count
+    def get_actions(self, state: SokobanPushState) -> Iterable[SokobanPush]:
+        layout = self.layout
+        neighbors, crates = layout.neighbors, state.crate_mask
+        reachable = self.walk(crates, state.player_index)
+        actions = []
+        # Try every crate (in cell order) and every direction
+        for crate in range(len(layout.cells)):
+            if not crates >> crate & 1: continue
+            for direction in AllDirections:
+                # The player must be able to walk behind the crate
+                behind = neighbors[crate][direction.rotate(2)]
+                if behind not in reachable: continue
+                # make sure that the crate is not pushed into a wall or another crate
+                target = neighbors[crate][direction]
+                if target < 0 or crates >> target & 1: continue
+                # make sure that the push does not lead to a deadlock (if enabled)
+                if self.prune_dead_squares and layout.dead_mask >> target & 1: continue
+                if self.prune_freeze_deadlocks:
+                    pushed = crates ^ ((1 << crate) | (1 << target))
+                    if layout.is_freeze_deadlock(target, lambda index: pushed >> index & 1): continue
+                # Rebuild the walk from the player to the cell behind the crate
+                walk = []
+                cell = behind
+                while reachable[cell] is not None:
+                    cell, step = reachable[cell]
+                    walk.append(step)
+                walk.reverse()
+                actions.append(SokobanPush(crate, direction, tuple(walk)))
+        return actions
+
+    def get_successor(self, state: SokobanPushState, action: SokobanPush) -> SokobanPushState:
+        neighbors = self.layout.neighbors
+        crates = state.crate_mask
+        target = neighbors[action.crate][action.direction]
+        if not crates >> action.crate & 1 or target < 0 or crates >> target & 1:
+            # If we try to push a missing crate, or push a crate into a wall or another crate, then this action is wrong
+            raise Exception(f"Invalid action {action} in state:" + "\n" + str(state))
+        crates ^= (1 << action.crate) | (1 << target)
+        # After the push, the player stands where the crate was
+        return self.make_state(crates, action.crate)
+
+    def get_cost(self, state: SokobanPushState, action: SokobanPush) -> float:
+        return len(action.walk) + 1 if self.count_walking else 1
+
+    # Creates a state, computing the canonical cell of the player region (unless the walking is counted)
+    def make_state(self, crates: int, player: int) -> SokobanPushState:
+        region = player if self.count_walking else min(self.walk(crates, player))
+        return SokobanPushState(self.layout, crates, region, player)
+
+    # Expands a push-level solution into the step-level actions of SokobanProblem
+    @staticmethod
+    def to_steps(solution: List[SokobanPush]) -> List[Direction]:
+        return [step for push in solution for step in push.to_steps()]
+
+    # Create the push-level version of a sokoban problem (see count_walking for the choice of the costs)
+    @staticmethod
+    def from_problem(problem: SokobanProblem, count_walking: bool = False) -> 'SokobanPushProblem':
+        push_problem = SokobanPushProblem()
+        push_problem.count_walking = count_walking
+        push_problem.prune_dead_squares = problem.prune_dead_squares
+        push_problem.prune_freeze_deadlocks = problem.prune_freeze_deadlocks
+        push_problem.layout = layout = problem.layout
+        crates = 0
+        for crate in problem.initial_state.crates:
+            crates |= 1 << layout.cell_index[crate]
+        push_problem.initial_state = push_problem.make_state(crates, layout.cell_index[problem.initial_state.player])
+        return push_problem
+
+    # Read a sokoban problem from text containing a grid of tiles
+    @staticmethod
+    def from_text(text: str) -> 'SokobanPushProblem':
+        return SokobanPushProblem.from_problem(SokobanProblem.from_text(text))
+
+    # Read a sokoban problem from file containing a grid of tiles
+    @staticmethod
+    def from_file(path: str) -> 'SokobanPushProblem':
+        with open(path, 'r') as f:
+            return SokobanPushProblem.from_text(f.read())
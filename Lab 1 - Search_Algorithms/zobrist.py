@@ -0,0 +1,18 @@
+from typing import Dict, Hashable, Iterable, TypeVar
+import random
+
+# This file contains the helpers for Zobrist hashing
+# A Zobrist hash gives a random 64-bit key to every (piece, location) pair and hashes a state by XOR-ing
+# the keys of the pieces it contains. Moving a piece only needs two XORs (remove the old key, add the new one),
+# so the hash of a child state can be computed in O(1) from the hash of its parent instead of hashing the whole state.
+
+K = TypeVar("K", bound=Hashable)
+
+# The seed is fixed so that the keys (and thus the hashes stored on the states) are the same in every process
+ZobristSeed = 0x5EED
+
+# Returns a random 64-bit key for each item
+# The keys are drawn in the order of the given items, so the same items in the same order always get the same keys
+def make_zobrist_keys(items: Iterable[K], seed: int = ZobristSeed) -> Dict[K, int]:
+    rng = random.Random(seed)
+    return {item: rng.getrandbits(64) for item in items}